@@ -0,0 +1,100 @@
+"""
+Measures how chunked rendering scales with the number of encoder processes.
+
+    python benchmarks/benchmark_chunked_render.py [--frames 600] [--chunks 1 2 4 8]
+        [--width 1920] [--height 1080] [--codec mpeg4] [--encoder ffmpeg]
+
+Each chunk count renders the same synthetic jpg frames into a video and
+reports the wall-clock time, the speedup over a single process and the
+speedup per process. Timings include decoding the frames and joining
+the chunks, as in a real render.
+"""
+
+import argparse
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from videorender import ChunkedRenderer, ENCODERS, findExecutable
+
+
+def makeFrames(folder, count, width, height):
+    paths = []
+    random = numpy.random.RandomState(0)
+    base = numpy.zeros((height, width, 3), numpy.uint8)
+    base[:] = numpy.linspace(0, 255, width, dtype=numpy.uint8)[None, :, None]
+    for i in range(count):
+        # noise and a moving bar so every frame costs the encoder something
+        image = base + random.randint(0, 32, base.shape, dtype=numpy.uint8)
+        x = (i * 16) % width
+        image[:, x:x + 32] = 255
+        path = os.path.join(folder, 'screen_%05d.jpg' % i)
+        cv2.imwrite(path, image)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--chunks', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--codec', default='mpeg4')
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--encoder', default='ffmpeg', choices=ENCODERS)
+    parser.add_argument('--encoder_path')
+    settings = parser.parse_args()
+
+    encoder_path = findExecutable(settings.encoder_path or settings.encoder)
+    if encoder_path is None:
+        sys.exit("%s not found - set --encoder_path" % settings.encoder)
+
+    folder = tempfile.mkdtemp(prefix='chronolapse_render_')
+    try:
+        framepaths = makeFrames(folder, settings.frames,
+                                    settings.width, settings.height)
+
+        results = {}
+        for chunks in settings.chunks:
+            renderer = ChunkedRenderer(settings.encoder, encoder_path,
+                            settings.codec, settings.fps, chunks=chunks,
+                            min_chunk_frames=1)
+            output_path = os.path.join(folder, 'chunks_%d.avi' % chunks)
+
+            start = time.perf_counter()
+            renderer.render(framepaths, output_path)
+            results[chunks] = time.perf_counter() - start
+
+            os.remove(output_path)
+
+        print("%d frames at %dx%d, %s with %s" % (
+                        settings.frames, settings.width, settings.height,
+                        settings.codec, settings.encoder))
+        print("%s, %d cores" % (platform.platform(), os.cpu_count() or 1))
+
+        baseline = results.get(1)
+        for chunks in settings.chunks:
+            line = "%2d chunks %8.3fs  %6.1f frames/s" % (
+                        chunks, results[chunks],
+                        settings.frames / results[chunks])
+            if baseline is not None:
+                speedup = baseline / results[chunks]
+                line += "  speedup %.2fx  %.2fx per process" % (
+                                                speedup, speedup / chunks)
+            print(line)
+
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
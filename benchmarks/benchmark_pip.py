@@ -0,0 +1,78 @@
+"""
+Compares the PIL and OpenCV picture-in-picture engines on synthetic frames.
+
+    python benchmarks/benchmark_pip.py [--frames 50] [--width 1920] [--height 1080]
+
+Both engines run in a single process so the numbers only reflect the
+per-frame compositing cost.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipcompositor import createPipBatch, PIP_ENGINES
+
+
+def makeFrames(folder, prefix, count, width, height):
+    paths = []
+    random = numpy.random.RandomState(0)
+    for i in range(count):
+        # noisy gradient so the jpeg encoder has real work to do
+        image = numpy.zeros((height, width, 3), numpy.uint8)
+        image[:] = numpy.linspace(0, 255, width, dtype=numpy.uint8)[None, :, None]
+        image += random.randint(0, 32, image.shape, dtype=numpy.uint8)
+        path = os.path.join(folder, '%s%05d.jpg' % (prefix, i))
+        cv2.imwrite(path, image)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--size', default='Small')
+    parser.add_argument('--position', default='Top-Right')
+    settings = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix='chronolapse_pip_')
+    try:
+        sources = makeFrames(folder, 'screen_', settings.frames,
+                                settings.width, settings.height)
+        pips = makeFrames(folder, 'cam_', settings.frames, 1280, 720)
+        pairs = list(zip(sources, pips))
+
+        results = {}
+        for engine in PIP_ENGINES:
+            outfolder = os.path.join(folder, engine)
+            os.mkdir(outfolder)
+
+            start = time.perf_counter()
+            createPipBatch(pairs, outfolder, settings.size,
+                            settings.position, workers=1, engine=engine)
+            results[engine] = time.perf_counter() - start
+
+        print("%d frames at %dx%d" % (
+                        settings.frames, settings.width, settings.height))
+        for engine in PIP_ENGINES:
+            print("%-8s %7.3fs  %6.1f ms/frame" % (
+                        engine, results[engine],
+                        1000 * results[engine] / settings.frames))
+        print("speedup  %.2fx" % (results['pil'] / results['opencv']))
+
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
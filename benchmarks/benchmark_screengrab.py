@@ -0,0 +1,88 @@
+"""
+Compares grab latency of the available screenshot backends.
+
+    python benchmarks/benchmark_screengrab.py [--grabs 50] [--all_screens]
+                                              [--rect X Y WIDTH HEIGHT]
+
+Only the grab itself is timed - encoding and writing happen on the
+capture pipeline's workers. The wx backend needs a running wx.App and is
+timed only when wxPython can be imported.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from screengrab import availableBackends, createGrabber
+
+
+def wxGrabber():
+    """
+    Returns a wx grab function like the one in chronolapse.py, or None.
+    """
+    try:
+        import wx
+        import numpy
+    except ImportError:
+        return None
+
+    app = wx.App(False)
+
+    def grab(rect, all_screens):
+        if rect:
+            rect = wx.Rect(*rect)
+        else:
+            rect = wx.Rect(*wx.Display().GetGeometry())
+
+        bmp = wx.Bitmap(rect.width, rect.height)
+        memDC = wx.MemoryDC(bmp)
+        memDC.Blit(0, 0, rect.width, rect.height,
+                    wx.ScreenDC(), rect.x, rect.y)
+        memDC.SelectObject(wx.NullBitmap)
+
+        array = numpy.empty((rect.height, rect.width, 3), numpy.uint8)
+        bmp.CopyToBuffer(array, wx.BitmapBufferFormat_RGB)
+        return array
+
+    # keep the app alive as long as the function
+    grab.app = app
+    return grab
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--grabs', type=int, default=50)
+    parser.add_argument('--all_screens', action='store_true')
+    parser.add_argument('--rect', type=int, nargs=4)
+    settings = parser.parse_args()
+
+    wx_grabber = wxGrabber()
+
+    for backend in availableBackends(wx_grabber):
+        grabber = createGrabber(backend, wx_grabber)
+        try:
+            # first grab sets up connections and buffers
+            image = grabber.grab(settings.rect, settings.all_screens)
+
+            start = time.perf_counter()
+            for i in range(settings.grabs):
+                grabber.grab(settings.rect, settings.all_screens)
+            elapsed = time.perf_counter() - start
+
+            print("%-4s %5dx%-5d %-4s %7.2f ms/grab" % (
+                        backend, image.shape[1], image.shape[0],
+                        grabber.channel_order,
+                        1000 * elapsed / settings.grabs))
+
+        except Exception as e:
+            print("%-4s failed: %s" % (backend, e))
+
+        finally:
+            grabber.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,357 @@
+"""
+CapturePipeline
+
+Producer/consumer pipeline for Chronolapse captures. The capture timer only
+grabs raw pixels and hands them to the pipeline - a small pool of worker
+threads stamps, encodes and writes them to disk so slow disks or expensive
+encodes never delay the next capture.
+"""
+
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+
+from imagewriter import ImageWriter
+from stampoverlay import StampOverlay
+
+
+def folderMtime(filepath):
+    """
+    Returns st_mtime_ns of the folder holding filepath, or None.
+    """
+    try:
+        return os.stat(os.path.dirname(os.path.abspath(filepath))).st_mtime_ns
+    except OSError:
+        return None
+
+
+class CapturedFrame(object):
+    """
+    Raw pixels for a single capture plus everything needed to write them.
+
+    image is a numpy array in 'rgb', 'bgr' or 'bgra' channel order (OpenCV
+    frames are bgr, mss screen grabs bgra). stamp is the already formatted timestamp text, if any,
+    so the stamp reflects when the frame was grabbed rather than written.
+    stamp_color is (red, green, blue). source ('screen' or 'webcam') and
+    sequence are recorded in the frame catalog once the frame is written.
+
+    The stamp is drawn into image in place unless shared is True, for
+    images that other code still reads, like the webcam session's newest
+    frame. writer is the ImageWriter for the capture source. If store is
+    a FrameStore the encoded frame is appended to it under the name of
+    filepath instead of being written as a file, and stored is set to its
+    StoredFrame. After save, size and encode_time hold the bytes written
+    and the seconds spent encoding.
+    """
+
+    # rendered stamp text is cached across frames
+    overlay = StampOverlay()
+
+    # default encoding options for frames without a writer
+    default_writer = ImageWriter()
+
+    def __init__(self, image, filepath, channel_order='rgb',
+                    stamp=None, stamp_position=(10, 10),
+                    stamp_color=(255, 255, 255), capture_time=None,
+                    source=None, sequence=None, shared=False,
+                    writer=None, store=None):
+        self.image = image
+        self.filepath = filepath
+        self.channel_order = channel_order
+        self.stamp = stamp
+        self.stamp_position = stamp_position
+        self.stamp_color = stamp_color
+        self.capture_time = capture_time or time.time()
+        self.source = source
+        self.sequence = sequence
+        self.shared = shared
+        self.writer = writer or self.default_writer
+        self.store = store
+        self.stored = None
+
+        self.size = None
+        self.encode_time = None
+
+        # (before, after) modification times of the folder around a file
+        # write, so the frame catalog can tell its own writes from others
+        self.folder_mtimes = None
+
+        # set once the pipeline has written or given up on this frame
+        self.finished = threading.Event()
+
+    def save(self):
+        """
+        Draws the stamp, if any, and writes the image to self.filepath.
+        Returns self.filepath.
+        """
+        image = self.image
+        if self.stamp:
+            if self.shared or not image.flags.writeable:
+                image = image.copy()
+            self.overlay.draw(image, self.stamp, self.stamp_position,
+                                self.stamp_color, self.channel_order)
+
+        if self.store is None:
+            self.size, self.encode_time = self.writer.write(
+                                image, self.channel_order, self.filepath)
+
+        else:
+            data, self.encode_time = self.writer.encode(
+                    image, self.channel_order, self.filepath.rsplit('.', 1)[-1])
+            self.stored = self.store.append(
+                    os.path.basename(self.filepath), data, self.capture_time,
+                    self.sequence, image.shape[1], image.shape[0])
+            self.size = len(data)
+        return self.filepath
+
+
+class LinkedFrame(CapturedFrame):
+    """
+    A capture identical to an earlier one. It is saved as a hardlink to
+    the earlier frame's file, or a copy where links are not supported,
+    once that file has been written. In a FrameStore it shares the
+    earlier frame's bytes instead. If the earlier frame was dropped or
+    failed to write, frame is encoded in full, with its own pixels, stamp
+    and writer, so nothing is lost.
+    """
+
+    def __init__(self, frame, target, timeout=30.0):
+        CapturedFrame.__init__(self, frame.image, frame.filepath,
+                    channel_order=frame.channel_order,
+                    stamp=frame.stamp, stamp_position=frame.stamp_position,
+                    stamp_color=frame.stamp_color,
+                    capture_time=frame.capture_time,
+                    source=frame.source, sequence=frame.sequence,
+                    shared=frame.shared, writer=frame.writer,
+                    store=frame.store)
+        self.target = target
+        self.timeout = timeout
+
+    def save(self):
+        target = self.target
+
+        # a different format cannot share the file - encode it again
+        if (os.path.splitext(target.filepath)[1].lower() !=
+            os.path.splitext(self.filepath)[1].lower()):
+            return CapturedFrame.save(self)
+
+        # another worker may still be writing the target
+        if not target.finished.wait(self.timeout):
+            logging.warning("%s was not written in time - writing %s "
+                    "in full" % (target.filepath, self.filepath))
+            return CapturedFrame.save(self)
+
+        if self.store is not None:
+            if target.stored is None or target.store is not self.store:
+                return CapturedFrame.save(self)
+
+            self.stored = self.store.link(os.path.basename(self.filepath),
+                        target.stored, self.capture_time, self.sequence)
+            self.size = target.stored.length
+            return self.filepath
+
+        # the target was dropped or failed to write
+        if not os.path.exists(target.filepath):
+            return CapturedFrame.save(self)
+
+        if os.path.exists(self.filepath):
+            os.remove(self.filepath)
+
+        try:
+            os.link(target.filepath, self.filepath)
+        except (OSError, AttributeError):
+            shutil.copyfile(target.filepath, self.filepath)
+
+        self.size = os.path.getsize(self.filepath)
+        return self.filepath
+
+
+class CapturePipeline(object):
+    """
+    Bounded queue of CapturedFrames drained by a pool of worker threads.
+
+    on_written, if given, is called from the worker thread with each frame
+    after it is written, and on_failed with each frame that was dropped or
+    could not be written.
+
+    When the queue is full the drop_policy decides what happens:
+        'drop_oldest' - discard the oldest queued frame to make room
+        'drop_newest' - discard the incoming frame
+        'block'       - wait up to block_timeout seconds for room, then
+                        discard the incoming frame
+
+    Example:
+        pipeline = CapturePipeline(workers=2, max_queue=8)
+        pipeline.submit(CapturedFrame(image, 'screenshots/screen_1.jpg'))
+        pipeline.stop()
+    """
+
+    DROP_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+    def __init__(self, workers=2, max_queue=8, drop_policy='drop_oldest',
+                    block_timeout=1.0, on_written=None, on_failed=None):
+        if drop_policy not in self.DROP_POLICIES:
+            logging.warning(
+                "Unknown drop policy %s - using drop_oldest" % drop_policy)
+            drop_policy = 'drop_oldest'
+
+        self.workers = max(1, int(workers))
+        self.max_queue = max(1, int(max_queue))
+        self.drop_policy = drop_policy
+        self.block_timeout = block_timeout
+        self.on_written = on_written
+        self.on_failed = on_failed
+
+        self._queue = queue.Queue(self.max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+
+        # counters, see getStats
+        self._stats = {
+            'submitted': 0,
+            'written': 0,
+            'dropped': 0,
+            'failed': 0,
+            'encoded_bytes': 0,
+            'encode_seconds': 0.0,
+        }
+
+    def start(self):
+        """
+        Starts the worker threads if they are not already running.
+        """
+        with self._lock:
+            if self._threads:
+                return
+
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    None, self._work, 'capturepipeline-%d' % i)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, wait=True):
+        """
+        Stops the workers once every queued frame has been written.
+        """
+        with self._lock:
+            threads = self._threads
+            self._threads = []
+
+        # one sentinel per worker - queued after any pending frames
+        for thread in threads:
+            self._queue.put(None)
+
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def isRunning(self):
+        with self._lock:
+            return len(self._threads) > 0
+
+    def submit(self, frame):
+        """
+        Queues a frame for writing. Returns False if a frame was dropped
+        to keep the capture timer from falling behind.
+        """
+        self.start()
+        self._count('submitted')
+
+        try:
+            self._queue.put_nowait(frame)
+            return True
+        except queue.Full:
+            pass
+
+        if self.drop_policy == 'drop_oldest':
+            try:
+                dropped = self._queue.get_nowait()
+                if dropped is None:
+                    # never swallow a stop sentinel
+                    self._queue.put_nowait(dropped)
+                    raise queue.Full
+                self._queue.task_done()
+                self._dropped(dropped)
+                self._queue.put_nowait(frame)
+                return False
+            except (queue.Empty, queue.Full):
+                pass
+
+        elif self.drop_policy == 'block':
+            try:
+                self._queue.put(frame, True, self.block_timeout)
+                return True
+            except queue.Full:
+                pass
+
+        self._dropped(frame)
+        return False
+
+    def getStats(self):
+        """
+        Returns a dict of counters plus the current queue depth.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        return stats
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _dropped(self, frame):
+        self._count('dropped')
+        frame.finished.set()
+        logging.warning("Capture queue full - dropped %s" % frame.filepath)
+        self._failed(frame)
+
+    def _failed(self, frame):
+        if self.on_failed is not None:
+            try:
+                self.on_failed(frame)
+            except Exception as e:
+                logging.error("Failed to handle failed %s: %s" % (
+                                                frame.filepath, repr(e)))
+
+    def _work(self):
+        while True:
+            frame = self._queue.get()
+            try:
+                if frame is None:
+                    return
+
+                before = folderMtime(frame.filepath)
+                frame.save()
+                if frame.stored is None:
+                    frame.folder_mtimes = (before,
+                                            folderMtime(frame.filepath))
+                self._count('written')
+
+                # links are written without encoding
+                if frame.encode_time is not None:
+                    self._count('encoded_bytes', frame.size)
+                    self._count('encode_seconds', frame.encode_time)
+
+                if self.on_written is not None:
+                    try:
+                        self.on_written(frame)
+                    except Exception as e:
+                        logging.error("Failed to record %s: %s" % (
+                                                frame.filepath, repr(e)))
+
+            except Exception as e:
+                self._count('failed')
+                logging.error(
+                    "Failed to write %s: %s" % (frame.filepath, repr(e)))
+                self._failed(frame)
+
+            finally:
+                if frame is not None:
+                    frame.finished.set()
+                self._queue.task_done()
@@ -0,0 +1,137 @@
+"""
+CaptureScheduler
+
+Drift free capture schedule for Chronolapse. Capture deadlines are absolute
+points on the time.monotonic clock, so the time a capture takes never pushes
+later captures back, and intervals do not have to be whole seconds.
+"""
+
+import collections
+import logging
+import time
+
+
+class CaptureScheduler(object):
+    """
+    Tracks the planned time of the next capture and how late each capture
+    actually happened.
+
+    The caller polls due() (or sleeps for delay()) and calls fire() right
+    before capturing. If the caller falls behind by more than one interval
+    missed_policy decides what happens to the missed slots:
+        'skip'    - jump to the next slot in the future, counting the
+                    skipped ones in the stats
+        'catchup' - stay on the original schedule, so the missed slots are
+                    due immediately and fire back to back
+
+    Example:
+        scheduler = CaptureScheduler(1.5)
+        scheduler.start()
+        time.sleep(scheduler.delay())
+        if scheduler.due():
+            scheduler.fire()
+    """
+
+    MISSED_POLICIES = ('skip', 'catchup')
+
+    def __init__(self, interval, missed_policy='skip', history=10000,
+                    clock=time.monotonic):
+        if missed_policy not in self.MISSED_POLICIES:
+            logging.warning(
+                "Unknown missed capture policy %s - using skip"
+                    % missed_policy)
+            missed_policy = 'skip'
+
+        self.interval = float(interval)
+        if self.interval <= 0:
+            raise ValueError("Capture interval must be positive")
+
+        self.missed_policy = missed_policy
+        self.clock = clock
+
+        # (planned, actual, lateness) for the most recent captures
+        self.history = collections.deque(maxlen=history)
+
+        self._next = None
+        self._fired = 0
+        self._skipped = 0
+        self._total_lateness = 0.0
+        self._max_lateness = 0.0
+
+    def start(self, now=None):
+        """
+        Starts the schedule - the first capture is due one interval from now.
+        """
+        if now is None:
+            now = self.clock()
+        self._next = now + self.interval
+
+    def isRunning(self):
+        return self._next is not None
+
+    def stop(self):
+        self._next = None
+
+    def delay(self, now=None):
+        """
+        Returns the seconds until the next capture is due, never negative.
+        """
+        if now is None:
+            now = self.clock()
+        return max(0.0, self._next - now)
+
+    def due(self, now=None):
+        if now is None:
+            now = self.clock()
+        return self._next is not None and now >= self._next
+
+    def progress(self, now=None):
+        """
+        Returns how much of the current interval has passed, from 0 to 1.
+        """
+        if now is None:
+            now = self.clock()
+        return min(1.0, max(0.0, 1 - self.delay(now) / self.interval))
+
+    def fire(self, now=None):
+        """
+        Records a capture happening now and moves to the next slot.
+        Returns how many seconds late the capture is.
+        """
+        if now is None:
+            now = self.clock()
+
+        planned = self._next
+        lateness = max(0.0, now - planned)
+
+        self.history.append((planned, now, lateness))
+        self._fired += 1
+        self._total_lateness += lateness
+        self._max_lateness = max(self._max_lateness, lateness)
+
+        self._next = planned + self.interval
+
+        # the next slot has already passed
+        if self.missed_policy == 'skip' and self._next <= now:
+            missed = int((now - self._next) // self.interval) + 1
+            self._skipped += missed
+            self._next += missed * self.interval
+            logging.warning("Capture fell behind - skipped %d slots" % missed)
+
+        logging.debug("Capture %.3fs late" % lateness)
+        return lateness
+
+    def getStats(self):
+        """
+        Returns a dict summarizing capture lateness.
+        """
+        mean_lateness = 0.0
+        if self._fired:
+            mean_lateness = self._total_lateness / self._fired
+
+        return {
+            'fired': self._fired,
+            'skipped': self._skipped,
+            'mean_lateness': mean_lateness,
+            'max_lateness': self._max_lateness,
+        }
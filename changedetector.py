@@ -0,0 +1,107 @@
+"""
+ChangeDetector
+
+Decides whether a capture differs from the last one that was kept, so
+identical frames of an idle desktop or an empty room can be skipped or
+stored as links to the earlier file. Frames are compared on tiny
+grayscale thumbnails, which costs a fraction of a millisecond next to
+encoding the full frame.
+
+    'mad'   - mean absolute difference of the thumbnails, 0-255
+    'dhash' - number of differing bits between 64 bit difference hashes
+"""
+
+import cv2
+import numpy
+
+DEDUP_METHODS = ('mad', 'dhash')
+
+# thumbnail size for 'mad' comparisons
+SIGNATURE_SIZE = (64, 36)
+
+GRAY_CONVERSIONS = {
+    'rgb': cv2.COLOR_RGB2GRAY,
+    'bgr': cv2.COLOR_BGR2GRAY,
+    'bgra': cv2.COLOR_BGRA2GRAY,
+}
+
+
+class ChangeDetector(object):
+    """
+    Compares captured frames of one stream against the last frame that
+    changed by more than threshold.
+
+    Example:
+        detector = ChangeDetector(threshold=1.0)
+        reference = detector.check(frame)
+        if reference is not None:
+            # frame looks the same as reference
+    """
+
+    def __init__(self, threshold=1.0, method='mad'):
+        if method not in DEDUP_METHODS:
+            method = 'mad'
+
+        self.threshold = threshold
+        self.method = method
+
+        self.reference = None
+        self.reference_signature = None
+
+    def matches(self, threshold, method):
+        return self.threshold == threshold and self.method == method
+
+    def signature(self, image, channel_order='rgb'):
+        """
+        Returns a small grayscale summary of image to compare.
+        """
+        # sample every few pixels first - resizing a 4k frame directly
+        # would read every pixel
+        step = max(1, min(image.shape[0], image.shape[1]) // 256)
+        sample = image[::step, ::step]
+
+        if channel_order in GRAY_CONVERSIONS and sample.ndim == 3:
+            sample = cv2.cvtColor(sample, GRAY_CONVERSIONS[channel_order])
+
+        if self.method == 'dhash':
+            small = cv2.resize(sample, (9, 8), interpolation=cv2.INTER_AREA)
+            return (small[:, 1:] > small[:, :-1]).flatten()
+
+        return cv2.resize(sample, SIGNATURE_SIZE,
+                            interpolation=cv2.INTER_AREA).astype(numpy.int16)
+
+    def difference(self, a, b):
+        if self.method == 'dhash':
+            return int(numpy.count_nonzero(a != b))
+        return float(numpy.mean(numpy.abs(a - b)))
+
+    def check(self, frame):
+        """
+        Returns the reference frame if frame does not differ from it by
+        more than threshold. Otherwise frame becomes the new reference and
+        None is returned.
+        """
+        signature = self.signature(frame.image, frame.channel_order)
+
+        # forget may clear the reference from another thread
+        reference = self.reference
+        reference_signature = self.reference_signature
+
+        if (reference is not None and reference_signature is not None and
+            reference.image.shape == frame.image.shape and
+            self.difference(signature, reference_signature)
+                                                    <= self.threshold):
+            return reference
+
+        self.reference = frame
+        self.reference_signature = signature
+        return None
+
+    def forget(self, frame):
+        """
+        Stops comparing against frame if it is the reference, for frames
+        that were never written. The next frame becomes the reference.
+        """
+        if self.reference is frame:
+            self.reference = None
+            self.reference_signature = None
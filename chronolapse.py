@@ -15,41 +15,39 @@ VERSION = '1.9.0'
 
 import wx
 import wx.adv
-import wx.lib.masked as masked
+import wx.lib.newevent
 import logging
-from easyconfig import EasyConfig
+from chronolapsecore import (ChronolapseEngine, ChronolapseError,
+                                createConfig, addCommonArguments)
+from renderjobs import RenderJob, RenderJobManager
+from screengrab import virtualDesktop
 
 import cv2
 import os, sys, shutil, argparse
-import time, datetime
+import time
 
 import tempfile
 import textwrap
 import numpy  # so pyinstaller packages it
-import math
 import subprocess
 import urllib
 import urllib.request
 
 import threading
-
-from PIL import Image, ImageDraw, ImageFont
+import collections
+import multiprocessing
 
 logging.basicConfig(level=logging.ERROR)
 
-can_check_idle_time = False
-try:
-    import win32api
-    can_check_idle_time = True
-except:
-    pass
-
 from chronolapsegui import *
 
 
 
 ON_WINDOWS = sys.platform.startswith('win')
 
+# posted from the render thread whenever a render job changes
+RenderJobEvent, EVT_RENDER_JOB = wx.lib.newevent.NewEvent()
+
 
 class ChronoFrame(chronoFrame):
 
@@ -79,27 +77,8 @@ class ChronoFrame(chronoFrame):
                     help="Start Chronolapse in the background",
                     action="store_true")
 
-        # configuration file location
-        parser.add_argument("--config_file",
-                help="The location of the Chronolapse configuration file",
-                default="chronolapse.config")
-
-        # sequential image format
-        parser.add_argument('--sequential_image_format',
-                help="Sets the format string for sequential image file names",
-                default='%05d')
-
-        parser.add_argument('--timestamp_filename_format',
-                help="Sets the format string for timestamp image file names",
-                default='%Y-%m-%d_%H-%M-%S')
-
-        # --verbose and --debug
-        parser.add_argument("-v", "--verbose",
-                            help="Increase output verbosity",
-                            action="store_true")
-        parser.add_argument("-d", "--debug",
-                            help="Increase output verbosity to maximum",
-                            action="store_true")
+        # options shared with the command line interface
+        addCommonArguments(parser)
 
         # parse the command line arguments
         self.settings = parser.parse_args()
@@ -172,64 +151,7 @@ class ChronoFrame(chronoFrame):
 
         config_file_path = os.path.abspath(self.settings.config_file)
 
-        self.config = EasyConfig(config_file_path, defaults={
-            'chronolapse': {
-                'frequency': '60',
-
-                'use_screenshot': True,
-                'screenshot_timestamp': True,
-                'screenshot_timestamp_format': '%Y-%m-%d %H:%M:%S',
-                'screenshot_save_folder': 'screenshots',
-                'screenshot_prefix': 'screen_',
-                'screenshot_format': 'jpg',
-                'screenshot_dual_monitor': False,
-		'skip_if_idle': False,
-
-                'screenshot_subsection': False,
-                'screenshot_subsection_top': '0',
-                'screenshot_subsection_left': '0',
-                'screenshot_subsection_width': '800',
-                'screenshot_subsection_height': '600',
-
-                'use_webcam': False,
-                'webcam_timestamp': True,
-                'webcam_timestamp_format': '%Y-%m-%d %H:%M:%S',
-                'webcam_save_folder': 'webcam',
-                'webcam_prefix': 'cam_',
-                'webcam_format': 'jpg',
-                'webcam_timestamp_top': 10,
-                'webcam_timestamp_left': 10,
-                'webcam_timestamp_red': 255,
-                'webcam_timestamp_green': 255,
-                'webcam_timestamp_blue': 255,
-                'webcam_device_number': 0,
-                'webcam_resolution_x': 0,
-                'webcam_resolution_y': 0,
-
-                'filename_format': 'timestamp',
-
-                'pip_main_folder': '',
-                'pip_pip_folder': '',
-                'pip_output_folder': '',
-                'pip_size': 'Small',
-                'pip_position': 'Top-Right',
-                'pip_ignore_unmatched': True,
-
-                'video_source_folder': '',
-                'video_output_folder': '',
-                'video_format': '',
-                'video_codec': 'mpeg4',
-                'video_framerate': '10',
-                'mencoder_path': 'mencoder',
-
-                'audio_source_video': '',
-                'audio_source': '',
-                'audio_output_folder': '',
-
-                'last_update': time.strftime('%Y-%m-%d'),
-                'update_check_frequency': 604800
-            }
-        })
+        self.config = createConfig(config_file_path)
 
         # look for existing config file - load it if possible
         if os.path.exists(self.settings.config_file):
@@ -323,15 +245,17 @@ class ChronoFrame(chronoFrame):
         self.TBFrame = TaskBarFrame(None, self, -1, " ", self.CHRONOLAPSEPATH)
         self.TBFrame.Show(False)
 
-        # webcam
-        self.cam = None
+        # capture, pip and render logic
+        self.engine = ChronolapseEngine(
+                    self.config, self.settings,
+                    screen_grabber=self.grabScreen,
+                    screen_monitors=self.listMonitors)
 
-        # image countdown
-        self.countdown = 60
-        try:
-            self.countdown = float(self.getConfig('frequency', default=60))
-        except ValueError:
-            pass
+        # videos render in the background, one after another
+        self.render_jobs = RenderJobManager(
+                    self.engine, listener=self.renderJobChanged)
+        self.render_dialogs = {}
+        self.Bind(EVT_RENDER_JOB, self.OnRenderJob)
 
         # create timer
         self.timer = Timer(self.timerCallBack)
@@ -351,9 +275,6 @@ class ChronoFrame(chronoFrame):
         # check version
         self.checkVersion()
 
-        # for idle checking (win only)
-        self.last_event_info = None
-
         # load icon - #TODO: embed with base64?
         if ON_WINDOWS:
             icon_file = os.path.join(self.CHRONOLAPSEPATH, 'chronolapse.ico')
@@ -379,6 +300,14 @@ class ChronoFrame(chronoFrame):
             self.Show(*args, **kwargs)
 
     def OnClose(self, event):
+        # stop any renders, release the camera and finish writing
+        # queued captures
+        self.render_jobs.shutdown()
+        self.engine.shutdown()
+
+        # save settings changed in the last moments
+        self.config.flush()
+
         try:
             if hasattr(self, 'TBFrame') and self.TBFrame:
                 self.TBFrame.kill(event)
@@ -387,32 +316,34 @@ class ChronoFrame(chronoFrame):
         event.Skip()
 
     def startTimer(self):
-
-        # set countdown
-        self.countdown = float(self.frequencytext.GetValue())
-
-        # start timer - if frequency < 1 second, use small increments
-        # otherwise, 1 second will be plenty fast
-        if self.countdown < 1:
-            self.timer.Start( self.countdown * 1000)
-        else:
-            self.timer.Start(1000)
+        self.progresspanel.setProgress(0)
+        self.scheduleTimer()
 
     def stopTimer(self):
         self.timer.Stop()
 
+    def scheduleTimer(self):
+        # wake up at the deadline, or every second to move the progress bar
+        delay = min(self.engine.scheduler.delay(), 1.0)
+        self.timer.StartOnce(max(1, int(delay * 1000)))
+
     def timerCallBack(self):
+        scheduler = self.engine.scheduler
+        if scheduler is None:
+            return
 
-        # decrement timer
-        self.countdown -= 1
+        # on deadline
+        if scheduler.due():
+            scheduler.fire()
+            self.capture()      # take screenshot and webcam capture
 
         # adjust progress bar
-        self.progresspanel.setProgress(1- (self.countdown / float(self.frequencytext.GetValue())))
+        self.progresspanel.setProgress(scheduler.progress())
 
-        # on countdown
-        if self.countdown <= 0:
-            self.capture()      # take screenshot and webcam capture
-            self.countdown = float(self.frequencytext.GetValue()) # reset timer
+        self.scheduleTimer()
+
+    def getCaptureInterval(self):
+        return self.engine.getCaptureInterval()
 
     def fileBrowser(self, message, defaultFile=''):
         dlg = wx.FileDialog(self, message, defaultFile=defaultFile,
@@ -453,115 +384,36 @@ class ChronoFrame(chronoFrame):
         dlg.Destroy()
         return path
 
-    def hasBeenIdle(self):
-        if can_check_idle_time:
-            previous_event_info = self.last_event_info
-            event_info = win32api.GetLastInputInfo()
-            self.last_event_info = event_info
-            if previous_event_info == event_info:
-                return True
-        return False
-
-
     def capture(self, force=False):
+        return self.engine.capture(force=force)
 
-        # check if idle if necessary
-        if not force and self.getConfig('skip_if_idle'):
-            if self.hasBeenIdle():
-                logging.debug('Skipping Capture - Idle')
-                return
-
-        # get filename from time
-        if self.getConfig('filename_format') == 'timestamp':
-            filename = time.strftime(
-                                self.settings.timestamp_filename_format)
-
-            # use microseconds if capture speed is less than 1
-            capture_delay = float(self.frequencytext.GetValue())
-            if capture_delay < 1:
-                filename = str( time.time() )
-
-        # get sequential filename
-        else:
-            highest_number = 0
-            if self.getConfig('use_screenshot'):
-                screenshot_file_list = os.listdir(
-                                os.path.abspath(
-                                    self.getConfig('screenshot_save_folder')
-                                )
-                            )
-
-                prefix = self.getConfig('screenshot_prefix')
-                for fname in screenshot_file_list:
-                    base, extension = os.path.splitext(fname)
-                    if base.startswith(prefix):
-                        numeric_base = base[len(prefix):]
-                        try:
-                            highest_number = max(highest_number, int(numeric_base))
-                        except ValueError as e:
-                            # ignore files that are not parsable as numbers
-                            pass
-
-            if self.getConfig('use_webcam'):
-                webcam_file_list = os.listdir(
-                            os.path.abspath(
-                                self.getConfig('webcam_save_folder')
-                            )
-                        )
+    def grabScreen(self, rect=None, all_screens=False):
+        """
+        Screen grabber for the engine - takes a screenshot through wx and
+        returns it as an rgb numpy array.
+        """
+        if rect:
+            rect = wx.Rect(*rect)
+        return self.bitmapToArray(self.takeScreenshot(rect, all_screens))
 
-                prefix = self.getConfig('webcam_prefix')
-                for fname in webcam_file_list:
-                    base, extension = os.path.splitext(fname)
-                    if base.startswith(prefix):
-                        numeric_base = base[len(prefix):]
-                        try:
-                            highest_number = max(highest_number, int(numeric_base))
-                        except ValueError as e:
-                            # ignore files that are not parsable as numbers
-                            pass
-
-            # create sequential filename
-            filename = (self.settings.sequential_image_format %
-                            (highest_number + 1))
-
-        logging.debug('Capturing - ' + filename)
-
-        # if screenshots
-        if self.getConfig('use_screenshot'):
-            # take screenshot
-            self.saveScreenshot(filename)
-
-        # if webcam
-        if self.getConfig('use_webcam'):
-
-            # take webcam shot
-            self.saveWebcam(filename)
-
-        return filename
-
-    def saveScreenshot(self, filename):
-        timestamp = self.getConfig('screenshot_timestamp')
-        folder = self.getConfig('screenshot_save_folder')
-        prefix = self.getConfig('screenshot_prefix')
-        file_format = self.getConfig('screenshot_format')
-
-        rect = None
-        if self.getConfig('screenshot_subsection'):
-            if (self.getConfig('screenshot_subsection_top') > 0 and
-                self.getConfig('screenshot_subsection_left') > 0 and
-                self.getConfig('screenshot_subsection_width') > 0 and
-                self.getConfig('screenshot_subsection_height') > 0):
-                rect = wx.Rect(
-                        int(self.getConfig('screenshot_subsection_top')),
-                        int(self.getConfig('screenshot_subsection_left')),
-                        int(self.getConfig('screenshot_subsection_width')),
-                        int(self.getConfig('screenshot_subsection_height'))
-                    )
+    def listMonitors(self):
+        """
+        Returns the geometry of every display as (x, y, width, height).
+        """
+        return [tuple(wx.Display(i).GetGeometry())
+                    for i in range(wx.Display.GetCount())]
 
-        img = self.takeScreenshot(rect, timestamp)
-        self.saveImage(img, filename, folder, prefix, file_format)
+    def bitmapToArray(self, bmp):
+        """
+        Copies the pixels of a wx.Bitmap into a new rgb numpy array so they
+        can be processed off the GUI thread.
+        """
+        image = numpy.empty(
+                    (bmp.GetHeight(), bmp.GetWidth(), 3), numpy.uint8)
+        bmp.CopyToBuffer(image, wx.BitmapBufferFormat_RGB)
+        return image
 
-    def takeScreenshot(self, rect = None, timestamp=False):
+    def takeScreenshot(self, rect = None, dual_monitor=False):
         """Takes a screenshot of the screen at give pos & size (rect).
         Code from Andrea -
     http://lists.wxwidgets.org/pipermail/wxpython-users/2007-October/069666.html
@@ -576,21 +428,12 @@ class ChronoFrame(chronoFrame):
             rect = wx.Rect(x,y,width,height)
 
             try:
-                # use two monitors if checked and available
-                if (self.getConfig('screenshot_dual_monitor')
-                    and wx.Display_GetCount() > 0):
-                    second = wx.Display(1)
-                    x2, y2, width2, height2 = second.GetGeometry()
-
-                    x3 = min(x,x2)
-                    y3 = min(y, y2)
-                    width3 = max(x+width, x2+width2) - x3
-                    height3 = max(height-y3, height2-y3)
-
-                    rect = wx.Rect(x3, y3, width3, height3)
+                # cover every monitor if checked and available
+                if dual_monitor and wx.Display.GetCount() > 1:
+                    rect = wx.Rect(*virtualDesktop(self.listMonitors()))
             except Exception as e:
-                self.warning(
-                    "Exception while attempting to capture second "
+                logging.error(
+                    "Exception while attempting to capture every "
                     + "monitor: %s" % repr(e))
 
         #Create a DC for the whole screen area
@@ -619,134 +462,21 @@ class ChronoFrame(chronoFrame):
             rect.y          #What's the Y offset in the original DC?
             )
 
-        # write timestamp on image
-        if timestamp:
-            try:
-                stamp = time.strftime(self.getConfig('screenshot_timestamp_format'))
-            except ValueError:
-                logging.error("Invalid screenshot timestamp format")
-                return
-
-            if self.countdown < 1:
-                now = time.time()
-                micro = str(now - math.floor(now))[0:4]
-                stamp = stamp + micro
-
-            memDC.DrawText(stamp, 20, rect.height-30)
-
         #Select the Bitmap out of the memory DC by selecting a new
         #uninitialized Bitmap
         memDC.SelectObject(wx.NullBitmap)
 
         return bmp
 
-    def saveImage(self, bmp, filename, folder, prefix, format='jpg'):
-        # convert
-        img = bmp.ConvertToImage()
-
-        # save
-        if format == 'gif':
-            fileName = os.path.join(folder,"%s%s.gif" % (prefix, filename))
-            img.SaveFile(fileName, wx.BITMAP_TYPE_GIF)
-
-        elif format == 'png':
-            fileName = os.path.join(folder,"%s%s.png" % (prefix, filename))
-            img.SaveFile(fileName, wx.BITMAP_TYPE_PNG)
-
-        else:
-            fileName = os.path.join(folder,"%s%s.jpg" % (prefix, filename))
-            img.SaveFile(fileName, wx.BITMAP_TYPE_JPEG)
-
-    def saveWebcam(self, filename):
-        timestamp = self.getConfig('webcam_timestamp')
-        timestamp_format = self.getConfig('webcam_timestamp_format')
-        folder = self.getConfig('webcam_save_folder')
-        prefix = self.getConfig('webcam_prefix')
-        file_format = self.getConfig('webcam_format')
-
-        self.takeWebcam(
-            filename, folder, prefix, file_format, timestamp, timestamp_format)
-
     def getWebcamCapture(self):
-        # get the device number from config
-        device_number = self.getConfig('webcam_device_number')
-
-        # turn on camera, capture, turn off
-        cam = cv2.VideoCapture(device_number)
-
-        resolution_x = int(self.getConfig('webcam_resolution_x'))
-        resolution_y = int(self.getConfig('webcam_resolution_y'))
-        if resolution_x != 0:
-            cam.set( cv2.CAP_PROP_FRAME_WIDTH, resolution_x )
-        if resolution_y != 0:
-            cam.set( cv2.CAP_PROP_FRAME_HEIGHT, resolution_y )
-
-        # first read from opencv cam seems unreliable
-        result, image = cam.read()
-        result, image = cam.read()
-        cam.release()
-
-        if result:
-            return image
-        return None
+        return self.engine.getWebcamCapture()
 
     def takeWebcam(self,
         filename, folder,
         prefix, file_format='jpg',
         use_timestamp=False, timestamp_format=None):
-
-        # build filepath
-        filepath = os.path.join(
-                    folder,"%s%s.%s" % (prefix, filename, file_format))
-
-        # get image from webcam
-        image = self.getWebcamCapture()
-
-        if image is None:
-            logging.warning("No image returned from camera")
-            return None
-
-        # write timestamp as necessary
-        if use_timestamp:
-
-            # if no format passed in, get from config
-            if timestamp_format is None:
-                timestamp_format = self.getConfig('webcam_timestamp_format')
-
-            # build timestamp
-            stamp = None
-            try:
-                stamp = time.strftime(timestamp_format)
-            except ValueError:
-                logging.error("Invalid timestamp format")
-
-            if stamp:
-
-                logging.debug("Writing timestamp %s" % stamp)
-
-                top = self.getConfig('webcam_timestamp_top')
-                left = self.getConfig('webcam_timestamp_left')
-
-                # convert to pil image
-                converted = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-                pil_image = Image.fromarray(converted)
-                r,g,b = (self.getConfig('webcam_timestamp_red'),
-                            self.getConfig('webcam_timestamp_green'),
-                            self.getConfig('webcam_timestamp_blue'))
-                draw = ImageDraw.Draw(pil_image)
-                #font = ImageFont.truetype("sans-serif.ttf", 16)
-                font = ImageFont.load_default()
-                #draw.text((0, 0), stamp, (255,255,255), font=font)
-                draw.text( (top, left), stamp, fill=(255,255,255), font=font)
-                pil_image.save(filepath)
-
-        else:
-            logging.debug("Not writing timestamp")
-
-            # write file
-            cv2.imwrite(filepath, image)
-
-        return filepath
+        return self.engine.takeWebcam(filename, folder, prefix, file_format,
+                                        use_timestamp, timestamp_format)
 
     def showWarning(self, title, message):
         dlg = wx.MessageDialog(self, message, title, wx.OK | wx.ICON_ERROR)
@@ -845,32 +575,12 @@ class ChronoFrame(chronoFrame):
 
         if text == 'Start Capture':
 
-            use_screenshot = self.getConfig('use_screenshot')
-            screenshot_folder = os.path.abspath(
-                                    self.getConfig('screenshot_save_folder')
-                                )
-
-            use_webcam = self.getConfig('use_webcam')
-            webcam_folder = os.path.abspath(
-                                    self.getConfig('webcam_save_folder')
-                                )
-
-            # check that screenshot and webcam folders are available
-            if use_screenshot:
-
-                # check screenshot save folder
-                if not os.access(screenshot_folder, os.W_OK):
-                    self.showWarning('Cannot Write to Screenshot Folder',
-                    ("""Error: Cannot write to screenshot folder %s.
-Please add write permission and try again.""") % screenshot_folder)
-                    return False
-
-            if use_webcam:
-                if not os.access(webcam_folder, os.W_OK):
-                    self.showWarning('Cannot Write to Webcam Folder',
-                        ("""Error: Cannot write to webcam folder %s.
-Please add write permission and try again.""") % webcam_folder)
-                    return False
+            # check folders, open the camera and start the schedule
+            try:
+                self.engine.startCapture()
+            except ChronolapseError as e:
+                self.showWarning(e.title, e.message)
+                return False
 
             # disable config buttons, frequency
             self.screenshotcheck.Disable()
@@ -886,7 +596,7 @@ Please add write permission and try again.""") % webcam_folder)
             self.startbutton.SetLabel('Stop Capture')
 
             # start timer
-            if float(self.getConfig('frequency')) > 0:
+            if self.engine.scheduler is not None:
                 self.startTimer()
 
         elif text == 'Stop Capture':
@@ -907,6 +617,9 @@ Please add write permission and try again.""") % webcam_folder)
             # stop timer
             self.stopTimer()
 
+            # release the camera and finish writing queued captures
+            self.engine.stopCapture()
+
     def forceCapturePressed(self, event):
         # save a capture right now
         self.capture(force=True)
@@ -939,13 +652,6 @@ Please add write permission and try again.""") % webcam_folder)
 
     def createPipPressed(self, event): # wxGlade: chronoFrame.<event_handler>
 
-        # make sure output file is writable
-        if not os.access( self.pipoutputimagefoldertext.GetValue(), os.W_OK):
-            self.showWarning('Permission Error',
-            'Error: Output file is not writable. Please check your ' +
-            ' permissions and try again.')
-            return False
-
         # get pip settings
         sourcefolder = self.pipmainimagefoldertext.GetValue()
         pipfolder = self.pippipimagefoldertext.GetValue()
@@ -955,121 +661,33 @@ Please add write permission and try again.""") % webcam_folder)
         pipsizestring = self.pipsizecombo.GetStringSelection()
         pippositionstring = self.pippositioncombo.GetStringSelection()
 
-        # sort files - match up by sorting so prefixes work
-        sourcefiles = os.listdir(sourcefolder)
-        sourcefiles.sort()
-        pipfiles = os.listdir(pipfolder)
-        pipfiles.sort()
-
-        logging.debug('Creating PIP')
+        # progress dialog - created once the number of images is known
+        dialogs = []
 
-        # progress dialog
-        progressdialog = wx.ProgressDialog(
+        def progress(count, total, sourcefile):
+            if not dialogs:
+                dialogs.append(wx.ProgressDialog(
                         'PIP Progress',
                         'Processing Images',
-                        maximum=len(sourcefiles),
+                        maximum=max(1, total),
                         parent=self,
                         style =
                             wx.PD_CAN_ABORT | wx.PD_APP_MODAL |
-                             wx.PD_ELAPSED_TIME | wx.PD_REMAINING_TIME)
-
-        # for all images in main folder
-        count = 0
-        for i in xrange( min(len(sourcefiles), len(pipfiles))):
-            sourcefile = sourcefiles[i]
-            pipfile = pipfiles[i]
+                             wx.PD_ELAPSED_TIME | wx.PD_REMAINING_TIME))
 
-            # update progress dialog
-            count += 1
-            cancel, somethingelse = progressdialog.Update(
+            keep_going, skip = dialogs[0].Update(
                                             count, 'Processing %s'%sourcefile)
-            # update progress dialog
-            if not cancel:
-                progressdialog.Destroy()
-                break
+            return keep_going
 
-            try:
-                # open with PIL -- will skip non-images
-                source = Image.open(os.path.join(sourcefolder, sourcefile))
-                pip = Image.open(os.path.join(pipfolder, pipfile))
-
-                # get pip size - sides
-                if pippositionstring == 'Left' or pippositionstring == 'Right':
-                    if pipsizestring == 'Small':
-                        pipsize = ( source.size[0] / 4, source.size[1])
-                    elif pipsizestring == 'Medium':
-                        pipsize = ( source.size[0] / 3, source.size[1])
-                    else:
-                        pipsize = ( source.size[0] / 2, source.size[1])
-
-                # get pip size - top/bottom
-                elif pippositionstring == 'Top' or pippositionstring == 'Bottom':
-                    if pipsizestring == 'Small':
-                        pipsize = ( source.size[0], source.size[1] / 4)
-                    elif pipsizestring == 'Medium':
-                        pipsize = ( source.size[0], source.size[1] / 3)
-                    else:
-                        pipsize = ( source.size[0], source.size[1] / 2)
-
-                # get pip size - corners
-                else:
-                    if pipsizestring == 'Small':
-                        pipsize = ( source.size[0] / 4, source.size[1] / 4)
-                    elif pipsizestring == 'Medium':
-                        pipsize = ( source.size[0] / 3, source.size[1] / 3)
-                    else:
-                        pipsize = ( source.size[0] / 2, source.size[1] / 2)
-
-                # resize pip
-                pip.thumbnail(pipsize)
-
-                # paste on main - left
-                if pippositionstring == 'Left':
-                    source.paste(pip, (0,0))
-
-                # paste on main - Right
-                elif pippositionstring == 'Right':
-                    source.paste(pip, ( source.size[0]-pip.size[0], 0))
-
-                # paste on main - top
-                elif pippositionstring == 'Top':
-                    source.paste(pip, (0,0))
-
-                # paste on main - bottom
-                elif pippositionstring == 'Bottom':
-                    source.paste(pip, (0, source.size[1]-pip.size[1]))
-
-                # paste on main - top right
-                elif pippositionstring == 'Top-Right':
-                    source.paste(pip, ( source.size[0]-pip.size[0], 0))
-
-                # paste on main - bottom right
-                elif pippositionstring == 'Bottom-Right':
-                    source.paste(
-                        pip,
-                        (source.size[0]-pip.size[0], source.size[1]-pip.size[1])
-                    )
-
-                # paste on main - bottom left
-                elif pippositionstring == 'Bottom-Left':
-                    source.paste(pip, (0, source.size[1]-pip.size[1]))
-
-                # paste on main - top left
-                elif pippositionstring == 'Top-Left':
-                    source.paste(pip, (0, 0))
-
-                # save in destination
-                outpath = os.path.join( outfolder, sourcefiles[i])
-                source.save( outpath)
-
-                # modify creation time to match source file
-                ctime = os.path.getctime(os.path.join(sourcefolder, sourcefile))
-                os.utime(outpath, (ctime, ctime))
-
-            except Exception as e:
-                pass
-
-        progressdialog.Destroy()
+        try:
+            self.engine.createPip(sourcefolder, pipfolder, outfolder,
+                    pipsizestring, pippositionstring, progress=progress)
+        except ChronolapseError as e:
+            self.showWarning(e.title, e.message)
+            return False
+        finally:
+            for dialog in dialogs:
+                dialog.Destroy()
 
     def videoSourceBrowsePressed(self, event):
         path = self.dirBrowser(
@@ -1105,27 +723,13 @@ Please add write permission and try again.""") % webcam_folder)
 
         sourcepath = self.getConfig('video_source_folder')
 
-        seconds = 0
-        if sourcepath:
-            numfiles = 0
-            # get number of files in source dir
-            for f in os.listdir(sourcepath):
-                if os.path.isfile(os.path.join(sourcepath,f)):
-                    numfiles += 1
-
-            # framerate
-            try:
-                framerate = int(self.videoframeratetext.GetValue())
-            except ValueError:
-                framerate = 0
-
-            if numfiles == 0 or framerate == 0:
-                self.movielengthlabel.SetLabel(
-                                            "Estimated Movie Length: 0 m 0 s")
-                return
+        # framerate
+        try:
+            framerate = int(self.videoframeratetext.GetValue())
+        except ValueError:
+            framerate = 0
 
-            # divide by frames/second to get seconds
-            seconds = numfiles/framerate
+        seconds = self.engine.estimateVideoLength(sourcepath, framerate)
 
         minutes = seconds//60
         seconds = seconds%60
@@ -1148,232 +752,76 @@ Please add write permission and try again.""") % webcam_folder)
         dlg.Destroy()
 
     def createVideoPressed(self, event):
-        # check that paths are valid
         sourcefolder = self.videosourcetext.GetValue()
         destfolder = self.videodestinationtext.GetValue()
-
-        if not os.path.isdir(sourcefolder):
-            self.showWarning('Source folder invalid',
-                            'The video source folder is invalid')
-            return False
-
-        # check that destination folder exists and is writable
-        if not os.access( destfolder, os.W_OK):
-            self.showWarning(
-                'Permission Denied',
-                ('The output folder %s is not writable. Please change the ' +
-                'permissions and try again.') % destfolder
-            )
-            return False
+        codec = self.videocodeccombo.GetStringSelection()
+        fps = self.videoframeratetext.GetValue()
 
         # check mencoder path
         mencoderpath = self.mencoderpathtext.GetValue()
-        if mencoderpath == 'mencoder':
+        if (mencoderpath == 'mencoder' and
+            self.getConfig('video_encoder') == 'mencoder'):
             self.showWarning(
                 'MEncoder path not set',
                 'Chronolapse uses MEncoder to process video. Either point to ' +
                 'MEncoder directly or ensure it is on your path.'
             )
 
-        elif not os.path.isfile(mencoderpath):
-            # look for mencoder
-            if not os.path.isfile(
-                            os.path.join(self.CHRONOLAPSEPATH, 'mencoder')):
-                self.showWarning(
-                    'MEncoder Not Found',
-                    'Chronolapse uses MEncoder to process video, but could ' +
-                    'not find mencoder'
-                )
-                return False
-            elif ON_WINDOWS:
-                mencoderpath = os.path.join(self.CHRONOLAPSEPATH, 'mencoder')
-
-        fps = self.videoframeratetext.GetValue()
-        try:
-            fps = int(fps)
-        except:
-            self.showWarning(
-                'Frame Rate Invalid',
-                'The frame rate setting is invalid. Frame rate must be ' +
-                'a positive integer'
-            )
-            return False
-
-
-        # get dimensions of first image file
-        found = False
-        count = 0
-        sourcefiles = os.listdir(sourcefolder)
-        while not found and count < len(sourcefiles):
-            count += 1
-            try:
-                imagepath = os.path.join(sourcefolder, sourcefiles[count])
-                img = Image.open(imagepath)
-                found = True
-                width, height = img.size
-
-                imagepath = imagepath.lower()
-                if imagepath.endswith(('.gif')):
-                    imagetype = 'gif'
-                    path = '*.gif'
-                elif imagepath.endswith('.png'):
-                    imagetype = 'png'
-                    path = '*.png'
-                else:
-                    imagetype = 'jpg'
-
-                    index = imagepath.rfind('.')
-                    if index > 0:
-                        path = '*.%s'%imagepath[index+1:]
-                    else:
-                        path = '*.jpg'
-
-                #path = os.path.join(sourcefolder, path)
-
-            except:
-                pass
-
-        if not found:
-            self.showWarning(
-                'No Images Found',
-                'No images were found in the source folder %s' % sourcefolder
-            )
-            return False
-
-        # get video type from select box
-        #format = '-of %s' % self.videoformatcombo.GetStringSelection()
-
-        # get codec from select box
-        codec = self.videocodeccombo.GetStringSelection()
-
-        # get output file name --- create in source folder then
-        # move because of ANOTHER mencoder bug
-        timestamp = time.strftime('%Y-%m-%d_%H-%M-%S')
-        out_extension = 'avi'
-
-        output_filename = os.path.join(
-                                destfolder,
-                                'timelapse_%s.%s' % (timestamp, out_extension)
-                            )
-        source_filename = os.path.join(
-                                sourcefolder,
-                                'timelapse_%s.%s' % (timestamp, out_extension)
-                            )
-
-        # if either file already exists
-        count = 1
-        while(
-            os.path.isfile(output_filename)
-            or os.path.isfile(source_filename)):
-
-            count += 1
-            output_filename = os.path.join(
-                    destfolder,
-                    'timelapse_%s_%d.%s' % (timestamp, count, out_extension)
-                )
-            source_filename = os.path.join(
-                    destfolder,
-                    'timelapse_%s_%d.%s' % (timestamp, count, out_extension)
+        # renders run in the background so the window stays responsive
+        self.render_jobs.submit(
+                    sourcefolder, destfolder, fps, codec, mencoderpath)
+
+    def renderJobChanged(self, job):
+        # called on the render thread - hand over to the GUI thread
+        wx.PostEvent(self, RenderJobEvent(job=job))
+
+    def OnRenderJob(self, event):
+        job = event.job
+        dialog = self.render_dialogs.get(job)
+
+        if job.isFinished():
+            if dialog is not None:
+                dialog.Destroy()
+                del self.render_dialogs[job]
+
+            if job.state == RenderJob.DONE:
+                dlg = wx.MessageDialog(
+                    self,
+                    'Encoding Complete!\nFile saved as %s'
+                        % job.output_filename,
+                    'Encoding Complete',
+                    style=wx.OK
                 )
+                dlg.ShowModal()
+                dlg.Destroy()
 
-        # change cwd to image folder to stop mencoder bug
-        try:
-            os.chdir(sourcefolder)
-        except Exception as e:
-            self.showWarning(
-                'CWD Error',
-                "Could not change current directory. %s" % str(e)
-            )
-            return False
-
-        # create progress dialog
-        progressdialog = wx.ProgressDialog(
-                                'Encoding Progress', 'Encoding - Please Wait')
-        progressdialog.Pulse('Encoding - Please Wait')
-
-        # run mencoder with options from GUI
-##         mf://%s -mf w=%d:h=%d:fps=%s:type=%s -ovc lavc -lavcopts vcodec=%s:mbd=2:trell %s -oac copy -o %s' % (
-##        path, width, height, fps, imagetype, codec, format, outfile ))
-        # http://web.njit.edu/all_topics/Prog_Lang_Docs/html/mplayer/encoding.html
-
-##        if codec == 'uncompressed':
-##            command = '"%s" mf://%s -mf fps=%s -ovc rawrgb -o %s' % (
-##                    mencoderpath, path, fps, outfile )
-##            command = '"%s" mf://fps=%s:type=png  -ovc rawrgb -o %s \*.png' % (mencoderpath, fps, outfile)
-##        else:
-
-        if codec == 'h264':
-            command = ('"%s" mf://%s -mf fps=%s -ovc x264 -o "%s"'
-                            % (mencoderpath, path, fps, output_filename))
-        else:
-            command = ('"%s" mf://%s -mf fps=%s -ovc lavc -lavcopts vcodec=%s -o "%s"'
-                            % (mencoderpath, path, fps, codec, output_filename))
-
-        logging.debug("Calling: %s"%command)
-
-        self.returncode = None
-        self.mencodererror = 'Unknown'
-        mencoderthread = threading.Thread(
-                None, self.runMencoderInThread, 'mencoderthread', (command,))
-        mencoderthread.start()
-
-        while self.returncode is None:
-            time.sleep(.5)
-            progressdialog.Pulse()
-
-        # mencoder error
-        if self.returncode > 0:
-            progressdialog.Destroy()
+            elif job.state == RenderJob.FAILED:
+                self.showWarning(job.error.title, job.error.message)
 
-            self.showWarning(
-                    'MEncoder Error',
-                    "Error while encoding video. Check the MEncoder console " +
-                    "or try a different codec"
-            )
             return
 
-        # move video file to destination folder
-        logging.debug("Moving file from %s to %s" % (
-                            os.path.join(sourcefolder, output_filename),
-                            os.path.join(destfolder, output_filename))
-                    )
-        shutil.move(
-            os.path.join(sourcefolder, output_filename),
-            os.path.join(destfolder, output_filename)
-        )
-
-        progressdialog.Destroy()
-
-        dlg = wx.MessageDialog(
-            self,
-            'Encoding Complete!\nFile saved as %s' %
-                            os.path.join(destfolder, output_filename),
-            'Encoding Complete',
-            style=wx.OK
-        )
-        dlg.ShowModal()
-        dlg.Destroy()
+        # queued jobs get a dialog once they start and know their length
+        if job.state != RenderJob.RUNNING or not job.total:
+            return
 
-    def runMencoderInThread(self, command):
-        #proc = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+        if dialog is None:
+            queued = len(self.render_jobs.pending()) - 1
+            title = 'Encoding Progress'
+            if queued:
+                title = 'Encoding Progress (%d more queued)' % queued
 
-        logging.debug('Running mencoder in thread')
-        #proc = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-  #      mencoder mf://*.jpg -mf w=800:h=600:fps=25:type=jpg -ovc lavc -lavcopts vcodec=mpeg4:mbd=2:trell -oac copy -o output.avi
+            dialog = wx.ProgressDialog(
+                        title,
+                        'Encoding - Please Wait',
+                        maximum=job.total,
+                        parent=self,
+                        style=wx.PD_CAN_ABORT | wx.PD_ELAPSED_TIME)
+            self.render_dialogs[job] = dialog
 
-        try:
-            if ON_WINDOWS:
-                proc = subprocess.Popen(command, close_fds=True)
-            else:
-                proc = subprocess.Popen(command, close_fds=True, shell=True,
-                                stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-
-            stdout, stderr = proc.communicate()
-            self.mencodererror = stderr
-            self.returncode = proc.returncode
-        except Exception as e:
-            self.mencodererror = repr(e)
-            self.returncode = 1
+        keep_going, skip = dialog.Update(
+                        min(job.frames_done, job.total), job.statusText())
+        if not keep_going:
+            self.render_jobs.cancel(job)
 
     def audioSourceVideoBrowsePressed(self, event):
         path = self.fileBrowser('Select video source',
@@ -1792,62 +1240,98 @@ class WebcamConfigDialog(webcamConfigDialog):
 
     def testWebcamPressed(self, event):
         if self.has_cam:
-            self.temppath = tempfile.mkstemp('.jpg')[1]
-            self.temppath = self.temppath[:-4]
-            # takeWebcam automatically appends the extension again
-
-            # create a popup with the image
+            # create a popup with the live camera
             dlg = WebcamPreviewDialog(self)
             dlg.ShowModal()
+            dlg.close()
             dlg.Destroy()
 
-            # remove the temp file
-            try:
-                os.unlink(self.temppath + '.jpg')
-            except Exception as e:
-                logging.warning(
-                "Failed to delete temp file %s: %s" % (self.temppath, repr(e)))
-
 
 class WebcamPreviewDialog(webcamPreviewDialog):
+    """
+    Shows the shared webcam session's frames as the camera delivers them.
+    A background thread waits for each new frame and converts it to RGB -
+    the only copy before wx.Bitmap.FromBuffer - and frames arriving while
+    the GUI is still drawing the last one are skipped.
+    """
 
     def __init__(self, *args, **kwargs):
         webcamPreviewDialog.__init__(self, *args, **kwargs)
         self.parent = self.GetParent().GetParent()
-        self.timer = Timer(self.callback)
-        self.timer.Start(250)
+        self.session = self.parent.engine.getWebcamSession()
+
+        # times the last frames were shown, for the fps counter
+        self.shown_times = collections.deque(maxlen=30)
+        self.drawing = False
 
-        self.temppath = self.GetParent().temppath
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+                            None, self.previewLoop, 'webcampreview')
+        self.thread.daemon = True
+        self.thread.start()
 
         self.previewokbutton.Bind(wx.EVT_BUTTON, self.close)
 
     def close(self, event=None):
-        self.timer.Stop()
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
         self.previewbitmap.SetBitmap(wx.NullBitmap)
-        del self.timer
         if event:
             event.Skip()
 
-    def callback(self):
-        try:
-            path = self.parent.takeWebcam(
-                        os.path.basename(self.temppath),
-                        os.path.dirname(self.temppath),
-                        ''
-                    )
+    def previewLoop(self):
+        number = 0
+        while not self.stopped.is_set():
+            frame, number = self.session.waitForFrame(number, 1.0)
+
+            if frame is None:
+                # camera failed or is reopening - do not spin
+                self.stopped.wait(.5)
+                continue
+
+            if self.drawing:
+                continue
 
-            # try this so WX doesnt freak out if the file isnt a bitmap
-            pilimage = Image.open(path)
-            myWxImage = wx.Image( pilimage.size[0], pilimage.size[1] )
-            myWxImage.SetData( pilimage.convert( 'RGB' ).tobytes() )
-            bitmap = myWxImage.ConvertToBitmap()
+            try:
+                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            except cv2.error as e:
+                logging.debug(
+                    "Exception while showing camera preview: %s" % repr(e))
+                continue
+
+            self.drawing = True
+            wx.CallAfter(self.showFrame, rgb)
 
+    def showFrame(self, rgb):
+        # the dialog may be gone by the time this runs
+        if not self or self.stopped.is_set():
+            return
+        self.drawing = False
+
+        try:
+            bitmap = wx.Bitmap.FromBuffer(rgb.shape[1], rgb.shape[0], rgb)
             self.previewbitmap.SetBitmap(bitmap)
             self.previewbitmap.CenterOnParent()
 
         except Exception as e:
             logging.debug(
                     "Exception while showing camera preview: %s" % repr(e))
+            return
+
+        self.shown_times.append(time.time())
+        self.SetTitle(self.frameRateText())
+
+    def frameRateText(self):
+        shown = 0
+        if len(self.shown_times) > 1:
+            elapsed = self.shown_times[-1] - self.shown_times[0]
+            if elapsed > 0:
+                shown = (len(self.shown_times) - 1) / elapsed
+
+        camera = self.session.getFrameRate() or 0
+        return "Webcam Preview - %.1f fps (camera %.1f fps)" % (
+                                                            shown, camera)
 
 
 class Timer(wx.Timer):
@@ -2005,6 +1489,9 @@ class TaskBarFrame(wx.Frame):
 
 # run it!
 if __name__ == "__main__":
+    # pip compositing uses worker processes - needed for frozen builds
+    multiprocessing.freeze_support()
+
     app = wx.App(0)
     chronoframe = ChronoFrame(None, -1, "")
     app.SetTopWindow(chronoframe)
@@ -0,0 +1,217 @@
+"""
+    chronolapsecli.py
+    @summary:
+        Headless command line interface for Chronolapse. Runs captures,
+        picture-in-picture and video rendering through ChronolapseEngine
+        without loading wx, so it works on servers and in containers.
+
+        python chronolapsecli.py capture [--count N]
+        python chronolapsecli.py pip
+        python chronolapsecli.py render
+        python chronolapsecli.py catalog [FOLDER ...]
+        python chronolapsecli.py export SOURCE DEST
+    @license: MIT license
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+
+from chronolapsecore import (ChronolapseEngine, ChronolapseError,
+                                createConfig, addCommonArguments)
+
+
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(
+                description="Chronolapse without the user interface")
+    addCommonArguments(parser)
+
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    # capture
+    capture_parser = subparsers.add_parser('capture',
+                help="Capture screenshots and/or webcam images on a schedule")
+    capture_parser.add_argument('--frequency', type=float,
+                help="Seconds between captures")
+    capture_parser.add_argument('--count', type=int,
+                help="Stop after this many captures")
+    capture_parser.add_argument('--once', action='store_true',
+                help="Take a single capture right now and exit")
+    capture_parser.add_argument('--screenshot_save_folder')
+    capture_parser.add_argument('--webcam_save_folder')
+    capture_parser.add_argument('--no_screenshot', action='store_true',
+                help="Disable screenshots")
+    capture_parser.add_argument('--webcam', action='store_true',
+                help="Enable webcam captures")
+
+    # pip
+    pip_parser = subparsers.add_parser('pip',
+                help="Create picture-in-picture images")
+    pip_parser.add_argument('--pip_main_folder')
+    pip_parser.add_argument('--pip_pip_folder')
+    pip_parser.add_argument('--pip_output_folder')
+    pip_parser.add_argument('--pip_size',
+                choices=['Small', 'Medium', 'Large'])
+    pip_parser.add_argument('--pip_position',
+                choices=['Top-Right', 'Top-Left', 'Bottom-Right',
+                    'Bottom-Left', 'Top', 'Bottom', 'Left', 'Right'])
+
+    # render
+    render_parser = subparsers.add_parser('render',
+                help="Render images into a video")
+    render_parser.add_argument('--video_source_folder')
+    render_parser.add_argument('--video_output_folder')
+    render_parser.add_argument('--video_framerate')
+    render_parser.add_argument('--video_codec')
+    render_parser.add_argument('--mencoder_path')
+    render_parser.add_argument('--ffmpeg_path')
+    render_parser.add_argument('--video_encoder',
+                choices=['auto', 'ffmpeg', 'mencoder'])
+    render_parser.add_argument('--video_frame_selection',
+                choices=['all', 'every', 'duration', 'interval'],
+                help="Which frames to render")
+    render_parser.add_argument('--video_frame_step', type=int,
+                help="Render every Nth frame with "
+                     "--video_frame_selection every")
+    render_parser.add_argument('--video_target_duration', type=float,
+                help="Video length in seconds with "
+                     "--video_frame_selection duration")
+    render_parser.add_argument('--video_sample_interval', type=float,
+                help="Seconds of capture time between rendered frames with "
+                     "--video_frame_selection interval")
+    render_parser.add_argument('--video_render_mode',
+                choices=['full', 'incremental'],
+                help="Render a new video, or append the frames captured "
+                     "since the last render to the folder's video")
+    render_parser.add_argument('--video_render_chunks', type=int,
+                help="Encode this many ranges of the frames at once - "
+                     "0 uses every core")
+
+    # catalog
+    catalog_parser = subparsers.add_parser('catalog',
+                help="Rebuild the frame catalog from the images on disk")
+    catalog_parser.add_argument('folders', nargs='*',
+                help="Folders to rescan - defaults to the capture folders")
+
+    # export
+    export_parser = subparsers.add_parser('export',
+                help="Write the frames in a frame store out as image files")
+    export_parser.add_argument('source',
+                help="Capture folder holding the frame store")
+    export_parser.add_argument('destination',
+                help="Folder to write the images to")
+
+    return parser.parse_args(argv)
+
+
+def configOverrides(settings):
+    """
+    Returns the config values given on the command line. These apply to
+    this run only and are never written to the config file.
+    """
+    overrides = {}
+    for key in ['screenshot_save_folder', 'webcam_save_folder',
+                'pip_main_folder', 'pip_pip_folder', 'pip_output_folder',
+                'pip_size', 'pip_position',
+                'video_source_folder', 'video_output_folder',
+                'video_framerate', 'video_codec', 'mencoder_path',
+                'ffmpeg_path', 'video_encoder', 'video_frame_selection',
+                'video_frame_step', 'video_target_duration',
+                'video_sample_interval', 'video_render_mode',
+                'video_render_chunks']:
+        value = getattr(settings, key, None)
+        if value is not None:
+            overrides[key] = value
+
+    if getattr(settings, 'frequency', None) is not None:
+        overrides['frequency'] = str(settings.frequency)
+    if getattr(settings, 'no_screenshot', False):
+        overrides['use_screenshot'] = False
+    if getattr(settings, 'webcam', False):
+        overrides['use_webcam'] = True
+
+    return overrides
+
+
+def main(argv=None):
+    settings = parseArguments(argv)
+
+    level = logging.WARNING
+    if settings.debug:
+        level = logging.DEBUG
+    elif settings.verbose:
+        level = logging.INFO
+    logging.basicConfig(level=level)
+
+    config = createConfig(settings.config_file)
+    if os.path.exists(settings.config_file):
+        try:
+            config.load()
+            logging.debug("Loaded config")
+        except IOError as e:
+            logging.error("Failed to load Config File: %s" % str(e))
+            return 1
+
+    config.updateBatch('chronolapse', configOverrides(settings),
+                        notify=False, persist=False)
+
+    engine = ChronolapseEngine(config, settings)
+    get = engine.getConfig
+
+    try:
+        if settings.command == 'capture':
+            if settings.once:
+                engine.checkCaptureFolders()
+                filename = engine.capture(force=True)
+                engine.shutdown()
+                print("Captured %s" % filename)
+            else:
+                taken = engine.runCapture(count=settings.count)
+                print("Captured %d images" % taken)
+
+        elif settings.command == 'pip':
+            count = engine.createPip(
+                    get('pip_main_folder'), get('pip_pip_folder'),
+                    get('pip_output_folder'),
+                    get('pip_size'), get('pip_position'))
+            print("Processed %d images" % count)
+
+        elif settings.command == 'render':
+            output_filename = engine.createVideo(
+                    get('video_source_folder'), get('video_output_folder'),
+                    get('video_framerate'), get('video_codec'),
+                    get('mencoder_path'))
+            print("File saved as %s" % output_filename)
+
+        elif settings.command == 'catalog':
+            folders = settings.folders
+            if not folders:
+                folders = [folder for folder in (
+                                get('screenshot_save_folder'),
+                                get('webcam_save_folder'))
+                            if folder and os.path.isdir(folder)]
+
+            count = engine.rebuildCatalog(folders)
+            print("Cataloged %d images in %d folders" % (count, len(folders)))
+
+        elif settings.command == 'export':
+            count = engine.exportFrameStore(
+                            settings.source, settings.destination)
+            print("Exported %d images to %s" % (count, settings.destination))
+
+    except ChronolapseError as e:
+        logging.error("%s: %s" % (e.title, e.message))
+        return 1
+
+    return 0
+
+
+# run it!
+if __name__ == "__main__":
+    # pip compositing uses worker processes - needed for frozen builds
+    multiprocessing.freeze_support()
+
+    sys.exit(main())
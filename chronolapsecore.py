@@ -0,0 +1,1539 @@
+"""
+    chronolapsecore.py
+    @summary:
+        GUI free Chronolapse engine. Captures, picture-in-picture and video
+        rendering are driven entirely by an EasyConfig so they can run from
+        the wx frame in chronolapse.py or headless from chronolapsecli.py.
+        Nothing in here may import wx.
+    @license: MIT license
+"""
+
+import collections
+import logging
+import math
+import os
+import sys
+import threading
+import time
+
+
+from easyconfig import EasyConfig
+from webcamsession import WebcamSession, grabSynchronized, resizeFrame
+from sequenceallocator import SequenceAllocator
+from capturepipeline import CapturePipeline, CapturedFrame, LinkedFrame
+from imagewriter import ImageWriter, IMAGE_FORMATS
+from changedetector import ChangeDetector
+from idledetector import createIdleDetector
+from capturescheduler import CaptureScheduler
+from screengrab import createGrabber
+from pipcompositor import createPipBatch, PIP_JPEG_QUALITY
+from framematcher import matchFrames
+from videorender import (ChunkedRenderer, FrameStreamRenderer, RenderError,
+                            findExecutable)
+from framecatalog import FrameCatalog, CATALOG_FILENAME
+from framestore import FrameStore, hasFrameStore
+from frameselection import selectFrames
+from incrementalrender import IncrementalRenderer, masterPaths
+
+ON_WINDOWS = sys.platform.startswith('win')
+
+# images the video encoder is fed, anything else in the folder is ignored
+VIDEO_FRAME_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp')
+
+
+class ChronolapseError(Exception):
+    """
+    Raised by the engine for problems the user has to fix. title and
+    message are suitable for showing in a warning dialog.
+    """
+
+    def __init__(self, title, message):
+        Exception.__init__(self, message)
+        self.title = title
+        self.message = message
+
+
+def defaultConfig():
+    """
+    Returns the default configuration, see the README for details.
+    """
+    return {
+        'chronolapse': {
+            'frequency': '60',
+
+            'use_screenshot': True,
+            'screenshot_timestamp': True,
+            'screenshot_timestamp_format': '%Y-%m-%d %H:%M:%S',
+            'screenshot_save_folder': 'screenshots',
+            'screenshot_prefix': 'screen_',
+            'screenshot_format': 'jpg',
+            'screenshot_jpeg_quality': 90,
+            'screenshot_jpeg_subsampling': '420',
+            'screenshot_png_compression': 3,
+            'screenshot_webp_quality': 90,
+            'screenshot_dual_monitor': False,
+            'screenshot_monitors': 'all',
+            'screenshot_backend': 'auto',
+            'skip_if_idle': False,
+            'idle_backend': 'auto',
+            'idle_threshold': 0,
+
+            'screenshot_subsection': False,
+            'screenshot_subsection_top': '0',
+            'screenshot_subsection_left': '0',
+            'screenshot_subsection_width': '800',
+            'screenshot_subsection_height': '600',
+
+            'use_webcam': False,
+            'webcam_timestamp': True,
+            'webcam_timestamp_format': '%Y-%m-%d %H:%M:%S',
+            'webcam_save_folder': 'webcam',
+            'webcam_prefix': 'cam_',
+            'webcam_format': 'jpg',
+            'webcam_jpeg_quality': 90,
+            'webcam_jpeg_subsampling': '420',
+            'webcam_png_compression': 3,
+            'webcam_webp_quality': 90,
+            'webcam_timestamp_top': 10,
+            'webcam_timestamp_left': 10,
+            'webcam_timestamp_red': 255,
+            'webcam_timestamp_green': 255,
+            'webcam_timestamp_blue': 255,
+            'webcam_device_number': 0,
+            'webcam_resolution_x': 0,
+            'webcam_resolution_y': 0,
+            'webcam_idle_timeout': 30,
+            'webcam_sources': [],
+
+            'capture_workers': 2,
+            'capture_queue_size': 8,
+            'capture_drop_policy': 'drop_oldest',
+            'capture_missed_policy': 'skip',
+            'dedup_mode': 'off',
+            'dedup_method': 'mad',
+            'dedup_threshold': 1.0,
+
+            'filename_format': 'timestamp',
+
+            'pip_main_folder': '',
+            'pip_pip_folder': '',
+            'pip_output_folder': '',
+            'pip_size': 'Small',
+            'pip_position': 'Top-Right',
+            'pip_ignore_unmatched': True,
+            'pip_workers': 0,
+            'pip_engine': 'opencv',
+            'pip_jpeg_quality': 75,
+            'pip_match_tolerance': 1.0,
+
+            'video_source_folder': '',
+            'video_output_folder': '',
+            'video_format': '',
+            'video_codec': 'mpeg4',
+            'video_framerate': '10',
+            'mencoder_path': 'mencoder',
+            'video_encoder': 'auto',
+            'ffmpeg_path': 'ffmpeg',
+            'video_stream_format': 'auto',
+            'video_frame_selection': 'all',
+            'video_frame_step': 1,
+            'video_target_duration': 60,
+            'video_sample_interval': 3600,
+            'video_render_mode': 'full',
+            'video_render_chunks': 1,
+
+            'frame_catalog': '',
+            'frame_storage': 'files',
+            'frame_segment_size': 256,
+
+            'audio_source_video': '',
+            'audio_source': '',
+            'audio_output_folder': '',
+
+            'last_update': time.strftime('%Y-%m-%d'),
+            'update_check_frequency': 604800
+        }
+    }
+
+
+# webcam_ settings each entry of webcam_sources can set for its camera
+WEBCAM_SOURCE_KEYS = ('device_number', 'save_folder', 'prefix', 'format',
+    'resolution_x', 'resolution_y', 'timestamp', 'timestamp_format',
+    'timestamp_top', 'timestamp_left',
+    'timestamp_red', 'timestamp_green', 'timestamp_blue')
+
+
+def stampColor(red, green, blue):
+    """
+    Returns a (red, green, blue) timestamp color from config values,
+    using 255 for any that are invalid.
+    """
+    color = []
+    for value in (red, green, blue):
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            value = 255
+        color.append(min(255, max(0, value)))
+    return tuple(color)
+
+
+# seconds of config changes, like typing in a text field, saved as one write
+CONFIG_PERSIST_DELAY = 1.0
+
+
+def createConfig(config_file):
+    """
+    Returns an EasyConfig for config_file filled with the defaults. The
+    file itself is not read - call load() on the result for that.
+    """
+    return EasyConfig(os.path.abspath(config_file), defaults=defaultConfig(),
+                        persist_delay=CONFIG_PERSIST_DELAY)
+
+
+def addCommonArguments(parser):
+    """
+    Adds the command line options shared by the GUI and the command line
+    interface to an argparse parser.
+    """
+
+    # configuration file location
+    parser.add_argument("--config_file",
+            help="The location of the Chronolapse configuration file",
+            default="chronolapse.config")
+
+    # sequential image format
+    parser.add_argument('--sequential_image_format',
+            help="Sets the format string for sequential image file names",
+            default='%05d')
+
+    parser.add_argument('--timestamp_filename_format',
+            help="Sets the format string for timestamp image file names",
+            default='%Y-%m-%d_%H-%M-%S')
+
+    # --verbose and --debug
+    parser.add_argument("-v", "--verbose",
+                        help="Increase output verbosity",
+                        action="store_true")
+    parser.add_argument("-d", "--debug",
+                        help="Increase output verbosity to maximum",
+                        action="store_true")
+
+
+class ChronolapseEngine(object):
+    """
+    Capture, picture-in-picture and render logic for Chronolapse.
+
+    config is an EasyConfig using the 'chronolapse' section, settings is
+    the parsed command line (see addCommonArguments) and screen_grabber is
+    an optional callable(rect, all_screens) returning an rgb numpy array,
+    offered as the 'wx' screenshot backend with screen_monitors listing
+    its monitors.
+    """
+
+    def __init__(self, config, settings, screen_grabber=None,
+                    screen_monitors=None):
+        self.config = config
+        self.settings = settings
+        self.screen_grabber = screen_grabber
+        self.screen_monitors = screen_monitors
+
+        # screenshot backend, see getScreenGrabber
+        self.grabber = None
+        self.grabber_backend = None
+
+        # save path to folder where chronolapse is currently running
+        self.chronolapse_path = os.path.dirname(os.path.abspath(sys.argv[0]))
+
+        # webcam - long lived session per device, see getWebcamSession
+        self.webcam_sessions = {}
+
+        # per camera capture latency, see getWebcamStats
+        self.webcam_latency = {}
+
+        # invalid webcam_sources entries already warned about
+        self.ignored_webcam_sources = set()
+
+        # sequential filename numbers, see getSequenceAllocator
+        self.sequence_allocator = None
+
+        # the last timestamp filename and how often it was repeated, see
+        # capture
+        self.last_timestamp_filename = None
+        self.timestamp_repeats = 0
+
+        # index of captured frames, see getFrameCatalog
+        self.frame_catalog = None
+
+        # captures are grabbed here and written by the pipeline workers
+        self.capture_pipeline = CapturePipeline(
+                    workers=self.getConfig('capture_workers', default=2),
+                    max_queue=self.getConfig('capture_queue_size', default=8),
+                    drop_policy=self.getConfig('capture_drop_policy',
+                                                    default='drop_oldest'),
+                    on_written=self.frameWritten,
+                    on_failed=self.frameFailed)
+
+        # capture schedule - created when capturing starts
+        self.scheduler = None
+
+        # last kept frame of each capture stream, see submitFrame
+        self.change_detectors = {}
+
+        # for skip_if_idle, see getIdleDetector
+        self.idle_detector = None
+        self.idle_backend = None
+
+        # encoding options of each capture source, see getImageWriter
+        self.image_writers = {}
+
+        # open frame stores by folder, see openFrameStore - used from the
+        # capture and render threads
+        self.frame_stores = {}
+        self.frame_stores_lock = threading.Lock()
+
+    def getConfig(self, key, section='chronolapse', default=None):
+        return self.config.get(section, key, default=default)
+
+    def getCaptureInterval(self):
+        """
+        Returns the capture frequency from the config in seconds.
+        """
+        try:
+            return float(self.getConfig('frequency'))
+        except (TypeError, ValueError):
+            return 60.0
+
+    def checkCaptureFolders(self):
+        """
+        Raises ChronolapseError if an enabled capture folder is not writable.
+        """
+        if self.getConfig('use_screenshot'):
+            screenshot_folder = os.path.abspath(
+                                    self.getConfig('screenshot_save_folder'))
+            if not os.access(screenshot_folder, os.W_OK):
+                raise ChronolapseError('Cannot Write to Screenshot Folder',
+                    ("""Error: Cannot write to screenshot folder %s.
+Please add write permission and try again.""") % screenshot_folder)
+
+        if self.getConfig('use_webcam'):
+            for source in self.getWebcamSources():
+                webcam_folder = os.path.abspath(source['save_folder'])
+                if not os.access(webcam_folder, os.W_OK):
+                    raise ChronolapseError('Cannot Write to Webcam Folder',
+                        ("""Error: Cannot write to webcam folder %s.
+Please add write permission and try again.""") % webcam_folder)
+
+    def startCapture(self):
+        """
+        Checks the capture folders, opens the camera and starts the
+        capture schedule. Raises ChronolapseError on problems.
+        """
+        self.checkCaptureFolders()
+
+        # capture deadlines are absolute so capture time never adds drift
+        self.scheduler = None
+        if self.getCaptureInterval() > 0:
+            self.scheduler = CaptureScheduler(
+                            self.getCaptureInterval(),
+                            missed_policy=self.getConfig(
+                                'capture_missed_policy', default='skip'))
+            self.scheduler.start()
+
+        # open the cameras now so the first capture does not wait for them,
+        # kept open between captures by the schedule, see
+        # getWebcamIdleTimeout
+        if self.getConfig('use_webcam'):
+            for session in self.getDeviceSessions(
+                                        self.getWebcamSources()).values():
+                session.start()
+
+    def stopCapture(self):
+        """
+        Stops the schedule, releases the camera and waits for queued
+        captures to be written.
+        """
+        if self.scheduler is not None:
+            logging.info("Capture lateness: %s" % self.scheduler.getStats())
+            self.scheduler = None
+
+        # release the cameras
+        self.closeWebcamSession()
+        if self.webcam_latency:
+            logging.info("Webcam latency: %s" % self.getWebcamStats())
+        self.webcam_latency = {}
+
+        # finish writing any queued captures
+        self.capture_pipeline.stop()
+        logging.info("Capture writes: %s" % self.capture_pipeline.getStats())
+        self.closeFrameStores()
+        if self.frame_catalog is not None:
+            self.frame_catalog.flush()
+        self.closeSequenceAllocator()
+
+        # next session starts comparing afresh
+        self.change_detectors = {}
+
+    def runCapture(self, count=None):
+        """
+        Captures on the configured schedule until count captures have been
+        taken or the process is interrupted. Used for headless capturing.
+        """
+        self.startCapture()
+        if self.scheduler is None:
+            raise ChronolapseError('Frequency Invalid',
+                        'The capture frequency must be a positive number')
+
+        taken = 0
+        try:
+            while count is None or taken < count:
+                time.sleep(self.scheduler.delay())
+
+                if self.scheduler.due():
+                    self.scheduler.fire()
+                    self.capture()
+                    taken += 1
+
+        except KeyboardInterrupt:
+            logging.info("Capture interrupted")
+
+        finally:
+            self.stopCapture()
+
+        return taken
+
+    def hasBeenIdle(self):
+        """
+        Returns True if there has been no user input for idle_threshold
+        seconds, or for one capture interval if idle_threshold is 0.
+        Returns False if idle time cannot be measured.
+        """
+        detector = self.getIdleDetector()
+        if detector is None:
+            return False
+
+        seconds = detector.idleSeconds()
+        if seconds is None:
+            return False
+
+        try:
+            threshold = float(self.getConfig('idle_threshold'))
+        except (TypeError, ValueError):
+            threshold = 0
+        if threshold <= 0:
+            threshold = self.getCaptureInterval()
+
+        logging.debug("Idle for %.1f seconds" % seconds)
+        return seconds >= threshold
+
+    def getIdleDetector(self):
+        """
+        Returns the idle detector for the idle_backend setting, replacing
+        it if the setting has changed. None if no backend is available.
+        """
+        backend = self.getConfig('idle_backend', default='auto')
+
+        if self.idle_backend != backend:
+            self.closeIdleDetector()
+
+            self.idle_detector = createIdleDetector(
+                    backend, self.probeScreen, ChangeDetector())
+            self.idle_backend = backend
+
+            if self.idle_detector is None:
+                logging.warning("No idle detection available - "
+                                "captures will not be skipped")
+            else:
+                logging.debug("Idle backend: %s" % self.idle_detector.name)
+
+        return self.idle_detector
+
+    def closeIdleDetector(self):
+        if self.idle_detector is not None:
+            self.idle_detector.close()
+        self.idle_detector = None
+        self.idle_backend = None
+
+    def probeScreen(self):
+        """
+        Grabs the screen without saving it, for frame difference idle
+        detection.
+        """
+        grabber = self.getScreenGrabber()
+        image = grabber.grab(self.getScreenshotRect(),
+                                self.getConfig('screenshot_dual_monitor'))
+        if image is None:
+            return None
+        return CapturedFrame(image, None, channel_order=grabber.channel_order)
+
+    def capture(self, force=False):
+        sequence = None
+
+        # check if idle if necessary
+        if not force and self.getConfig('skip_if_idle'):
+            if self.hasBeenIdle():
+                logging.debug('Skipping Capture - Idle')
+                return
+
+        # get filename from time
+        if self.getConfig('filename_format') == 'timestamp':
+            filename = time.strftime(
+                                self.settings.timestamp_filename_format)
+
+            # use microseconds if capture speed is less than 1
+            if self.getCaptureInterval() < 1:
+                filename = str( time.time() )
+
+            # catch up captures, or a late capture followed by the next on
+            # time one, can fall in the same second - never overwrite
+            if filename == self.last_timestamp_filename:
+                self.timestamp_repeats += 1
+                filename = '%s_%d' % (filename, self.timestamp_repeats)
+            else:
+                self.last_timestamp_filename = filename
+                self.timestamp_repeats = 0
+
+        # get sequential filename
+        else:
+            number = self.getSequenceAllocator().next()
+            sequence = number
+
+            # create sequential filename
+            filename = self.settings.sequential_image_format % number
+
+        logging.debug('Capturing - ' + filename)
+
+        # if screenshots
+        if self.getConfig('use_screenshot'):
+            # take screenshot
+            self.saveScreenshot(filename, sequence)
+
+        # if webcam
+        if self.getConfig('use_webcam'):
+
+            # take webcam shot
+            self.saveWebcam(filename, sequence)
+
+        return filename
+
+    def getSequenceAllocator(self):
+        """
+        Returns the sequence allocator for the enabled capture folders,
+        replacing it if the folders or prefixes have changed.
+        """
+        sources = []
+        if self.getConfig('use_screenshot'):
+            sources.append((self.getConfig('screenshot_save_folder'),
+                            self.getConfig('screenshot_prefix')))
+        if self.getConfig('use_webcam'):
+            for source in self.getWebcamSources():
+                sources.append((source['save_folder'], source['prefix']))
+
+        if (self.sequence_allocator is None
+            or not self.sequence_allocator.matches(sources)):
+            self.closeSequenceAllocator()
+            self.sequence_allocator = SequenceAllocator(sources)
+
+        return self.sequence_allocator
+
+    def closeSequenceAllocator(self):
+        """
+        Records the last sequence number used, see SequenceAllocator.close.
+        """
+        if self.sequence_allocator is not None:
+            self.sequence_allocator.close()
+
+    def getScreenshotRect(self):
+        """
+        Returns the configured screenshot subsection as
+        (x, y, width, height) or None for the whole screen.
+        """
+        if not self.getConfig('screenshot_subsection'):
+            return None
+
+        try:
+            top = int(self.getConfig('screenshot_subsection_top'))
+            left = int(self.getConfig('screenshot_subsection_left'))
+            width = int(self.getConfig('screenshot_subsection_width'))
+            height = int(self.getConfig('screenshot_subsection_height'))
+        except (TypeError, ValueError):
+            logging.error("Invalid screenshot subsection")
+            return None
+
+        if top < 0 or left < 0 or width <= 0 or height <= 0:
+            return None
+
+        return (left, top, width, height)
+
+    def saveScreenshot(self, filename, sequence=None):
+        timestamp = self.getConfig('screenshot_timestamp')
+        folder = self.getConfig('screenshot_save_folder')
+        prefix = self.getConfig('screenshot_prefix')
+        file_format = self.getConfig('screenshot_format')
+
+        grabber = self.getScreenGrabber()
+        rect = self.getScreenshotRect()
+        all_screens = self.getConfig('screenshot_dual_monitor')
+
+        # a subsection is always a single grab
+        monitors = 'primary'
+        if all_screens and rect is None:
+            monitors = self.getConfig('screenshot_monitors', default='all')
+
+        capture_time = time.time()
+        try:
+            if monitors == 'separate':
+                images = grabber.grabEach()
+            elif monitors == 'all':
+                images = [grabber.grabAll()]
+            else:
+                images = [grabber.grab(rect, all_screens)]
+        except Exception as e:
+            logging.error("Failed to take screenshot: %s" % repr(e))
+            return
+
+        # stamp is drawn by the pipeline but reflects the time of the grab
+        stamp = None
+        if timestamp:
+            stamp = self.formatStamp(
+                self.getConfig('screenshot_timestamp_format'),
+                capture_time,
+                subsecond=self.getCaptureInterval() < 1)
+
+        if file_format not in IMAGE_FORMATS:
+            file_format = 'jpg'
+        writer = self.getImageWriter('screenshot')
+
+        for index, image in enumerate(images):
+            if image is None:
+                logging.warning("No image returned from screen")
+                continue
+
+            # each monitor is its own stream in a numbered subfolder
+            monitor_folder = folder
+            if monitors == 'separate':
+                monitor_folder = os.path.join(
+                                    folder, 'monitor_%d' % (index + 1))
+                if not os.path.isdir(monitor_folder):
+                    os.makedirs(monitor_folder)
+
+            filepath = os.path.join(monitor_folder,
+                            "%s%s.%s" % (prefix, filename, file_format))
+
+            stream = 'screen'
+            if monitors == 'separate':
+                stream = 'screen_%d' % (index + 1)
+
+            self.submitFrame(stream, CapturedFrame(
+                image, filepath, channel_order=grabber.channel_order,
+                stamp=stamp, stamp_position=(20, image.shape[0]-30),
+                capture_time=capture_time, source='screen',
+                sequence=sequence, writer=writer,
+                store=self.getCaptureStore(monitor_folder)))
+
+    def getScreenGrabber(self):
+        """
+        Returns the grabber for the screenshot_backend setting, replacing
+        it if the setting has changed.
+        """
+        backend = self.getConfig('screenshot_backend', default='auto')
+
+        if self.grabber is not None and self.grabber_backend != backend:
+            self.grabber.close()
+            self.grabber = None
+
+        if self.grabber is None:
+            self.grabber = createGrabber(
+                        backend, self.screen_grabber, self.screen_monitors)
+            self.grabber_backend = backend
+            logging.debug("Screenshot backend: %s" % self.grabber.name)
+
+        return self.grabber
+
+    def formatStamp(self, timestamp_format, capture_time, subsecond=False):
+        """
+        Returns capture_time formatted with timestamp_format or None if the
+        format is invalid. Adds fractional seconds if subsecond is True.
+        """
+        try:
+            stamp = time.strftime(
+                        timestamp_format, time.localtime(capture_time))
+        except (TypeError, ValueError):
+            logging.error("Invalid timestamp format")
+            return None
+
+        if subsecond:
+            micro = str(capture_time - math.floor(capture_time))[1:4]
+            stamp = stamp + micro
+
+        return stamp
+
+    def saveWebcam(self, filename, sequence=None):
+        """
+        Captures every webcam source. A single camera uses its newest
+        frame; several are grabbed together with grabSynchronized so their
+        frames line up in time.
+        """
+        sources = self.getWebcamSources()
+
+        if len(sources) == 1:
+            start = time.monotonic()
+            capture_time = time.time()
+            image = self.getWebcamCapture()
+            grabs = [(image, capture_time, time.monotonic() - start)]
+
+        else:
+            grabs = self.grabWebcams(sources)
+
+        for source, (image, capture_time, latency) in zip(sources, grabs):
+            if image is None:
+                logging.warning("No image returned from camera %s" % (
+                                                    source['device_number']))
+                continue
+
+            self.recordLatency(source['stream'], latency)
+
+            frame = self.makeWebcamFrame(source, filename, image, capture_time)
+            frame.sequence = sequence
+            self.submitFrame(source['stream'], frame)
+
+    def grabWebcams(self, sources):
+        """
+        Grabs every source at the same moment. Returns (image, grab_time,
+        latency) for each source, image None if its camera failed.
+        """
+        sessions = self.getDeviceSessions(sources)
+        requests = dict(zip(sessions.keys(),
+                    grabSynchronized(list(sessions.values()))))
+
+        grab_times = [request.grab_time for request in requests.values()
+                        if request.grab_time is not None]
+        if len(grab_times) > 1:
+            logging.debug("Webcams grabbed within %.1f ms" % (
+                            1000 * (max(grab_times) - min(grab_times))))
+
+        grabs = []
+        for source in sources:
+            request = requests[source['device_number']]
+            image = resizeFrame(request.frame, source['resolution_x'],
+                                    source['resolution_y'])
+            grabs.append((image, request.grab_time or time.time(),
+                            request.latency))
+        return grabs
+
+    def recordLatency(self, stream, latency):
+        if latency is None:
+            return
+        stats = self.webcam_latency.setdefault(stream, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += latency
+        stats[2] = max(stats[2], latency)
+
+    def getWebcamStats(self):
+        """
+        Returns {stream: {'captures', 'mean_ms', 'max_ms'}} - how long each
+        camera took from the capture tick to a decoded frame.
+        """
+        stats = {}
+        for stream, (count, total, longest) in self.webcam_latency.items():
+            stats[stream] = {
+                'captures': count,
+                'mean_ms': round(1000 * total / count, 1),
+                'max_ms': round(1000 * longest, 1),
+            }
+        return stats
+
+    def submitFrame(self, stream, frame):
+        """
+        Queues a capture for writing. With dedup_mode 'skip' or 'link', a
+        frame that looks the same as the last one kept for stream is
+        dropped or written as a link to that frame's file.
+        """
+        mode = self.getConfig('dedup_mode', default='off')
+        if mode in ('skip', 'link'):
+            reference = self.getChangeDetector(stream).check(frame)
+
+            if reference is not None:
+                if mode == 'skip':
+                    logging.debug("Skipping unchanged %s" % frame.filepath)
+                    return
+                logging.debug("Linking unchanged %s to %s" % (
+                                        frame.filepath, reference.filepath))
+                frame = LinkedFrame(frame, reference)
+
+        self.capture_pipeline.submit(frame)
+
+    def getChangeDetector(self, stream):
+        """
+        Returns the change detector for a capture stream, replacing it if
+        the dedup settings have changed.
+        """
+        try:
+            threshold = float(self.getConfig('dedup_threshold'))
+        except (TypeError, ValueError):
+            threshold = 1.0
+        method = self.getConfig('dedup_method', default='mad')
+
+        detector = self.change_detectors.get(stream)
+        if detector is None or not detector.matches(threshold, method):
+            detector = ChangeDetector(threshold, method)
+            self.change_detectors[stream] = detector
+
+        return detector
+
+    def getImageWriter(self, prefix):
+        """
+        Returns the ImageWriter for the <prefix>_jpeg_quality and other
+        encoding options of a capture source, 'screenshot' or 'webcam',
+        replacing it if they have changed.
+        """
+        options = dict((option, self.getConfig('%s_%s' % (prefix, option)))
+                        for option in ImageWriter.OPTIONS)
+        options = dict((key, value) for key, value in options.items()
+                        if value is not None)
+
+        writer = self.image_writers.get(prefix)
+        if writer is None or not writer.matches(**options):
+            writer = ImageWriter(**options)
+            self.image_writers[prefix] = writer
+
+        return writer
+
+    def getWebcamSession(self, device_number=None, resolution_x=None,
+                            resolution_y=None):
+        """
+        Returns the shared session for a camera, the configured webcam by
+        default, replacing it if its resolution has changed since it was
+        created.
+        """
+        if device_number is None:
+            device_number = self.getConfig('webcam_device_number')
+        if resolution_x is None:
+            resolution_x = self.getConfig('webcam_resolution_x')
+        if resolution_y is None:
+            resolution_y = self.getConfig('webcam_resolution_y')
+        resolution_x = int(resolution_x or 0)
+        resolution_y = int(resolution_y or 0)
+
+        session = self.webcam_sessions.get(device_number)
+        if (session is not None and
+            not session.matches(device_number, resolution_x, resolution_y)):
+            session.close()
+            session = None
+
+        if session is None:
+            session = WebcamSession(device_number, resolution_x,
+                            resolution_y, self.getWebcamIdleTimeout())
+            self.webcam_sessions[device_number] = session
+        else:
+            session.setIdleTimeout(self.getWebcamIdleTimeout())
+
+        return session
+
+    def getWebcamIdleTimeout(self):
+        """
+        Returns how long a camera may go unused before it is released.
+        While a capture schedule runs it is at least two capture intervals,
+        so the camera stays open between captures.
+        """
+        try:
+            idle_timeout = float(self.getConfig('webcam_idle_timeout'))
+        except (TypeError, ValueError):
+            idle_timeout = 30
+
+        # 0 already means never
+        if idle_timeout > 0 and self.scheduler is not None:
+            idle_timeout = max(idle_timeout, 2 * self.scheduler.interval)
+        return idle_timeout
+
+    def getSourceSession(self, source):
+        return self.getWebcamSession(source['device_number'],
+                    source['resolution_x'], source['resolution_y'])
+
+    def getDeviceSessions(self, sources):
+        """
+        Returns {device_number: session} for sources. A device listed
+        twice is opened once, at the resolution of its first source - see
+        resizeFrame for the others.
+        """
+        sessions = collections.OrderedDict()
+        for source in sources:
+            if source['device_number'] not in sessions:
+                sessions[source['device_number']] = self.getSourceSession(
+                                                                    source)
+        return sessions
+
+    def closeWebcamSession(self):
+        """
+        Releases every camera.
+        """
+        for session in self.webcam_sessions.values():
+            session.close()
+        self.webcam_sessions = {}
+
+    def getWebcamSources(self):
+        """
+        Returns the settings of each camera as a dict of the webcam_ config
+        keys in WEBCAM_SOURCE_KEYS without the prefix, plus the capture
+        'stream' name. The configured webcam comes first, then each entry
+        of webcam_sources, which only needs the settings that differ from
+        it. An entry without a save_folder saves to the webcam folder
+        name followed by its device number.
+        """
+        main = dict((key, self.getConfig('webcam_' + key))
+                        for key in WEBCAM_SOURCE_KEYS)
+        main['stream'] = 'webcam'
+        sources = [main]
+
+        for extra in self.getConfig('webcam_sources', default=[]) or []:
+            if not isinstance(extra, dict) or 'device_number' not in extra:
+                if repr(extra) not in self.ignored_webcam_sources:
+                    self.ignored_webcam_sources.add(repr(extra))
+                    logging.warning("Ignoring webcam source without a "
+                                    "device_number: %s" % repr(extra))
+                continue
+
+            source = dict(main)
+            source.update((key, value) for key, value in extra.items()
+                            if key in WEBCAM_SOURCE_KEYS)
+            if 'save_folder' not in extra:
+                source['save_folder'] = '%s_%s' % (
+                            main['save_folder'], extra['device_number'])
+            source['stream'] = 'webcam_%s' % extra['device_number']
+
+            # a device listed again is a separate stream
+            streams = [other['stream'] for other in sources]
+            count = 1
+            while source['stream'] in streams:
+                count += 1
+                source['stream'] = 'webcam_%s_%d' % (
+                                            extra['device_number'], count)
+            sources.append(source)
+
+        return sources
+
+    def getWebcamCapture(self):
+        # newest frame from the shared session - opens the camera if needed
+        return self.getWebcamSession().getFrame()
+
+    def takeWebcam(self,
+        filename, folder,
+        prefix, file_format='jpg',
+        use_timestamp=False, timestamp_format=None):
+        """
+        Captures and writes a webcam image right away. Returns the path
+        written or None if the camera did not return an image.
+        """
+        frame = self.buildWebcamFrame(
+            filename, folder, prefix, file_format, use_timestamp,
+            timestamp_format)
+
+        if frame is None:
+            return None
+
+        return frame.save()
+
+    def buildWebcamFrame(self,
+        filename, folder,
+        prefix, file_format='jpg',
+        use_timestamp=False, timestamp_format=None):
+        """
+        Grabs the newest webcam image and returns a CapturedFrame ready to
+        be written, or None if the camera did not return an image.
+        """
+        source = self.getWebcamSources()[0]
+        source.update({
+            'save_folder': folder,
+            'prefix': prefix,
+            'format': file_format,
+            'timestamp': use_timestamp,
+        })
+
+        # if no format passed in, keep the one from config
+        if timestamp_format is not None:
+            source['timestamp_format'] = timestamp_format
+
+        # get image from webcam
+        capture_time = time.time()
+        image = self.getWebcamCapture()
+
+        if image is None:
+            logging.warning("No image returned from camera")
+            return None
+
+        return self.makeWebcamFrame(source, filename, image, capture_time)
+
+    def makeWebcamFrame(self, source, filename, image, capture_time):
+        """
+        Returns a CapturedFrame of image for a webcam source from
+        getWebcamSources.
+        """
+        folder = source['save_folder']
+
+        # build filepath
+        filepath = os.path.join(folder, "%s%s.%s" % (
+                            source['prefix'], filename, source['format']))
+
+        # build timestamp as necessary
+        stamp = None
+        if source['timestamp']:
+            stamp = self.formatStamp(source['timestamp_format'], capture_time)
+
+        if stamp:
+            logging.debug("Writing timestamp %s" % stamp)
+        else:
+            logging.debug("Not writing timestamp")
+
+        # the session's frame is shared - the pipeline must not draw on it
+        return CapturedFrame(
+            image, filepath, channel_order='bgr',
+            stamp=stamp,
+            stamp_position=(source['timestamp_left'], source['timestamp_top']),
+            stamp_color=stampColor(source['timestamp_red'],
+                        source['timestamp_green'], source['timestamp_blue']),
+            capture_time=capture_time, source='webcam', shared=True,
+            writer=self.getImageWriter('webcam'),
+            store=self.getCaptureStore(folder))
+
+    def shutdown(self):
+        """
+        Releases the camera and finishes writing queued captures.
+        """
+        self.closeWebcamSession()
+        self.capture_pipeline.stop()
+
+        self.closeIdleDetector()
+
+        if self.grabber is not None:
+            self.grabber.close()
+            self.grabber = None
+
+        self.closeFrameStores()
+        self.closeSequenceAllocator()
+
+        if self.frame_catalog is not None:
+            self.frame_catalog.close()
+            self.frame_catalog = None
+
+    def getFrameCatalog(self):
+        """
+        Returns the frame catalog, opening it on first use. The frame_catalog
+        setting is its path, or empty for one next to the config file.
+        """
+        if self.frame_catalog is None:
+            path = self.getConfig('frame_catalog')
+            if not path:
+                path = os.path.join(
+                    os.path.dirname(os.path.abspath(self.settings.config_file)),
+                    CATALOG_FILENAME)
+
+            self.frame_catalog = FrameCatalog(path,
+                        self.settings.timestamp_filename_format,
+                        VIDEO_FRAME_EXTENSIONS)
+
+        return self.frame_catalog
+
+    def rebuildCatalog(self, folders, progress=None):
+        """
+        Rescans folders from disk into the frame catalog. progress is
+        called with (folder, count, total). Returns the number of frames.
+        """
+        catalog = self.getFrameCatalog()
+
+        total = 0
+        for folder in folders:
+            if not os.path.isdir(folder):
+                raise ChronolapseError('Folder invalid',
+                            'The folder %s does not exist' % folder)
+
+            # tag capture folders with their source
+            source = None
+            for key, name in (('screenshot_save_folder', 'screen'),
+                                ('webcam_save_folder', 'webcam')):
+                configured = self.getConfig(key)
+                if configured and (os.path.abspath(configured)
+                                    == os.path.abspath(folder)):
+                    source = name
+
+            report = None
+            if progress is not None:
+                report = lambda count, n, folder=folder: progress(
+                                                        folder, count, n)
+
+            total += catalog.rebuild(folder, source, report)
+
+        return total
+
+    def createPip(self, sourcefolder, pipfolder, outfolder,
+                    pipsizestring, pippositionstring, progress=None):
+        """
+        Pastes the images in pipfolder onto the images in sourcefolder and
+        saves the results in outfolder using pip_workers processes. progress
+        is called with (count, total, filename) as each pair finishes and
+        may return False to cancel. Returns the number of pairs processed.
+        """
+
+        # make sure output folder is writable
+        if not os.access(outfolder, os.W_OK):
+            raise ChronolapseError('Permission Error',
+                'Error: Output file is not writable. Please check your ' +
+                ' permissions and try again.')
+
+        # pair frames by capture time so a dropped frame only loses itself
+        catalog = self.getFrameCatalog()
+        sourceframes = catalog.frames(sourcefolder)
+        pipframes = catalog.frames(pipfolder)
+
+        # sequence numbers cannot be matched against capture times
+        if (sourceframes and pipframes and
+            sourceframes[0].kind != pipframes[0].kind):
+            logging.warning("Only one PIP folder is numbered sequentially "
+                            "- matching both on capture time")
+            sourceframes = catalog.frames(sourcefolder, use_sequence=False)
+            pipframes = catalog.frames(pipfolder, use_sequence=False)
+
+        try:
+            tolerance = float(self.getConfig('pip_match_tolerance'))
+        except (TypeError, ValueError):
+            tolerance = 1.0
+
+        ignore_unmatched = self.getConfig('pip_ignore_unmatched')
+
+        pairs = []
+        for sourceframe, pipframe in matchFrames(
+                                    sourceframes, pipframes, tolerance):
+            if pipframe is not None:
+                pairs.append((sourceframe.path, pipframe.path))
+
+            # keep the main frame without a pip so video timing holds
+            elif not ignore_unmatched:
+                pairs.append((sourceframe.path, None))
+
+        logging.debug('Creating PIP - %d of %d frames matched' % (
+                    len([p for p in pairs if p[1]]), len(sourceframes)))
+
+        try:
+            workers = int(self.getConfig('pip_workers', default=0))
+        except (TypeError, ValueError):
+            workers = 0
+
+        try:
+            jpeg_quality = min(100, max(1, int(self.getConfig(
+                        'pip_jpeg_quality', default=PIP_JPEG_QUALITY))))
+        except (TypeError, ValueError):
+            jpeg_quality = PIP_JPEG_QUALITY
+
+        return createPipBatch(pairs, outfolder,
+                    pipsizestring, pippositionstring,
+                    workers=workers, progress=progress,
+                    engine=self.getConfig('pip_engine', default='opencv'),
+                    jpeg_quality=jpeg_quality)
+
+    def frameWritten(self, frame):
+        """
+        Called by the capture pipeline after each frame is written.
+        """
+        # frame stores keep their own index
+        if frame.stored is not None:
+            return
+
+        self.getFrameCatalog().addFrame(
+                    frame.filepath, frame.source, frame.capture_time,
+                    frame.sequence, frame.image.shape[1], frame.image.shape[0],
+                    frame.size, frame.folder_mtimes)
+
+    def frameFailed(self, frame):
+        """
+        Called by the capture pipeline for frames that were dropped or
+        failed to write, so later duplicates are not linked to them.
+        """
+        for detector in list(self.change_detectors.values()):
+            detector.forget(frame)
+
+    def countFrames(self, sourcepath):
+        """
+        Returns the number of images in sourcepath from the frame catalog
+        and frame store. Both count captures as they are written, so this
+        does not list the folder while capturing.
+        """
+        count = self.getFrameCatalog().count(sourcepath)
+        if hasFrameStore(sourcepath):
+            count += self.openFrameStore(sourcepath).count()
+        return count
+
+    def getCaptureStore(self, folder):
+        """
+        Returns the FrameStore captures in folder are appended to, or None
+        if frame_storage is 'files'.
+        """
+        if self.getConfig('frame_storage', default='files') != 'segments':
+            return None
+        return self.openFrameStore(folder)
+
+    def openFrameStore(self, folder):
+        """
+        Returns the frame store in folder, creating it on the first append.
+        Captures and renders of the same folder share one store, which
+        rereads its index when another process has appended to it.
+        """
+        try:
+            segment_size = int(float(self.getConfig('frame_segment_size'))
+                                    * 1024 * 1024)
+        except (TypeError, ValueError):
+            segment_size = 256 * 1024 * 1024
+
+        key = os.path.abspath(folder)
+        with self.frame_stores_lock:
+            store = self.frame_stores.get(key)
+            if store is None or not store.matches(folder, segment_size):
+                if store is not None:
+                    store.close()
+                store = FrameStore(folder, segment_size)
+                self.frame_stores[key] = store
+
+        return store
+
+    def closeFrameStores(self):
+        with self.frame_stores_lock:
+            stores = self.frame_stores
+            self.frame_stores = {}
+
+        for store in stores.values():
+            store.close()
+
+    def exportFrameStore(self, sourcefolder, destfolder, progress=None):
+        """
+        Writes the frames stored in sourcefolder to destfolder as image
+        files. progress is called with (count, total). Returns the number
+        of files written.
+        """
+        if not hasFrameStore(sourcefolder):
+            raise ChronolapseError('No Frame Store',
+                        'There is no frame store in %s' % sourcefolder)
+
+        if (os.path.isdir(destfolder) and
+            not os.access(destfolder, os.W_OK)):
+            raise ChronolapseError('Permission Denied',
+                        'The output folder %s is not writable' % destfolder)
+
+        count = self.openFrameStore(sourcefolder).export(destfolder, progress)
+        logging.info("Exported %d frames to %s" % (count, destfolder))
+        return count
+
+    def estimateVideoLength(self, sourcepath, framerate):
+        """
+        Returns the length in seconds of a video made from the frames in
+        sourcepath at framerate frames per second.
+        """
+        if not sourcepath or not framerate:
+            return 0
+
+        selection = self.getConfig('video_frame_selection', default='all')
+
+        # only interval selection needs the capture time of every frame
+        if selection == 'interval':
+            try:
+                numfiles = len(self.selectVideoFrames(
+                                        sourcepath, framerate)[0])
+            except ChronolapseError:
+                return 0
+
+        else:
+            numfiles = self.countFrames(sourcepath)
+
+            try:
+                if selection == 'every':
+                    step = int(self.getConfig('video_frame_step'))
+                    if step < 1:
+                        return 0
+                    numfiles = int(math.ceil(numfiles / float(step)))
+
+                elif selection == 'duration':
+                    numfiles = min(numfiles, int(float(
+                        self.getConfig('video_target_duration')) * framerate))
+
+                elif selection != 'all':
+                    return 0
+            except (TypeError, ValueError):
+                return 0
+
+        if numfiles <= 0:
+            return 0
+
+        # divide by frames/second to get seconds
+        return numfiles / float(framerate)
+
+    def findMencoder(self, mencoderpath):
+        """
+        Returns the path of the MEncoder executable to run, falling back
+        to one next to Chronolapse. Raises ChronolapseError if none is found.
+        """
+        if mencoderpath == 'mencoder':
+            # rely on mencoder being on the path
+            return mencoderpath
+
+        if not os.path.isfile(mencoderpath):
+            # look for mencoder
+            if not os.path.isfile(
+                            os.path.join(self.chronolapse_path, 'mencoder')):
+                raise ChronolapseError(
+                    'MEncoder Not Found',
+                    'Chronolapse uses MEncoder to process video, but could ' +
+                    'not find mencoder'
+                )
+            elif ON_WINDOWS:
+                mencoderpath = os.path.join(self.chronolapse_path, 'mencoder')
+
+        return mencoderpath
+
+    def findEncoder(self, mencoderpath):
+        """
+        Returns (encoder, path) for the video_encoder setting. 'auto' uses
+        ffmpeg when it can be found and MEncoder otherwise.
+        """
+        encoder = self.getConfig('video_encoder', default='auto')
+
+        if encoder in ('auto', 'ffmpeg'):
+            ffmpegpath = findExecutable(
+                            self.getConfig('ffmpeg_path', default='ffmpeg'))
+            if ffmpegpath is None:
+                ffmpegpath = findExecutable(
+                            os.path.join(self.chronolapse_path, 'ffmpeg'))
+
+            if ffmpegpath is not None:
+                return 'ffmpeg', ffmpegpath
+
+            if encoder == 'ffmpeg':
+                raise ChronolapseError(
+                    'FFmpeg Not Found',
+                    'The video encoder is set to ffmpeg, but ffmpeg could ' +
+                    'not be found. Set ffmpeg_path or install ffmpeg.'
+                )
+
+        elif encoder != 'mencoder':
+            raise ChronolapseError(
+                'Unknown Encoder',
+                'Unknown video encoder %s. Use auto, ffmpeg or mencoder.'
+                    % encoder
+            )
+
+        return 'mencoder', self.findMencoder(mencoderpath)
+
+    def listVideoFrames(self, sourcefolder):
+        """
+        Returns the paths of the images in sourcefolder in capture order,
+        followed by the StoredFrames of its frame store if it has one.
+        """
+        frames = [frame.path
+                    for frame in self.getFrameCatalog().frames(sourcefolder)]
+
+        if hasFrameStore(sourcefolder):
+            frames.extend(self.openFrameStore(sourcefolder).frames())
+        return frames
+
+    def selectVideoFrames(self, sourcefolder, fps):
+        """
+        Returns (frames, total) - the frames of sourcefolder picked by the
+        video_frame_selection setting, in order, and how many frames there
+        are in all. Raises ChronolapseError if the selection settings are
+        invalid.
+        """
+        frames = self.listVideoFrames(sourcefolder)
+
+        try:
+            selected = selectFrames(frames,
+                    self.getConfig('video_frame_selection', default='all'),
+                    step=self.getConfig('video_frame_step'),
+                    duration=self.getConfig('video_target_duration'),
+                    fps=fps,
+                    interval=self.getConfig('video_sample_interval'),
+                    times=lambda frames: self.videoFrameTimes(
+                                                    sourcefolder, frames))
+        except (TypeError, ValueError) as e:
+            raise ChronolapseError('Frame Selection Invalid',
+                        'The frame selection settings are invalid: %s' % e)
+
+        return selected, len(frames)
+
+    def videoFrameTimes(self, sourcefolder, frames):
+        """
+        Returns the capture time of each of frames from listVideoFrames,
+        falling back to the file's modification time.
+        """
+        known = self.getFrameCatalog().captureTimes(sourcefolder)
+
+        times = []
+        for frame in frames:
+            capture_time = getattr(frame, 'capture_time', None)
+            if capture_time is None:
+                capture_time = known.get(frame)
+            if capture_time is None:
+                try:
+                    capture_time = os.path.getmtime(frame)
+                except (OSError, TypeError):
+                    pass
+            times.append(capture_time)
+        return times
+
+    def createVideo(self, sourcefolder, destfolder, fps, codec, mencoderpath,
+                        progress=None):
+        """
+        Encodes the images in sourcefolder into a new video in destfolder
+        and returns its path. Frames are streamed to the encoder in capture
+        order and the video is written straight to destfolder. progress is
+        called with (frames_done, total) as the encoder works and may return
+        False to cancel. Blocks until the encoder finishes. Raises
+        ChronolapseError on problems.
+        """
+        renderer, framepaths, output_filename = self.prepareVideo(
+                        sourcefolder, destfolder, fps, codec, mencoderpath)
+        return self.renderVideo(
+                        renderer, framepaths, output_filename, progress)
+
+    def prepareVideo(self, sourcefolder, destfolder, fps, codec, mencoderpath):
+        """
+        Checks the video settings and returns (renderer, framepaths,
+        output_filename) for renderVideo. Raises ChronolapseError on
+        problems.
+        """
+        if not os.path.isdir(sourcefolder):
+            raise ChronolapseError('Source folder invalid',
+                            'The video source folder is invalid')
+
+        # check that destination folder exists and is writable
+        if not os.access( destfolder, os.W_OK):
+            raise ChronolapseError(
+                'Permission Denied',
+                ('The output folder %s is not writable. Please change the ' +
+                'permissions and try again.') % destfolder
+            )
+
+        encoder, encoderpath = self.findEncoder(mencoderpath)
+
+        try:
+            fps = int(fps)
+            if fps <= 0:
+                raise ValueError(fps)
+        except (TypeError, ValueError):
+            raise ChronolapseError(
+                'Frame Rate Invalid',
+                'The frame rate setting is invalid. Frame rate must be ' +
+                'a positive integer'
+            )
+
+        framepaths, total = self.selectVideoFrames(sourcefolder, fps)
+        if not framepaths:
+            raise ChronolapseError(
+                'No Images Found',
+                'No images were found in the source folder %s' % sourcefolder
+            )
+        if len(framepaths) < total:
+            logging.info("Rendering %d of %d frames" % (
+                                                len(framepaths), total))
+
+        # 0 encodes a range of the frames on every core
+        try:
+            chunks = int(self.getConfig('video_render_chunks', default=1))
+        except (TypeError, ValueError):
+            chunks = 1
+        if chunks == 0:
+            chunks = os.cpu_count() or 1
+
+        stream_format = self.getConfig('video_stream_format', default='auto')
+        try:
+            if chunks > 1:
+                renderer = ChunkedRenderer(encoder, encoderpath, codec, fps,
+                                            stream_format, chunks)
+            else:
+                renderer = FrameStreamRenderer(encoder, encoderpath, codec,
+                                                fps, stream_format)
+        except RenderError as e:
+            raise ChronolapseError('Encoding Error', str(e))
+
+        render_mode = self.getConfig('video_render_mode', default='full')
+        if render_mode == 'incremental':
+            return self.prepareIncrementalVideo(renderer, sourcefolder,
+                        destfolder, framepaths, encoder, codec, fps)
+        elif render_mode != 'full':
+            raise ChronolapseError(
+                'Unknown Render Mode',
+                'Unknown video render mode %s. Use full or incremental.'
+                    % render_mode
+            )
+
+        # get output file name
+        timestamp = time.strftime('%Y-%m-%d_%H-%M-%S')
+        out_extension = 'avi'
+
+        output_filename = os.path.join(
+                                destfolder,
+                                'timelapse_%s.%s' % (timestamp, out_extension)
+                            )
+
+        # if the file already exists
+        count = 1
+        while os.path.isfile(output_filename):
+            count += 1
+            output_filename = os.path.join(
+                    destfolder,
+                    'timelapse_%s_%d.%s' % (timestamp, count, out_extension)
+                )
+
+        return renderer, framepaths, output_filename
+
+    def prepareIncrementalVideo(self, renderer, sourcefolder, destfolder,
+                                    framepaths, encoder, codec, fps):
+        """
+        Returns (renderer, framepaths, output_filename) that append the
+        frames not yet rendered to sourcefolder's master video in
+        destfolder. Raises ChronolapseError if the frame selection cannot
+        be rendered incrementally.
+        """
+        selection = self.getConfig('video_frame_selection', default='all')
+        if selection == 'duration':
+            raise ChronolapseError(
+                'Frame Selection Invalid',
+                'Frames selected by duration change with every new frame, ' +
+                'so they cannot be rendered incrementally. Use a full ' +
+                'render or another frame selection.'
+            )
+
+        # frames are only appended while these stay the same
+        settings = {
+            'encoder': encoder,
+            'codec': codec,
+            'fps': fps,
+            'selection': [selection,
+                            str(self.getConfig('video_frame_step')),
+                            str(self.getConfig('video_sample_interval'))],
+        }
+
+        output_filename, manifest_path = masterPaths(sourcefolder, destfolder)
+        incremental = IncrementalRenderer(
+                        renderer, sourcefolder, manifest_path, settings)
+        newpaths = incremental.newFrames(framepaths, output_filename)
+
+        logging.info("%d of %d frames are new for %s" % (
+                            len(newpaths), len(framepaths), output_filename))
+        return incremental, newpaths, output_filename
+
+    def renderVideo(self, renderer, framepaths, output_filename,
+                        progress=None):
+        """
+        Runs a renderer from prepareVideo and returns the video's path.
+        Raises ChronolapseError if the encoder fails or is cancelled.
+        """
+        try:
+            return renderer.render(framepaths, output_filename, progress)
+
+        except RenderError as e:
+            if renderer.cancelled:
+                raise ChronolapseError('Encoding Cancelled', str(e))
+
+            encoder = renderer.encoder
+            logging.error("%s failed: %s" % (encoder, str(e)))
+            raise ChronolapseError(
+                    'Encoding Error',
+                    ("Error while encoding video with %s. Try a different " +
+                    "codec.\n\n%s") % (encoder, str(e))
+            )
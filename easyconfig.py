@@ -6,7 +6,11 @@ Simple configuration management. Originally created for the Chronolapse project.
 Author: Collin Green
 """
 
+import atexit
 import json
+import logging
+import os
+import threading
 
 
 class EasyConfig(object):
@@ -16,15 +20,27 @@ class EasyConfig(object):
 
     All config should be in a section, then key->value.
 
+    If persist_delay is more than 0, changes are written behind - every
+    change within persist_delay seconds of the first is coalesced into a
+    single write, and pending changes are flushed when the program exits.
+
     Example:
         config = EasyConfig(filepath, defaults={'main': {'option': value} })
     """
 
-    def __init__(self, filepath, defaults={}):
+    def __init__(self, filepath, defaults={}, persist_delay=0):
         self._filepath = filepath
         self._config = defaults
         self._callbacks = {}
 
+        self._persist_delay = persist_delay
+        self._persist_timer = None
+        self._dirty = False
+        self._lock = threading.RLock()
+
+        if persist_delay > 0:
+            atexit.register(self.flush)
+
     def get(self, section, key, default=None):
         """
         Returns the value at section[key] or the default if not found.
@@ -62,12 +78,13 @@ class EasyConfig(object):
         Sets the value for the given section and key.
         Notifies any listeners bound to the same section and key.
         """
-        # add section if necessary
-        if section not in self._config:
-            self._config[section] = {}
+        with self._lock:
+            # add section if necessary
+            if section not in self._config:
+                self._config[section] = {}
 
-        # set value at key
-        self._config[section][key] = value
+            # set value at key
+            self._config[section][key] = value
 
         # notifies any listeners bound to this key
         if notify:
@@ -88,11 +105,69 @@ class EasyConfig(object):
 
     def persist(self):
         """
-        Writes the config to self._filepath using self._encode. Does
-        ZERO exception handling.
-        """
-        with open(self._filepath, 'w+') as f:
-            f.write(self._encode())
+        Writes the config to self._filepath using self._encode, or schedules
+        the write if persist_delay is set. Immediate writes do ZERO
+        exception handling.
+        """
+        if self._persist_delay <= 0:
+            self._write()
+            return
+
+        with self._lock:
+            self._dirty = True
+            if self._persist_timer is None:
+                self._persist_timer = threading.Timer(
+                                self._persist_delay, self._persistLater)
+                self._persist_timer.daemon = True
+                self._persist_timer.start()
+
+    def flush(self):
+        """
+        Writes any changes still waiting for persist_delay right away.
+        """
+        with self._lock:
+            if self._persist_timer is not None:
+                self._persist_timer.cancel()
+                self._persist_timer = None
+
+            if self._dirty:
+                self._write()
+
+    def _persistLater(self):
+        with self._lock:
+            self._persist_timer = None
+            if not self._dirty:
+                return
+            try:
+                self._write()
+            except (IOError, OSError) as e:
+                logging.error("Failed to save config %s: %s" % (
+                                                    self._filepath, str(e)))
+
+    def _write(self):
+        """
+        Writes the config to a temporary file next to self._filepath and
+        renames it into place, so a crash never leaves a truncated file.
+        """
+        with self._lock:
+            contents = self._encode()
+            self._dirty = False
+
+        temp_path = '%s.%d.tmp' % (self._filepath, os.getpid())
+        try:
+            with open(temp_path, 'w') as f:
+                f.write(contents)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self._filepath)
+        except:
+            with self._lock:
+                self._dirty = True
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
 
     def _encode(self):
         """
@@ -0,0 +1,305 @@
+"""
+FrameCatalog
+
+SQLite index of captured frames so picture-in-picture, rendering and
+video length estimates can find frames without listing and parsing
+folders. Captures are added as they are written, with the capture time,
+sequence number, resolution, format and size known at capture time.
+
+Each folder's modification time is stored when it is synced. A folder
+that has changed since is synced from disk the next time it is queried -
+new files are added with what their names tell us and missing files are
+removed. addFrame only moves the stored time forward past a write when
+the folder had not changed since it was synced, so captures do not cause
+a rescan but files added or deleted by other programs are never missed.
+rebuild() rescans a folder completely, including reading each image's
+resolution.
+
+Frame counts are kept per folder and updated by addFrame, so counting
+a folder that is being captured does not touch the disk or the table.
+
+Added frames are committed in batches of commit_every, or once
+commit_interval seconds have passed, so fast captures do not wait on a
+disk sync per frame. flush() and close() commit the rest.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from PIL import Image
+
+from framematcher import buildFrames, parseFrameName
+
+CATALOG_FILENAME = 'chronolapse_catalog.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    source TEXT,
+    capture_time REAL,
+    sequence INTEGER,
+    width INTEGER,
+    height INTEGER,
+    format TEXT,
+    bytes INTEGER
+);
+CREATE INDEX IF NOT EXISTS frames_folder ON frames (folder);
+CREATE TABLE IF NOT EXISTS folders (
+    folder TEXT PRIMARY KEY,
+    mtime_ns INTEGER
+);
+"""
+
+
+class FrameCatalog(object):
+    """
+    Frames in capture folders, keyed on their absolute paths. Safe to use
+    from several threads.
+
+    Example:
+        catalog = FrameCatalog('chronolapse_catalog.sqlite',
+                                '%Y-%m-%d_%H-%M-%S', ('.jpg', '.png'))
+        catalog.addFrame('screenshots/screen_00001.jpg', 'screen',
+                            capture_time=time.time(), sequence=1)
+        catalog.count('screenshots')
+    """
+
+    def __init__(self, dbpath, timestamp_format, extensions,
+                    commit_every=100, commit_interval=2.0):
+        self.dbpath = dbpath
+        self.timestamp_format = timestamp_format
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.commit_every = max(1, int(commit_every))
+        self.commit_interval = commit_interval
+
+        # folder -> number of frames, kept up to date by addFrame so
+        # counting a folder that is being captured costs nothing
+        self._counts = {}
+
+        # frames added since the last commit
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(dbpath, check_same_thread=False)
+        with self._lock:
+            self._db.executescript(SCHEMA)
+            self._commit()
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._db.close()
+
+    def flush(self):
+        """
+        Commits frames added since the last commit.
+        """
+        with self._lock:
+            if self._pending:
+                self._commit()
+
+    def _commit(self):
+        # called with the lock held
+        self._db.commit()
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+    def isFrame(self, filename):
+        return (not filename.startswith('.') and
+                os.path.splitext(filename)[1].lower() in self.extensions)
+
+    def addFrame(self, path, source=None, capture_time=None, sequence=None,
+                    width=None, height=None, size=None, folder_mtimes=None):
+        """
+        Adds or replaces the row for a frame just written to path. size is
+        the file size in bytes and is read from disk if not given.
+        folder_mtimes is the folder's (before, after) st_mtime_ns around
+        the write - if before is the stored time, nothing else changed the
+        folder and it is marked as synced at after.
+        """
+        path = os.path.abspath(path)
+        folder = os.path.dirname(path)
+        file_format = os.path.splitext(path)[1].lower().lstrip('.')
+
+        if size is None:
+            try:
+                size = os.path.getsize(path)
+            except OSError as e:
+                logging.debug("Not cataloging %s: %s" % (path, repr(e)))
+                return
+
+        with self._lock:
+            if folder in self._counts and self._db.execute(
+                    'SELECT 1 FROM frames WHERE path = ?',
+                    (path,)).fetchone() is None:
+                self._counts[folder] += 1
+
+            self._db.execute(
+                'INSERT OR REPLACE INTO frames VALUES (?,?,?,?,?,?,?,?,?)',
+                (path, folder, source, capture_time, sequence,
+                    width, height, file_format, size))
+
+            # otherwise the folder's mtime is left for sync, which also
+            # sees what other programs changed since
+            if folder_mtimes is not None and None not in folder_mtimes:
+                self._db.execute(
+                    'UPDATE folders SET mtime_ns = ? '
+                    'WHERE folder = ? AND mtime_ns = ?',
+                    (folder_mtimes[1], folder, folder_mtimes[0]))
+
+            self._pending += 1
+            if (self._pending >= self.commit_every or
+                time.monotonic() - self._last_commit >= self.commit_interval):
+                self._commit()
+
+    def sync(self, folder):
+        """
+        Brings the rows for folder up to date with the disk if the folder
+        has changed since it was last seen. Returns False if the folder
+        cannot be read.
+        """
+        folder = os.path.abspath(folder)
+        try:
+            mtime = os.stat(folder).st_mtime_ns
+        except OSError:
+            return False
+
+        with self._lock:
+            row = self._db.execute(
+                'SELECT mtime_ns FROM folders WHERE folder = ?',
+                (folder,)).fetchone()
+        if row is not None and row[0] == mtime:
+            return True
+
+        try:
+            paths = set(os.path.join(folder, entry.name)
+                        for entry in os.scandir(folder)
+                        if self.isFrame(entry.name) and entry.is_file())
+        except OSError:
+            return False
+
+        with self._lock:
+            known = set(path for path, in self._db.execute(
+                        'SELECT path FROM frames WHERE folder = ?', (folder,)))
+
+            removed = known - paths
+            added = []
+            for path in paths - known:
+                sequence, capture_time = parseFrameName(
+                        os.path.splitext(os.path.basename(path))[0],
+                        self.timestamp_format)
+                file_format = os.path.splitext(path)[1].lower().lstrip('.')
+                added.append((path, folder, None, capture_time, sequence,
+                                None, None, file_format, None))
+
+            # recounted on the next count - another process sharing the
+            # catalog may have added rows for this folder already
+            self._counts.pop(folder, None)
+
+            self._db.executemany('DELETE FROM frames WHERE path = ?',
+                                    [(path,) for path in removed])
+            self._db.executemany(
+                'INSERT INTO frames VALUES (?,?,?,?,?,?,?,?,?)', added)
+            self._db.execute(
+                'INSERT OR REPLACE INTO folders VALUES (?, ?)',
+                (folder, mtime))
+            self._commit()
+
+        logging.debug("Synced catalog for %s: %d added, %d removed" % (
+                                    folder, len(added), len(removed)))
+        return True
+
+    def rebuild(self, folder, source=None, progress=None):
+        """
+        Replaces every row for folder with a fresh scan of the disk,
+        reading each image's resolution and size. progress is called with
+        (count, total) as files are read. Returns the number of frames.
+        """
+        folder = os.path.abspath(folder)
+        mtime = os.stat(folder).st_mtime_ns
+
+        paths = sorted(os.path.join(folder, entry.name)
+                        for entry in os.scandir(folder)
+                        if self.isFrame(entry.name) and entry.is_file())
+
+        rows = []
+        for count, path in enumerate(paths, 1):
+            sequence, capture_time = parseFrameName(
+                        os.path.splitext(os.path.basename(path))[0],
+                        self.timestamp_format)
+
+            # PIL only reads the header to get the size
+            width = height = None
+            try:
+                with Image.open(path) as image:
+                    width, height = image.size
+            except Exception as e:
+                logging.debug("Could not read %s: %s" % (path, repr(e)))
+
+            rows.append((path, folder, source, capture_time, sequence,
+                            width, height,
+                            os.path.splitext(path)[1].lower().lstrip('.'),
+                            os.path.getsize(path)))
+
+            if progress is not None:
+                progress(count, len(paths))
+
+        with self._lock:
+            self._counts[folder] = len(rows)
+            self._db.execute('DELETE FROM frames WHERE folder = ?', (folder,))
+            self._db.executemany(
+                'INSERT INTO frames VALUES (?,?,?,?,?,?,?,?,?)', rows)
+            self._db.execute(
+                'INSERT OR REPLACE INTO folders VALUES (?, ?)',
+                (folder, mtime))
+            self._commit()
+
+        return len(rows)
+
+    def count(self, folder):
+        """
+        Returns the number of frames in folder, or 0 if it cannot be read.
+        """
+        if not self.sync(folder):
+            return 0
+
+        folder = os.path.abspath(folder)
+        with self._lock:
+            if folder not in self._counts:
+                self._counts[folder] = self._db.execute(
+                    'SELECT COUNT(*) FROM frames WHERE folder = ?',
+                    (folder,)).fetchone()[0]
+            return self._counts[folder]
+
+    def frames(self, folder, use_sequence=True):
+        """
+        Returns the Frames in folder sorted by key, like
+        framematcher.loadFrames.
+        """
+        if not self.sync(folder):
+            return []
+
+        with self._lock:
+            entries = self._db.execute(
+                'SELECT path, sequence, capture_time FROM frames '
+                'WHERE folder = ?', (os.path.abspath(folder),)).fetchall()
+
+        return buildFrames(entries, use_sequence)
+
+    def captureTimes(self, folder):
+        """
+        Returns {path: capture_time} for the frames in folder, with None
+        where the capture time is unknown.
+        """
+        if not self.sync(folder):
+            return {}
+
+        with self._lock:
+            return dict(self._db.execute(
+                'SELECT path, capture_time FROM frames WHERE folder = ?',
+                (os.path.abspath(folder),)).fetchall())
@@ -0,0 +1,163 @@
+"""
+FrameMatcher
+
+Pairs up frames from two capture folders, like the screenshots and webcam
+captures used for picture-in-picture, by when they were captured instead
+of by their position in a sorted listing. A dropped frame in one folder
+only loses that one pair instead of shifting every pair after it.
+"""
+
+import datetime
+import os
+import re
+import time
+
+# str(time.time()) filenames used for sub-second captures
+EPOCH_PATTERN = re.compile(r'(\d{9,}(?:\.\d+)?)$')
+
+# sequential filenames like screen_00042
+SEQUENCE_PATTERN = re.compile(r'^\D*(\d+)$')
+
+# suffix added to timestamp filenames repeated within the same second
+REPEAT_PATTERN = re.compile(r'_\d+$')
+
+
+class Frame(object):
+    """
+    A captured image and the key it is matched on. kind is 'sequence' if
+    key is a sequence number and 'time' if it is a unix timestamp.
+    capture_time is the unix time of the capture, or None if unknown.
+    """
+
+    def __init__(self, path, kind, key, capture_time=None):
+        self.path = path
+        self.kind = kind
+        self.key = key
+        self.capture_time = capture_time
+
+    def __repr__(self):
+        return 'Frame(%r, %r, %r)' % (self.path, self.kind, self.key)
+
+
+def parseCaptureTime(base, timestamp_format):
+    """
+    Returns the unix time encoded in a filename without its extension, or
+    None. The prefix is unknown, so the timestamp is taken from the first
+    digit on. A repeat suffix like _1 is ignored.
+    """
+    match = EPOCH_PATTERN.search(base)
+    if match:
+        return float(match.group(1))
+
+    names = [base]
+    repeated = REPEAT_PATTERN.sub('', base)
+    if repeated != base:
+        names.append(repeated)
+
+    for name in names:
+        for i, character in enumerate(name):
+            if character.isdigit():
+                try:
+                    parsed = datetime.datetime.strptime(
+                                            name[i:], timestamp_format)
+                    return time.mktime(parsed.timetuple())
+                except ValueError:
+                    pass
+
+    return None
+
+
+def parseFrameName(base, timestamp_format):
+    """
+    Returns (sequence, capture_time) for a filename without its extension.
+    Either is None if the name does not hold one.
+    """
+    match = EPOCH_PATTERN.search(base)
+    if match:
+        return None, float(match.group(1))
+
+    sequence = None
+    match = SEQUENCE_PATTERN.search(base)
+    if match:
+        sequence = int(match.group(1))
+
+    return sequence, parseCaptureTime(base, timestamp_format)
+
+
+def buildFrames(entries, use_sequence=True):
+    """
+    Returns Frames for (path, sequence, capture_time) entries, sorted by
+    key. Frames are keyed on sequence numbers if use_sequence is True and
+    every entry has one, otherwise on the capture time, falling back to
+    the file's mtime.
+    """
+    if use_sequence and entries and all(
+                    sequence is not None for path, sequence, t in entries):
+        frames = [Frame(path, 'sequence', sequence, capture_time)
+                    for path, sequence, capture_time in entries]
+
+    else:
+        frames = []
+        for path, sequence, capture_time in entries:
+            if capture_time is None:
+                capture_time = os.path.getmtime(path)
+            frames.append(Frame(path, 'time', capture_time, capture_time))
+
+    frames.sort(key=lambda frame: (frame.key, frame.path))
+    return frames
+
+
+def loadFrames(folder, timestamp_format='%Y-%m-%d_%H-%M-%S',
+                    use_sequence=True):
+    """
+    Returns a Frame for every file in folder, sorted by key. See
+    buildFrames for how frames are keyed.
+    """
+    entries = []
+    for filename in os.listdir(folder):
+        path = os.path.join(folder, filename)
+        if filename.startswith('.') or not os.path.isfile(path):
+            continue
+
+        sequence, capture_time = parseFrameName(
+                    os.path.splitext(filename)[0], timestamp_format)
+        entries.append((path, sequence, capture_time))
+
+    return buildFrames(entries, use_sequence)
+
+
+def matchFrames(main_frames, pip_frames, tolerance=1.0):
+    """
+    Merges two sorted lists of Frames in a single pass and returns
+    (main_frame, pip_frame) pairs in main frame order. pip_frame is None
+    if no unused pip frame is within tolerance seconds of the main frame.
+    Sequence numbered frames only match the same number, so both lists
+    must be keyed the same way.
+    """
+    if main_frames and main_frames[0].kind == 'sequence':
+        tolerance = 0
+
+    pairs = []
+    j = 0
+    for main_frame in main_frames:
+        key = main_frame.key
+
+        # skip pip frames that are too early for this or any later frame
+        while j < len(pip_frames) and pip_frames[j].key < key - tolerance:
+            j += 1
+
+        # walk forward while the next pip frame is closer
+        k = j
+        while (k + 1 < len(pip_frames) and
+                abs(pip_frames[k + 1].key - key) < abs(pip_frames[k].key - key)):
+            k += 1
+
+        if k < len(pip_frames) and abs(pip_frames[k].key - key) <= tolerance:
+            pairs.append((main_frame, pip_frames[k]))
+
+            # each pip frame is only used once
+            j = k + 1
+        else:
+            pairs.append((main_frame, None))
+
+    return pairs
@@ -0,0 +1,100 @@
+"""
+FrameSelection
+
+Chooses which captured frames go into a video, so a long archive can be
+rendered as a short summary. Only the frame list and capture times are
+looked at - frames that are left out are never read or decoded, so the
+encode shrinks with the selection.
+
+    'all'      - every frame
+    'every'    - every Nth frame
+    'duration' - evenly spaced frames for a video of a target length at
+                 the render frame rate, first and last frame included
+    'interval' - the first frame captured in each interval of seconds
+"""
+
+FRAME_SELECTIONS = ('all', 'every', 'duration', 'interval')
+
+
+def everyNth(count, step):
+    """
+    Returns the indexes of every step-th of count frames.
+    """
+    return list(range(0, count, step))
+
+
+def evenlySpaced(count, wanted):
+    """
+    Returns wanted indexes spread evenly over count frames, including
+    the first and last frame.
+    """
+    if wanted >= count:
+        return list(range(count))
+    if wanted == 1:
+        return [0]
+    return [(i * (count - 1)) // (wanted - 1) for i in range(wanted)]
+
+
+def byInterval(times, interval):
+    """
+    Returns the indexes of the first frame at or after each interval
+    seconds from the first capture time. Intervals without captures,
+    like nights, are skipped rather than filled.
+    """
+    indexes = []
+    start = None
+    next_time = None
+
+    for index, capture_time in enumerate(times):
+        if capture_time is None:
+            continue
+
+        if start is None:
+            start = capture_time
+            next_time = capture_time
+
+        if capture_time >= next_time:
+            indexes.append(index)
+            intervals = int((capture_time - start) // interval) + 1
+            next_time = start + intervals * interval
+
+    return indexes
+
+
+def selectFrames(frames, selection='all', step=1, duration=0, fps=1,
+                    interval=0, times=None):
+    """
+    Returns the frames to render, in order.
+
+    frames is the full list in capture order. step is N for 'every',
+    duration the target seconds at fps frames per second for 'duration'
+    and interval the seconds between samples for 'interval', where times
+    is a function returning the capture times of frames. Raises
+    ValueError for an unknown selection or invalid parameters.
+    """
+    if selection not in FRAME_SELECTIONS:
+        raise ValueError("Unknown frame selection %s" % selection)
+
+    if selection == 'all' or not frames:
+        return list(frames)
+
+    if selection == 'every':
+        step = int(step)
+        if step < 1:
+            raise ValueError("The frame step must be at least 1")
+        indexes = everyNth(len(frames), step)
+
+    elif selection == 'duration':
+        wanted = int(float(duration) * float(fps))
+        if wanted < 1:
+            raise ValueError("The target duration is too short for a "
+                             "single frame")
+        indexes = evenlySpaced(len(frames), wanted)
+
+    else:
+        interval = float(interval)
+        if interval <= 0:
+            raise ValueError("The sample interval must be positive")
+        indexes = byInterval(times(frames), interval)
+
+    return [frames[index] for index in indexes]
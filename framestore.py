@@ -0,0 +1,332 @@
+"""
+FrameStore
+
+Append-only container for high rate captures. Writing one image file per
+frame leaves millions of small files that slow down every listing of the
+folder, so instead encoded frames are appended back to back to large
+segment files and an index records where each one is:
+
+    frames.idx          one record per frame - segment, offset, length,
+                        capture time, sequence, width, height and the
+                        file name the frame would have had
+    frames_00000.seg    encoded frames, a new segment is started once the
+    frames_00001.seg    current one reaches segment_size bytes
+    ...
+
+Frames keep the format they were encoded in, so a png store is lossless.
+A frame's bytes are written before its index record and a partial
+record left by a crash is dropped, so the store never points at data
+that was not written. Segments are read through mmap. A store that is
+only being read picks up records appended by another process, like a
+command line capture, whenever its frames are listed or counted.
+"""
+
+import logging
+import mmap
+import os
+import struct
+import threading
+
+INDEX_FILENAME = 'frames.idx'
+SEGMENT_FILENAME = 'frames_%05d.seg'
+
+# segment, offset, length, capture_time, sequence, width, height and the
+# length of the name that follows
+INDEX_RECORD = struct.Struct('<IQIdqIIH')
+
+# sequence of frames captured without one
+NO_SEQUENCE = -1
+
+DEFAULT_SEGMENT_SIZE = 256 * 1024 * 1024
+
+
+def hasFrameStore(folder):
+    """
+    Returns True if folder holds a frame store.
+    """
+    return os.path.isfile(os.path.join(folder, INDEX_FILENAME))
+
+
+class StoredFrame(object):
+    """
+    A frame in a FrameStore. path is where the frame would have been
+    written as a file - it is only used for its name and extension.
+    """
+
+    def __init__(self, store, segment, offset, length, name,
+                    capture_time, sequence=None, width=0, height=0):
+        self.store = store
+        self.segment = segment
+        self.offset = offset
+        self.length = length
+        self.name = name
+        self.capture_time = capture_time
+        self.sequence = sequence
+        self.width = width
+        self.height = height
+
+    @property
+    def path(self):
+        return os.path.join(self.store.folder, self.name)
+
+    def read(self):
+        """
+        Returns the encoded frame.
+        """
+        return self.store.read(self)
+
+    def __repr__(self):
+        return 'StoredFrame(%r, %d, %d)' % (
+                                    self.name, self.segment, self.offset)
+
+
+class FrameStore(object):
+    """
+    Frames of one capture folder packed into segment files. Safe to
+    append to from several threads.
+
+    Example:
+        store = FrameStore('screenshots')
+        store.append('screen_00001.jpg', data, capture_time=time.time(),
+                        sequence=1)
+        for frame in store.frames():
+            image = frame.read()
+        store.close()
+    """
+
+    def __init__(self, folder, segment_size=DEFAULT_SEGMENT_SIZE):
+        self.folder = folder
+        self.segment_size = max(1, int(segment_size))
+
+        self._lock = threading.Lock()
+        self._frames = []
+        self._index = None
+        self._segment = None
+        self._segment_number = 0
+        self._maps = {}
+
+        self._valid_index_size = self.load()
+
+    def matches(self, folder, segment_size):
+        return (os.path.abspath(self.folder) == os.path.abspath(folder) and
+                self.segment_size == segment_size)
+
+    def segmentPath(self, segment):
+        return os.path.join(self.folder, SEGMENT_FILENAME % segment)
+
+    def indexPath(self):
+        return os.path.join(self.folder, INDEX_FILENAME)
+
+    def load(self, start=0):
+        """
+        Reads the index records from byte start on. Returns the size of
+        the index up to the end of its last complete record.
+        """
+        path = self.indexPath()
+        if not os.path.exists(path):
+            return start
+
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = f.read()
+
+        position = 0
+        while position + INDEX_RECORD.size <= len(data):
+            (segment, offset, length, capture_time, sequence, width, height,
+                name_length) = INDEX_RECORD.unpack_from(data, position)
+
+            end = position + INDEX_RECORD.size + name_length
+            if end > len(data):
+                break
+            name = data[position + INDEX_RECORD.size:end].decode('utf-8')
+
+            if sequence == NO_SEQUENCE:
+                sequence = None
+            self._frames.append(StoredFrame(self, segment, offset, length,
+                        name, capture_time, sequence, width, height))
+            self._segment_number = max(self._segment_number, segment)
+            position = end
+
+        # while refreshing, another process may be halfway through a record
+        if position != len(data) and start == 0:
+            logging.warning("Ignoring partial record at the end of %s" % path)
+        return start + position
+
+    def refresh(self):
+        """
+        Reads records another process has appended since the index was
+        last read. Does nothing while this store is appending.
+        """
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        # called with the lock held
+        if self._index is not None:
+            return
+
+        try:
+            size = os.path.getsize(self.indexPath())
+        except OSError:
+            size = 0
+
+        if size == self._valid_index_size:
+            return
+
+        if size < self._valid_index_size:
+            # the store was replaced - start over
+            self._frames = []
+            self._segment_number = 0
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps = {}
+            self._valid_index_size = self.load()
+        else:
+            self._valid_index_size = self.load(self._valid_index_size)
+
+    def openForAppend(self):
+        if self._index is not None:
+            return
+
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+
+        # never truncate records another process appended
+        self._refresh()
+
+        self._index = open(self.indexPath(), 'ab')
+
+        # cut off a record a crash left half written
+        if self._index.tell() != self._valid_index_size:
+            self._index.truncate(self._valid_index_size)
+            self._index.seek(self._valid_index_size)
+
+        self._segment = open(self.segmentPath(self._segment_number), 'ab')
+
+    def nextSegment(self):
+        self._segment.close()
+        self._segment_number += 1
+        self._segment = open(self.segmentPath(self._segment_number), 'ab')
+
+    def append(self, name, data, capture_time, sequence=None,
+                width=0, height=0):
+        """
+        Appends an encoded frame and returns its StoredFrame. name is the
+        file name it is exported as.
+        """
+        with self._lock:
+            self.openForAppend()
+
+            if (self._segment.tell() > 0 and
+                self._segment.tell() + len(data) > self.segment_size):
+                self.nextSegment()
+
+            offset = self._segment.tell()
+            self._segment.write(data)
+            self._segment.flush()
+
+            return self.addRecord(StoredFrame(self, self._segment_number,
+                        offset, len(data), name, capture_time, sequence,
+                        width, height))
+
+    def link(self, name, frame, capture_time, sequence=None):
+        """
+        Adds a frame that shares the bytes of an earlier stored frame.
+        """
+        with self._lock:
+            self.openForAppend()
+            return self.addRecord(StoredFrame(self, frame.segment,
+                        frame.offset, frame.length, name, capture_time,
+                        sequence, frame.width, frame.height))
+
+    def addRecord(self, frame):
+        encoded_name = frame.name.encode('utf-8')
+        sequence = frame.sequence
+        if sequence is None:
+            sequence = NO_SEQUENCE
+
+        self._index.write(INDEX_RECORD.pack(frame.segment, frame.offset,
+                    frame.length, frame.capture_time, sequence,
+                    frame.width or 0, frame.height or 0, len(encoded_name)))
+        self._index.write(encoded_name)
+        self._index.flush()
+
+        self._frames.append(frame)
+        return frame
+
+    def count(self):
+        with self._lock:
+            self._refresh()
+            return len(self._frames)
+
+    def frames(self, use_sequence=True):
+        """
+        Returns the StoredFrames in capture order - by sequence number if
+        use_sequence is True and every frame has one, otherwise by capture
+        time.
+        """
+        with self._lock:
+            self._refresh()
+            frames = list(self._frames)
+
+        if use_sequence and all(f.sequence is not None for f in frames):
+            frames.sort(key=lambda f: (f.sequence, f.name))
+        else:
+            frames.sort(key=lambda f: (f.capture_time, f.name))
+        return frames
+
+    def read(self, frame):
+        """
+        Returns the encoded bytes of frame.
+        """
+        end = frame.offset + frame.length
+
+        with self._lock:
+            mapped = self._maps.get(frame.segment)
+
+            # the segment may have grown since it was mapped
+            if mapped is None or len(mapped) < end:
+                if mapped is not None:
+                    mapped.close()
+                with open(self.segmentPath(frame.segment), 'rb') as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[frame.segment] = mapped
+
+            if len(mapped) < end:
+                raise IOError("%s is truncated" % self.segmentPath(
+                                                            frame.segment))
+            return mapped[frame.offset:end]
+
+    def export(self, folder, progress=None):
+        """
+        Writes every frame to folder as an image file under its name.
+        progress is called with (count, total) and may return False to
+        stop. Returns the number of files written.
+        """
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        frames = self.frames()
+        for count, frame in enumerate(frames, 1):
+            with open(os.path.join(folder, frame.name), 'wb') as f:
+                f.write(frame.read())
+
+            if progress is not None and progress(count, len(frames)) is False:
+                return count
+
+        return len(frames)
+
+    def close(self):
+        with self._lock:
+            if self._index is not None:
+                self._valid_index_size = self._index.tell()
+
+            for handle in (self._segment, self._index):
+                if handle is not None:
+                    handle.close()
+            self._segment = None
+            self._index = None
+
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps = {}
@@ -0,0 +1,246 @@
+"""
+IdleDetector
+
+Reports how long the user has been idle so captures can be skipped while
+nobody is at the computer.
+
+    'windows'      - GetLastInputInfo through win32api
+    'xscreensaver' - the X11 MIT-SCREEN-SAVER extension's idle time
+    'interrupts'   - keyboard and mouse interrupt counts in
+                     /proc/interrupts, sampled on every check
+    'framediff'    - how long the screen has looked the same, for when
+                     nothing else is available
+
+'auto' picks the first that works in that order.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import re
+import sys
+import time
+
+can_use_win32 = False
+try:
+    import win32api
+    can_use_win32 = True
+except ImportError:
+    pass
+
+
+IDLE_BACKENDS = ('auto', 'windows', 'xscreensaver', 'interrupts',
+                    'framediff')
+
+# /proc/interrupts lines for keyboards, mice and touchpads
+INPUT_INTERRUPT_PATTERN = re.compile(
+    r'i8042|keyboard|kbd|mouse|touchpad|trackpad|i2c.?hid|elan|synaptics',
+    re.IGNORECASE)
+
+
+class IdleDetector(object):
+    """
+    Base class for idle detection backends.
+    """
+
+    name = None
+
+    def idleSeconds(self):
+        """
+        Returns the seconds since the last user input, or None if unknown.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class WindowsIdleDetector(IdleDetector):
+
+    name = 'windows'
+
+    def idleSeconds(self):
+        # both in milliseconds since boot, wrapping after 49.7 days
+        elapsed = (win32api.GetTickCount() - win32api.GetLastInputInfo())
+        return (elapsed & 0xFFFFFFFF) / 1000.0
+
+
+class XScreenSaverInfo(ctypes.Structure):
+    _fields_ = [
+        ('window', ctypes.c_ulong),
+        ('state', ctypes.c_int),
+        ('kind', ctypes.c_int),
+        ('til_or_since', ctypes.c_ulong),
+        ('idle', ctypes.c_ulong),
+        ('eventMask', ctypes.c_ulong),
+    ]
+
+
+class XScreenSaverIdleDetector(IdleDetector):
+    """
+    Asks the X server how long since the last input through libXss.
+    Raises OSError if there is no display or the extension is missing.
+    """
+
+    name = 'xscreensaver'
+
+    def __init__(self):
+        xlib_path = ctypes.util.find_library('X11')
+        xss_path = ctypes.util.find_library('Xss')
+        if not xlib_path or not xss_path:
+            raise OSError("libX11 or libXss not found")
+
+        self.xlib = ctypes.cdll.LoadLibrary(xlib_path)
+        self.xss = ctypes.cdll.LoadLibrary(xss_path)
+
+        self.xlib.XOpenDisplay.restype = ctypes.c_void_p
+        self.xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        self.xlib.XDefaultRootWindow.restype = ctypes.c_ulong
+        self.xlib.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        self.xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        self.xlib.XFree.argtypes = [ctypes.c_void_p]
+        self.xss.XScreenSaverQueryExtension.argtypes = [ctypes.c_void_p,
+                    ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int)]
+        self.xss.XScreenSaverAllocInfo.restype = \
+                    ctypes.POINTER(XScreenSaverInfo)
+        self.xss.XScreenSaverQueryInfo.argtypes = [ctypes.c_void_p,
+                    ctypes.c_ulong, ctypes.POINTER(XScreenSaverInfo)]
+
+        self.display = self.xlib.XOpenDisplay(None)
+        if not self.display:
+            raise OSError("Cannot open X display")
+
+        event_base = ctypes.c_int()
+        error_base = ctypes.c_int()
+        if not self.xss.XScreenSaverQueryExtension(self.display,
+                    ctypes.byref(event_base), ctypes.byref(error_base)):
+            self.close()
+            raise OSError("X server has no MIT-SCREEN-SAVER extension")
+
+        self.root = self.xlib.XDefaultRootWindow(self.display)
+        self.info = self.xss.XScreenSaverAllocInfo()
+
+    def idleSeconds(self):
+        if not self.xss.XScreenSaverQueryInfo(
+                                    self.display, self.root, self.info):
+            return None
+        return self.info.contents.idle / 1000.0
+
+    def close(self):
+        if getattr(self, 'info', None):
+            self.xlib.XFree(self.info)
+            self.info = None
+        if self.display:
+            self.xlib.XCloseDisplay(self.display)
+            self.display = None
+
+
+class InterruptsIdleDetector(IdleDetector):
+    """
+    Watches the interrupt counts of input devices in /proc/interrupts. Idle
+    time is measured from the check that first saw the counts change, so
+    it is only as precise as the checks are frequent. Raises OSError if
+    no input device interrupts are listed.
+    """
+
+    name = 'interrupts'
+
+    def __init__(self, path='/proc/interrupts', clock=time.monotonic):
+        self.path = path
+        self.clock = clock
+
+        self.last_count = self.readCount()
+        if self.last_count is None:
+            raise OSError("No input device interrupts in %s" % path)
+        self.last_activity = self.clock()
+
+    def readCount(self):
+        """
+        Returns the total interrupts of input devices, or None if none are
+        listed.
+        """
+        total = None
+        with open(self.path) as f:
+            for line in f:
+                if not INPUT_INTERRUPT_PATTERN.search(line):
+                    continue
+
+                counts = line.split(':', 1)[-1].split()
+                for count in counts:
+                    if not count.isdigit():
+                        break
+                    total = (total or 0) + int(count)
+        return total
+
+    def idleSeconds(self):
+        count = self.readCount()
+        now = self.clock()
+        if count != self.last_count:
+            self.last_count = count
+            self.last_activity = now
+        return now - self.last_activity
+
+
+class FrameDiffIdleDetector(IdleDetector):
+    """
+    Treats the user as idle while the screen does not change. probe
+    returns a CapturedFrame-like object with image and channel_order,
+    detector is a ChangeDetector.
+    """
+
+    name = 'framediff'
+
+    def __init__(self, probe, detector, clock=time.monotonic):
+        self.probe = probe
+        self.detector = detector
+        self.clock = clock
+        self.last_change = self.clock()
+
+    def idleSeconds(self):
+        try:
+            frame = self.probe()
+        except Exception as e:
+            logging.debug("Idle probe failed: %s" % repr(e))
+            return None
+
+        if frame is None:
+            return None
+
+        now = self.clock()
+        if self.detector.check(frame) is None:
+            self.last_change = now
+        return now - self.last_change
+
+
+def createIdleDetector(backend='auto', probe=None, detector=None):
+    """
+    Returns an IdleDetector for backend, or None if it is not available.
+    'auto' tries every backend in order. probe and detector are needed
+    for 'framediff', see FrameDiffIdleDetector.
+    """
+    if backend not in IDLE_BACKENDS:
+        logging.warning("Unknown idle backend %s - using auto" % backend)
+        backend = 'auto'
+
+    if backend in ('auto', 'windows') and can_use_win32:
+        return WindowsIdleDetector()
+
+    if backend in ('auto', 'xscreensaver') and sys.platform.startswith(
+                                                            'linux'):
+        try:
+            return XScreenSaverIdleDetector()
+        except (OSError, AttributeError) as e:
+            logging.debug("XScreenSaver idle time unavailable: %s" % e)
+
+    if backend in ('auto', 'interrupts') and os.path.exists(
+                                                    '/proc/interrupts'):
+        try:
+            return InterruptsIdleDetector()
+        except (OSError, IOError) as e:
+            logging.debug("Interrupt idle time unavailable: %s" % e)
+
+    if backend in ('auto', 'framediff') and probe is not None:
+        return FrameDiffIdleDetector(probe, detector)
+
+    return None
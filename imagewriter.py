@@ -0,0 +1,206 @@
+"""
+ImageWriter
+
+Encodes captured frames with one encoder per image format, using the
+options configured for the capture source:
+
+    jpg  - simplejpeg (libjpeg-turbo) if installed, otherwise OpenCV, with
+           jpeg_quality (1-100) and jpeg_subsampling ('444', '422', '420')
+    png  - OpenCV with png_compression (0 fastest - 9 smallest)
+    webp - OpenCV with webp_quality (1-100, above 100 is lossless)
+    gif  - PIL
+    bmp  - OpenCV
+
+Encoders take frames in 'rgb', 'bgr' or 'bgra' channel order and only
+convert when the library needs another order, so simplejpeg encodes mss
+screen grabs without any copy. Each write reports the encode time and
+the bytes written.
+"""
+
+import io
+import logging
+import time
+
+import cv2
+import numpy
+from PIL import Image
+
+can_use_simplejpeg = False
+try:
+    import simplejpeg
+    can_use_simplejpeg = True
+except ImportError:
+    pass
+
+
+IMAGE_FORMATS = ('jpg', 'png', 'webp', 'gif', 'bmp')
+
+JPEG_SUBSAMPLINGS = {
+    '444': cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444,
+    '422': cv2.IMWRITE_JPEG_SAMPLING_FACTOR_422,
+    '420': cv2.IMWRITE_JPEG_SAMPLING_FACTOR_420,
+}
+
+CONVERSIONS = {
+    ('bgra', 'bgr'): cv2.COLOR_BGRA2BGR,
+    ('bgra', 'rgb'): cv2.COLOR_BGRA2RGB,
+    ('bgr', 'rgb'): cv2.COLOR_BGR2RGB,
+    ('rgb', 'bgr'): cv2.COLOR_RGB2BGR,
+}
+
+
+def convertImage(image, channel_order, wanted):
+    """
+    Returns image in the wanted channel order, image itself if it already
+    is.
+    """
+    if channel_order == wanted:
+        return image
+    return cv2.cvtColor(image, CONVERSIONS[(channel_order, wanted)])
+
+
+def clamp(value, low, high, default):
+    try:
+        return min(high, max(low, int(value)))
+    except (TypeError, ValueError):
+        return default
+
+
+class ImageEncoder(object):
+    """
+    Base class for image format encoders. encode returns the file's bytes.
+    """
+
+    name = None
+
+    def encode(self, image, channel_order='rgb'):
+        raise NotImplementedError
+
+
+class OpenCVEncoder(ImageEncoder):
+    """
+    Encodes with cv2.imencode for extension with the given imwrite params.
+    """
+
+    def __init__(self, extension, params=()):
+        self.name = 'opencv'
+        self.extension = extension
+        self.params = list(params)
+
+    def encode(self, image, channel_order='rgb'):
+        image = convertImage(image, channel_order, 'bgr')
+        result, data = cv2.imencode(self.extension, image, self.params)
+        if not result:
+            raise IOError("OpenCV could not encode %s" % self.extension)
+        return data.tobytes()
+
+
+class SimpleJpegEncoder(ImageEncoder):
+
+    name = 'simplejpeg'
+
+    def __init__(self, quality, subsampling):
+        self.quality = quality
+        self.subsampling = subsampling
+
+    def encode(self, image, channel_order='rgb'):
+        return simplejpeg.encode_jpeg(
+                    numpy.ascontiguousarray(image), self.quality,
+                    colorspace=channel_order.upper(),
+                    colorsubsampling=self.subsampling)
+
+
+class PilEncoder(ImageEncoder):
+
+    name = 'pil'
+
+    def __init__(self, pil_format):
+        self.pil_format = pil_format
+
+    def encode(self, image, channel_order='rgb'):
+        output = io.BytesIO()
+        Image.fromarray(convertImage(image, channel_order, 'rgb')).save(
+                                                output, self.pil_format)
+        return output.getvalue()
+
+
+class ImageWriter(object):
+    """
+    Encodes and writes frames of one capture source. Options that are
+    missing or invalid fall back to the defaults.
+
+    Example:
+        writer = ImageWriter(jpeg_quality=80, png_compression=1)
+        size, seconds = writer.write(image, 'bgr', 'webcam/cam_1.jpg')
+    """
+
+    OPTIONS = ('jpeg_quality', 'jpeg_subsampling', 'png_compression',
+                'webp_quality')
+
+    def __init__(self, jpeg_quality=90, jpeg_subsampling='420',
+                    png_compression=3, webp_quality=90):
+        self.options = (jpeg_quality, jpeg_subsampling, png_compression,
+                            webp_quality)
+
+        jpeg_quality = clamp(jpeg_quality, 1, 100, 90)
+        jpeg_subsampling = str(jpeg_subsampling)
+        if jpeg_subsampling not in JPEG_SUBSAMPLINGS:
+            jpeg_subsampling = '420'
+
+        if can_use_simplejpeg:
+            jpeg = SimpleJpegEncoder(jpeg_quality, jpeg_subsampling)
+        else:
+            jpeg = OpenCVEncoder('.jpg', [
+                cv2.IMWRITE_JPEG_QUALITY, jpeg_quality,
+                cv2.IMWRITE_JPEG_SAMPLING_FACTOR,
+                JPEG_SUBSAMPLINGS[jpeg_subsampling]])
+
+        self.encoders = {
+            'jpg': jpeg,
+            'jpeg': jpeg,
+            'png': OpenCVEncoder('.png', [cv2.IMWRITE_PNG_COMPRESSION,
+                                    clamp(png_compression, 0, 9, 3)]),
+            'webp': OpenCVEncoder('.webp', [cv2.IMWRITE_WEBP_QUALITY,
+                                    clamp(webp_quality, 1, 101, 90)]),
+            'gif': PilEncoder('GIF'),
+            'bmp': OpenCVEncoder('.bmp'),
+        }
+
+    def matches(self, jpeg_quality=90, jpeg_subsampling='420',
+                    png_compression=3, webp_quality=90):
+        return self.options == (jpeg_quality, jpeg_subsampling,
+                                    png_compression, webp_quality)
+
+    def getEncoder(self, file_format):
+        """
+        Returns the encoder for file_format, an extension with or without
+        the dot. Raises ValueError for unsupported formats.
+        """
+        encoder = self.encoders.get(file_format.lower().lstrip('.'))
+        if encoder is None:
+            raise ValueError("Unsupported image format %s" % file_format)
+        return encoder
+
+    def encode(self, image, channel_order, file_format):
+        """
+        Returns (data, seconds) - the encoded file contents and how long
+        encoding took.
+        """
+        start = time.perf_counter()
+        data = self.getEncoder(file_format).encode(image, channel_order)
+        return data, time.perf_counter() - start
+
+    def write(self, image, channel_order, filepath):
+        """
+        Encodes image in the format of filepath's extension and writes it.
+        Returns (bytes, seconds) - the size written and the encode time.
+        """
+        data, seconds = self.encode(image, channel_order,
+                                        filepath.rsplit('.', 1)[-1])
+
+        with open(filepath, 'wb') as f:
+            f.write(data)
+
+        logging.debug("Wrote %s: %d bytes, encoded in %.1f ms" % (
+                                    filepath, len(data), 1000 * seconds))
+        return len(data), seconds
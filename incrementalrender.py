@@ -0,0 +1,216 @@
+"""
+IncrementalRender
+
+Keeps one growing master video per source folder for captures that are
+still running. Each render encodes only the frames captured since the
+last one into a short segment and joins it onto the master by copying
+streams, so re-rendering costs time in proportion to the new frames:
+
+    timelapse_<folder>_<hash>.avi   the master video
+    timelapse_<folder>_<hash>.json  manifest - the render settings, the
+                                    frame size and every frame already in
+                                    the master
+
+<hash> is taken from the source folder's absolute path, so folders with
+the same name never share a master video.
+
+Segments are rendered at the master's frame size so they can be joined
+without re-encoding. When the settings change or the master is missing
+the video is rendered again from the first frame.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+from videorender import RenderError, concatVideos, framePath
+
+MANIFEST_VERSION = 1
+
+
+def masterPaths(sourcefolder, destfolder, extension='avi'):
+    """
+    Returns (video_path, manifest_path) of the master video for
+    sourcefolder.
+    """
+    sourcefolder = os.path.abspath(sourcefolder)
+    name = os.path.basename(sourcefolder) or 'video'
+    digest = hashlib.sha1(sourcefolder.encode('utf-8')).hexdigest()[:8]
+    root = os.path.join(destfolder, 'timelapse_%s_%s' % (name, digest))
+    return '%s.%s' % (root, extension), root + '.json'
+
+
+class RenderManifest(object):
+    """
+    The frames already encoded into a master video and the settings they
+    were encoded with.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.settings = None
+        self.size = None
+        self.frames = []
+        self.segments = []
+
+    def load(self):
+        """
+        Reads the manifest if there is one. A manifest that cannot be read
+        is treated as missing, so the video is rendered again.
+        """
+        if not os.path.isfile(self.path):
+            return self
+
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get('version') != MANIFEST_VERSION:
+                raise ValueError("Unknown version %s" % data.get('version'))
+
+            self.settings = data['settings']
+            self.size = data['size'] and tuple(data['size'])
+            self.frames = list(data['frames'])
+            self.segments = list(data['segments'])
+
+        except (IOError, ValueError, KeyError, TypeError) as e:
+            logging.warning("Ignoring unreadable render manifest %s: %s" % (
+                                                        self.path, repr(e)))
+            self.reset(None)
+        return self
+
+    def save(self):
+        data = {
+            'version': MANIFEST_VERSION,
+            'settings': self.settings,
+            'size': self.size,
+            'frames': self.frames,
+            'segments': self.segments,
+        }
+
+        # never leave a half written manifest behind
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.path)
+
+    def matches(self, settings):
+        return self.settings == settings
+
+    def reset(self, settings):
+        self.settings = settings
+        self.size = None
+        self.frames = []
+        self.segments = []
+
+    def addSegment(self, names, size):
+        self.size = size
+        self.frames.extend(names)
+        self.segments.append({'frames': len(names), 'rendered': time.time()})
+
+
+class IncrementalRenderer(object):
+    """
+    Appends new frames to a master video with a FrameStreamRenderer.
+    Used in place of the renderer itself - newFrames picks the frames to
+    pass to render.
+
+    Example:
+        video, manifest = masterPaths('screenshots', 'videos')
+        renderer = IncrementalRenderer(
+                        FrameStreamRenderer('ffmpeg', 'ffmpeg', 'mpeg4', 10),
+                        sourcefolder='screenshots', manifest_path=manifest,
+                        settings={'codec': 'mpeg4', 'fps': 10})
+        renderer.render(renderer.newFrames(frames, video), video)
+    """
+
+    def __init__(self, renderer, sourcefolder, manifest_path, settings):
+        self.renderer = renderer
+        self.sourcefolder = sourcefolder
+
+        # a manifest is only appended to from the folder it was made for
+        self.settings = dict(settings, source=os.path.abspath(sourcefolder))
+        self.manifest = RenderManifest(manifest_path).load()
+
+    @property
+    def encoder(self):
+        return self.renderer.encoder
+
+    @property
+    def cancelled(self):
+        return self.renderer.cancelled
+
+    def cancel(self):
+        self.renderer.cancel()
+
+    def frameName(self, frame):
+        return os.path.relpath(framePath(frame), self.sourcefolder)
+
+    def newFrames(self, frames, video_path):
+        """
+        Returns the frames, in order, that are not in the master video yet,
+        or all of them if the master has to be rendered again. Frames
+        captured out of order are appended after the ones already there.
+        """
+        if not self.manifest.matches(self.settings) or not os.path.isfile(
+                                                                video_path):
+            if self.manifest.frames:
+                logging.info("Render settings changed or %s is missing - "
+                             "rendering all frames again" % video_path)
+            self.manifest.reset(self.settings)
+            return list(frames)
+
+        rendered = set(self.manifest.frames)
+        return [frame for frame in frames
+                    if self.frameName(frame) not in rendered]
+
+    def segmentPath(self, video_path):
+        root, extension = os.path.splitext(video_path)
+        return '%s.segment%s' % (root, extension)
+
+    def render(self, framepaths, output_path, progress=None):
+        """
+        Encodes framepaths from newFrames into a segment and joins it onto
+        the master video at output_path, then records them in the manifest.
+        Returns output_path. Raises RenderError on failure.
+        """
+        if not framepaths:
+            logging.info("%s is up to date" % output_path)
+            return output_path
+
+        segment_path = self.segmentPath(output_path)
+        size = self.manifest.size
+
+        if size is None:
+            # the first segment sets the size every later one is scaled to
+            first = self.renderer.readRaw(framepaths, None)
+            if first is None:
+                raise RenderError("No readable images to render")
+            size = (first.shape[1], first.shape[0])
+
+            self.renderer.render(framepaths, segment_path, progress)
+            os.replace(segment_path, output_path)
+
+        else:
+            self.renderer.render(framepaths, segment_path, progress, size)
+            if self.renderer.cancelled:
+                self.renderer.removeOutput(segment_path)
+                raise RenderError("Rendering cancelled")
+
+            joined_path = '%s.joined%s' % os.path.splitext(output_path)
+            try:
+                concatVideos(self.renderer.encoder,
+                                self.renderer.encoder_path,
+                                [output_path, segment_path], joined_path)
+            finally:
+                self.renderer.removeOutput(segment_path)
+            os.replace(joined_path, output_path)
+
+        self.manifest.addSegment(
+                    [self.frameName(frame) for frame in framepaths], size)
+        self.manifest.save()
+
+        logging.info("Appended %d frames to %s" % (
+                                            len(framepaths), output_path))
+        return output_path
@@ -0,0 +1,381 @@
+"""
+PipCompositor
+
+Picture-in-picture compositing for Chronolapse. Each pair of images is
+independent, so batches are spread across a pool of worker processes.
+
+The default 'opencv' engine decodes straight to numpy arrays and resizes
+the pip image directly into its slice of the main image, using geometry
+worked out once per resolution. The 'pil' engine is the original PIL
+thumbnail and paste path.
+"""
+
+import concurrent.futures
+import functools
+import logging
+import math
+import os
+import shutil
+import struct
+
+import cv2
+from PIL import Image
+
+PIP_ENGINES = ('opencv', 'pil')
+
+# jpeg decoders can scale down by these factors for almost nothing
+REDUCED_READ_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+# jpeg quality of composited frames - PIL's default, which the pil
+# engine has always saved with
+PIP_JPEG_QUALITY = 75
+
+JPEG_EXTENSIONS = ('.jpg', '.jpeg')
+
+# start of frame markers, which hold the image size - every 0xcX marker
+# but DHT, JPG and DAC
+JPEG_FRAME_MARKERS = frozenset(range(0xc0, 0xd0)) - {0xc4, 0xc8, 0xcc}
+
+
+def pipSize(source_size, pipsizestring, pippositionstring):
+    """
+    Returns the (width, height) box the pip image is shrunk to fit in.
+    """
+    width, height = source_size
+
+    if pipsizestring == 'Small':
+        divisor = 4
+    elif pipsizestring == 'Medium':
+        divisor = 3
+    else:
+        divisor = 2
+
+    # sides keep the full height
+    if pippositionstring == 'Left' or pippositionstring == 'Right':
+        return (width // divisor, height)
+
+    # top/bottom keep the full width
+    elif pippositionstring == 'Top' or pippositionstring == 'Bottom':
+        return (width, height // divisor)
+
+    # corners
+    return (width // divisor, height // divisor)
+
+
+def pipOffset(source_size, pip_size, pippositionstring):
+    """
+    Returns the (x, y) position of the pip image on the main image.
+    """
+    width, height = source_size
+    pip_width, pip_height = pip_size
+
+    if pippositionstring in ('Right', 'Top-Right'):
+        return (width - pip_width, 0)
+
+    elif pippositionstring in ('Bottom', 'Bottom-Left'):
+        return (0, height - pip_height)
+
+    elif pippositionstring == 'Bottom-Right':
+        return (width - pip_width, height - pip_height)
+
+    # Left, Top and Top-Left
+    return (0, 0)
+
+
+def thumbnailSize(image_size, box_size):
+    """
+    Returns the size PIL's Image.thumbnail would shrink image_size to so
+    it fits in box_size, keeping the aspect ratio and never enlarging.
+    """
+    width, height = image_size
+    x, y = box_size
+
+    if x >= width and y >= height:
+        return (width, height)
+
+    def round_aspect(number, key):
+        return max(min(math.floor(number), math.ceil(number), key=key), 1)
+
+    aspect = width / float(height)
+    if x / float(y) >= aspect:
+        x = round_aspect(y * aspect, key=lambda n: abs(aspect - n / y))
+    else:
+        y = round_aspect(x / aspect,
+                key=lambda n: 0 if n == 0 else abs(aspect - x / float(n)))
+
+    return (x, y)
+
+
+@functools.lru_cache(maxsize=64)
+def pipGeometry(source_size, pip_source_size,
+                    pipsizestring, pippositionstring):
+    """
+    Returns (x, y, width, height) of the pip image on the main image.
+    Cached because nearly every frame in a run has the same resolution.
+    """
+    box = pipSize(source_size, pipsizestring, pippositionstring)
+    width, height = thumbnailSize(pip_source_size, box)
+
+    # a pip larger than the main image is cropped to it
+    width = min(width, source_size[0])
+    height = min(height, source_size[1])
+
+    x, y = pipOffset(source_size, (width, height), pippositionstring)
+    return (x, y, width, height)
+
+
+def jpegSize(path):
+    """
+    Returns (width, height) from a jpeg file's frame header, or None if
+    it is not a jpeg or has no frame header before the image data. Only
+    the markers ahead of the frame header are read.
+    """
+    try:
+        with open(path, 'rb') as f:
+            if f.read(2) != b'\xff\xd8':
+                return None
+
+            while True:
+                if f.read(1) != b'\xff':
+                    return None
+
+                # markers may be padded with any number of 0xff bytes
+                marker = f.read(1)
+                while marker == b'\xff':
+                    marker = f.read(1)
+                if not marker or marker in (b'\xd9', b'\xda'):
+                    return None
+
+                # standalone markers have no length
+                code = marker[0]
+                if code == 0x01 or 0xd0 <= code <= 0xd7:
+                    continue
+
+                length = f.read(2)
+                if len(length) < 2:
+                    return None
+                length = struct.unpack('>H', length)[0]
+
+                if code in JPEG_FRAME_MARKERS:
+                    header = f.read(5)
+                    if len(header) < 5:
+                        return None
+                    height, width = struct.unpack('>HH', header[1:])
+                    return (width, height)
+
+                f.seek(length - 2, os.SEEK_CUR)
+
+    except (IOError, OSError):
+        return None
+
+
+def readPip(pippath, pip_size, target_size):
+    """
+    Decodes the pip image, whose full size is pip_size, letting the jpeg
+    decoder scale it down by the largest factor that still leaves it at
+    least target_size. Returns the image, or None if it cannot be read.
+    """
+    if os.path.splitext(pippath)[1].lower() in JPEG_EXTENSIONS:
+        pip_width, pip_height = pip_size
+        width, height = target_size
+
+        for factor, flag in REDUCED_READ_FLAGS:
+            if pip_width // factor >= width and pip_height // factor >= height:
+                pip = cv2.imread(pippath, flag)
+                expected = (-(-pip_height // factor), -(-pip_width // factor))
+                if pip is not None and pip.shape[:2] == expected:
+                    return pip
+                break
+
+    return cv2.imread(pippath, cv2.IMREAD_COLOR)
+
+
+def copyFrame(sourcepath, outpath):
+    """
+    Copies a main frame that has no pip frame to outpath unchanged, with
+    the source file's ctime like composited frames.
+    """
+    try:
+        shutil.copyfile(sourcepath, outpath)
+        ctime = os.path.getctime(sourcepath)
+        os.utime(outpath, (ctime, ctime))
+        return outpath
+
+    except Exception as e:
+        logging.debug("Skipping copy of %s: %s" % (sourcepath, repr(e)))
+        return None
+
+
+def compositePipArray(sourcepath, pippath, outpath,
+                    pipsizestring, pippositionstring,
+                    jpeg_quality=PIP_JPEG_QUALITY):
+    """
+    OpenCV version of compositePip - the pip image is resized straight
+    into its slice of the decoded main image, with no PIL objects. The
+    size of a jpeg pip is read from its header so it can be decoded
+    already scaled down, see readPip. Formats OpenCV cannot handle, like
+    gif, go through compositePip.
+    """
+    if pippath is None:
+        return copyFrame(sourcepath, outpath)
+
+    if os.path.splitext(outpath)[1].lower() == '.gif':
+        return compositePip(sourcepath, pippath, outpath,
+                    pipsizestring, pippositionstring, jpeg_quality)
+
+    try:
+        source = cv2.imread(sourcepath, cv2.IMREAD_COLOR)
+        if source is None:
+            return compositePip(sourcepath, pippath, outpath,
+                        pipsizestring, pippositionstring, jpeg_quality)
+
+        pip = None
+        pip_size = None
+        if os.path.splitext(pippath)[1].lower() in JPEG_EXTENSIONS:
+            pip_size = jpegSize(pippath)
+
+        # other formats cannot be decoded scaled down anyway
+        if pip_size is None:
+            pip = cv2.imread(pippath, cv2.IMREAD_COLOR)
+            if pip is None:
+                return compositePip(sourcepath, pippath, outpath,
+                            pipsizestring, pippositionstring, jpeg_quality)
+            pip_size = (pip.shape[1], pip.shape[0])
+
+        source_size = (source.shape[1], source.shape[0])
+        x, y, width, height = pipGeometry(source_size, pip_size,
+                                    pipsizestring, pippositionstring)
+
+        if pip is None:
+            pip = readPip(pippath, pip_size, (width, height))
+            if pip is None:
+                return compositePip(sourcepath, pippath, outpath,
+                            pipsizestring, pippositionstring, jpeg_quality)
+
+        target = source[y:y+height, x:x+width]
+        if (width, height) == (pip.shape[1], pip.shape[0]):
+            target[...] = pip
+        else:
+            cv2.resize(pip, (width, height), dst=target,
+                            interpolation=cv2.INTER_AREA)
+
+        if not cv2.imwrite(outpath, source,
+                        [cv2.IMWRITE_JPEG_QUALITY, int(jpeg_quality)]):
+            raise IOError("Could not write %s" % outpath)
+
+        # modify creation time to match source file
+        ctime = os.path.getctime(sourcepath)
+        os.utime(outpath, (ctime, ctime))
+        return outpath
+
+    except Exception as e:
+        logging.debug("Skipping PIP for %s: %s" % (sourcepath, repr(e)))
+        return None
+
+
+def compositePip(sourcepath, pippath, outpath,
+                    pipsizestring, pippositionstring,
+                    jpeg_quality=PIP_JPEG_QUALITY):
+    """
+    Pastes the image at pippath onto the image at sourcepath and saves the
+    result to outpath with the source file's ctime, jpeg files at
+    jpeg_quality. Returns outpath, or None if either file is not an
+    image. If pippath is None the source is copied unchanged.
+    """
+    if pippath is None:
+        return copyFrame(sourcepath, outpath)
+
+    try:
+        # open with PIL -- will skip non-images
+        source = Image.open(sourcepath)
+        pip = Image.open(pippath)
+
+        # resize pip and paste on main
+        pip.thumbnail(pipSize(source.size, pipsizestring, pippositionstring))
+        source.paste(pip, pipOffset(source.size, pip.size, pippositionstring))
+
+        # save in destination
+        if os.path.splitext(outpath)[1].lower() in JPEG_EXTENSIONS:
+            source.save(outpath, quality=int(jpeg_quality))
+        else:
+            source.save(outpath)
+
+        # modify creation time to match source file
+        ctime = os.path.getctime(sourcepath)
+        os.utime(outpath, (ctime, ctime))
+        return outpath
+
+    except Exception as e:
+        logging.debug("Skipping PIP for %s: %s" % (sourcepath, repr(e)))
+        return None
+
+
+def createPipBatch(pairs, outfolder, pipsizestring, pippositionstring,
+                    workers=None, progress=None, engine='opencv',
+                    jpeg_quality=PIP_JPEG_QUALITY):
+    """
+    Composites every (sourcepath, pippath) pair into outfolder, keeping
+    the source file names. Pairs without a pippath are copied as is.
+
+    workers is the number of processes to use - None or 0 uses every core
+    and 1 composites in this process. progress is called in pair order
+    with (count, total, sourcefile) as each pair finishes and may return
+    False to cancel the remaining pairs. engine is one of PIP_ENGINES and
+    jpeg_quality (1-100) the quality of jpeg output. Returns the number
+    of pairs processed.
+    """
+    if engine not in PIP_ENGINES:
+        logging.warning("Unknown PIP engine %s - using opencv" % engine)
+        engine = 'opencv'
+
+    composite = compositePipArray
+    if engine == 'pil':
+        composite = compositePip
+
+    total = len(pairs)
+    if not workers:
+        workers = os.cpu_count() or 1
+
+    jobs = [(sourcepath, pippath,
+                os.path.join(outfolder, os.path.basename(sourcepath)),
+                pipsizestring, pippositionstring, jpeg_quality)
+            for sourcepath, pippath in pairs]
+
+    # no point starting processes for a single worker
+    if workers == 1 or total < 2:
+        count = 0
+        for job in jobs:
+            composite(*job)
+            count += 1
+            if progress is not None:
+                if progress(count, total,
+                            os.path.basename(job[0])) is False:
+                    break
+        return count
+
+    logging.debug("Creating PIP with %d processes" % workers)
+
+    count = 0
+    executor = concurrent.futures.ProcessPoolExecutor(workers)
+    try:
+        futures = [executor.submit(composite, *job) for job in jobs]
+
+        # report in pair order so progress matches the serial version
+        for job, future in zip(jobs, futures):
+            future.result()
+            count += 1
+            if progress is not None:
+                if progress(count, total,
+                            os.path.basename(job[0])) is False:
+                    for pending in futures:
+                        pending.cancel()
+                    break
+
+    finally:
+        executor.shutdown(wait=True)
+
+    return count
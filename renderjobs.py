@@ -0,0 +1,233 @@
+"""
+RenderJobs
+
+Runs video renders one after another on a background thread so the user
+interface never waits on the encoder. Each RenderJob tracks how many
+frames the encoder has finished, the encoding speed and the time left,
+and can be cancelled while queued or running.
+
+The listener is called from background threads - the GUI forwards it to
+the main thread with wx.PostEvent.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+from chronolapsecore import ChronolapseError
+
+
+class RenderJob(object):
+    """
+    A single video render and its progress.
+    """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, sourcefolder, destfolder, fps, codec, mencoderpath):
+        self.sourcefolder = sourcefolder
+        self.destfolder = destfolder
+        self.fps = fps
+        self.codec = codec
+        self.mencoderpath = mencoderpath
+
+        self.state = RenderJob.QUEUED
+        self.frames_done = 0
+        self.total = 0
+        self.started = None
+        self.finished = None
+        self.output_filename = None
+
+        # ChronolapseError if the job failed
+        self.error = None
+
+        self.renderer = None
+        self.cancel_requested = False
+
+    def isFinished(self):
+        return self.state in (
+                    RenderJob.DONE, RenderJob.FAILED, RenderJob.CANCELLED)
+
+    def percent(self):
+        if not self.total:
+            return 0
+        return 100.0 * self.frames_done / self.total
+
+    def encodingRate(self):
+        """
+        Returns the frames encoded per second so far.
+        """
+        if self.started is None or not self.frames_done:
+            return 0
+        elapsed = (self.finished or time.monotonic()) - self.started
+        if elapsed <= 0:
+            return 0
+        return self.frames_done / elapsed
+
+    def eta(self):
+        """
+        Returns the estimated seconds left, or None before the encoder has
+        reported any frames.
+        """
+        rate = self.encodingRate()
+        if not rate:
+            return None
+        return (self.total - self.frames_done) / rate
+
+    def statusText(self):
+        if self.state == RenderJob.QUEUED:
+            return 'Waiting for earlier renders'
+        if self.state != RenderJob.RUNNING:
+            return self.state.capitalize()
+
+        text = 'Encoding frame %d of %d (%d%%)' % (
+                    self.frames_done, self.total, self.percent())
+        eta = self.eta()
+        if eta is not None:
+            text += ' - %.1f fps - %d:%02d left' % (
+                    self.encodingRate(), eta // 60, eta % 60)
+        return text
+
+
+class RenderJobManager(object):
+    """
+    Queues RenderJobs and runs them in order on a worker thread. listener
+    is called with the job whenever its progress or state changes, at most
+    every notify_interval seconds for progress.
+
+    Example:
+        manager = RenderJobManager(engine, listener=onJobChanged)
+        job = manager.submit(sourcefolder, destfolder, 10, 'mpeg4', 'mencoder')
+        manager.cancel(job)
+    """
+
+    def __init__(self, engine, listener=None, notify_interval=0.25):
+        self.engine = engine
+        self.listener = listener
+        self.notify_interval = notify_interval
+
+        self._jobs = []
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, sourcefolder, destfolder, fps, codec, mencoderpath):
+        """
+        Queues a render and returns its RenderJob.
+        """
+        job = RenderJob(sourcefolder, destfolder, fps, codec, mencoderpath)
+
+        with self._lock:
+            self._jobs.append(job)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                            None, self._run, 'renderjobs', ())
+                self._thread.daemon = True
+                self._thread.start()
+
+        self._queue.put(job)
+        self.notify(job)
+        return job
+
+    def getJobs(self):
+        with self._lock:
+            return list(self._jobs)
+
+    def pending(self):
+        """
+        Returns the jobs that are queued or running.
+        """
+        return [job for job in self.getJobs() if not job.isFinished()]
+
+    def cancel(self, job):
+        job.cancel_requested = True
+        renderer = job.renderer
+        if renderer is not None:
+            renderer.cancel()
+
+    def cancelAll(self):
+        for job in self.pending():
+            self.cancel(job)
+
+    def shutdown(self, wait=True):
+        """
+        Cancels every job and stops the worker thread.
+        """
+        self.cancelAll()
+        self._queue.put(None)
+
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    def notify(self, job):
+        if self.listener is None:
+            return
+        try:
+            self.listener(job)
+        except Exception as e:
+            logging.error("Render listener failed: %s" % repr(e))
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            self._runJob(job)
+
+    def _runJob(self, job):
+        if job.cancel_requested:
+            job.state = RenderJob.CANCELLED
+            self.notify(job)
+            return
+
+        job.state = RenderJob.RUNNING
+        job.started = time.monotonic()
+        last_notified = [0]
+
+        def progress(frames_done, total):
+            job.frames_done = frames_done
+            job.total = total
+
+            now = time.monotonic()
+            if now - last_notified[0] >= self.notify_interval:
+                last_notified[0] = now
+                self.notify(job)
+
+            return not job.cancel_requested
+
+        try:
+            renderer, framepaths, output_filename = self.engine.prepareVideo(
+                    job.sourcefolder, job.destfolder,
+                    job.fps, job.codec, job.mencoderpath)
+            job.total = len(framepaths)
+            job.renderer = renderer
+
+            # cancelled while the frames were being listed
+            if job.cancel_requested:
+                renderer.cancel()
+
+            self.notify(job)
+            job.output_filename = self.engine.renderVideo(
+                    renderer, framepaths, output_filename, progress)
+            job.state = RenderJob.DONE
+
+        except ChronolapseError as e:
+            job.error = e
+            if job.cancel_requested:
+                job.state = RenderJob.CANCELLED
+            else:
+                job.state = RenderJob.FAILED
+
+        except Exception as e:
+            logging.error("Render failed: %s" % repr(e))
+            job.error = ChronolapseError('Encoding Error', repr(e))
+            job.state = RenderJob.FAILED
+
+        job.finished = time.monotonic()
+        job.renderer = None
+        self.notify(job)
@@ -0,0 +1,292 @@
+"""
+ScreenGrab
+
+Screen capture backends for Chronolapse. Every backend returns the screen
+as a numpy array in its own channel_order, which the capture pipeline
+converts while writing so the capture thread does no pixel copying.
+
+    'mss' - mss, using shared memory (XShm) on Linux and GDI on Windows.
+            The pixels are wrapped as a bgra array without another copy.
+    'pil' - PIL.ImageGrab
+    'wx'  - the wx ScreenDC grab in chronolapse.py, only available in the
+            GUI and only on the GUI thread
+
+'auto' picks the first available of mss, wx and pil.
+
+With several monitors, grabAll grabs each one in parallel into a single
+canvas covering the whole virtual desktop and grabEach returns one image
+per monitor.
+"""
+
+import concurrent.futures
+import logging
+import sys
+import threading
+
+import numpy
+
+can_use_mss = False
+try:
+    import mss
+    can_use_mss = True
+except ImportError:
+    pass
+
+
+SCREEN_BACKENDS = ('auto', 'mss', 'wx', 'pil')
+
+ON_WINDOWS = sys.platform.startswith('win')
+
+
+def virtualDesktop(monitors):
+    """
+    Returns the (left, top, width, height) bounding box of monitors given
+    as (left, top, width, height) in desktop coordinates.
+    """
+    left = min(m[0] for m in monitors)
+    top = min(m[1] for m in monitors)
+    right = max(m[0] + m[2] for m in monitors)
+    bottom = max(m[1] + m[3] for m in monitors)
+    return (left, top, right - left, bottom - top)
+
+
+class ScreenGrabber(object):
+    """
+    Base class for screen grab backends. grab takes rect as (x, y, width,
+    height) relative to the primary screen, or None for the whole screen,
+    and all_screens to cover every monitor instead of the primary one.
+
+    Backends that can list monitors implement monitors and grabRegion,
+    which take desktop coordinates. parallel is False for backends that
+    must grab on a single thread.
+    """
+
+    name = None
+    channel_order = 'rgb'
+    parallel = True
+
+    _executor = None
+
+    def grab(self, rect=None, all_screens=False):
+        raise NotImplementedError
+
+    def monitors(self):
+        """
+        Returns every monitor as (left, top, width, height), or an empty
+        list if the backend cannot tell.
+        """
+        return []
+
+    def grabRegion(self, left, top, width, height):
+        raise NotImplementedError
+
+    def grabMonitors(self, monitors):
+        """
+        Returns an image for each monitor, grabbed in parallel if allowed.
+        """
+        if not self.parallel or len(monitors) < 2:
+            return [self.grabRegion(*monitor) for monitor in monitors]
+
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                                len(monitors), 'screengrab')
+        return list(self._executor.map(
+                    lambda monitor: self.grabRegion(*monitor), monitors))
+
+    def grabAll(self):
+        """
+        Returns one image of the whole virtual desktop. Gaps between
+        monitors of different sizes are black.
+        """
+        monitors = self.monitors()
+        if len(monitors) < 2:
+            return self.grab(None, True)
+
+        left, top, width, height = virtualDesktop(monitors)
+        canvas = None
+
+        for monitor, image in zip(monitors, self.grabMonitors(monitors)):
+            if canvas is None:
+                canvas = numpy.zeros(
+                            (height, width, image.shape[2]), numpy.uint8)
+
+            # scaled displays can return more or fewer pixels than the
+            # geometry says - clip to the monitor's area
+            x = monitor[0] - left
+            y = monitor[1] - top
+            h = min(image.shape[0], monitor[3])
+            w = min(image.shape[1], monitor[2])
+            canvas[y:y+h, x:x+w] = image[:h, :w]
+
+        return canvas
+
+    def grabEach(self):
+        """
+        Returns a list with an image of each monitor.
+        """
+        monitors = self.monitors()
+        if not monitors:
+            return [self.grab(None, False)]
+        return self.grabMonitors(monitors)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+class MssGrabber(ScreenGrabber):
+    """
+    Grabs with mss. mss objects must not be shared between threads, so
+    each thread that grabs gets its own.
+    """
+
+    name = 'mss'
+    channel_order = 'bgra'
+
+    def __init__(self):
+        self._local = threading.local()
+        self._instances = []
+        self._lock = threading.Lock()
+
+    def getMss(self):
+        sct = getattr(self._local, 'sct', None)
+        if sct is None:
+            sct = mss.mss()
+            self._local.sct = sct
+            with self._lock:
+                self._instances.append(sct)
+        return sct
+
+    def grab(self, rect=None, all_screens=False):
+        sct = self.getMss()
+
+        # monitors[0] is the bounding box of every monitor
+        if all_screens or len(sct.monitors) < 2:
+            base = sct.monitors[0]
+        else:
+            base = sct.monitors[1]
+
+        if rect:
+            x, y, width, height = rect
+            region = {'left': base['left'] + x, 'top': base['top'] + y,
+                        'width': width, 'height': height}
+        else:
+            region = base
+
+        return self.grabRegion(region['left'], region['top'],
+                                region['width'], region['height'])
+
+    def monitors(self):
+        return [(m['left'], m['top'], m['width'], m['height'])
+                    for m in self.getMss().monitors[1:]]
+
+    def grabRegion(self, left, top, width, height):
+        shot = self.getMss().grab({'left': left, 'top': top,
+                                    'width': width, 'height': height})
+
+        # view onto mss's buffer - no copy
+        return numpy.frombuffer(shot.raw, numpy.uint8).reshape(
+                                        shot.height, shot.width, 4)
+
+    def close(self):
+        ScreenGrabber.close(self)
+
+        with self._lock:
+            instances = self._instances
+            self._instances = []
+            self._local = threading.local()
+
+        for sct in instances:
+            try:
+                sct.close()
+            except Exception:
+                pass
+
+
+class PilGrabber(ScreenGrabber):
+    """
+    Grabs with PIL.ImageGrab.
+    """
+
+    name = 'pil'
+
+    def grab(self, rect=None, all_screens=False):
+        from PIL import ImageGrab
+
+        bbox = None
+        if rect:
+            x, y, width, height = rect
+            bbox = (x, y, x + width, y + height)
+
+        if ON_WINDOWS:
+            image = ImageGrab.grab(bbox, all_screens=all_screens)
+        else:
+            image = ImageGrab.grab(bbox)
+
+        return numpy.asarray(image.convert('RGB'))
+
+
+class FunctionGrabber(ScreenGrabber):
+    """
+    Wraps a grab(rect, all_screens) function returning an rgb array, like
+    the wx grabber in chronolapse.py. rect is passed in desktop
+    coordinates for grabRegion. monitors_function lists the monitors.
+    """
+
+    def __init__(self, name, function, monitors_function=None,
+                    channel_order='rgb', parallel=False):
+        self.name = name
+        self.function = function
+        self.monitors_function = monitors_function
+        self.channel_order = channel_order
+        self.parallel = parallel
+
+    def grab(self, rect=None, all_screens=False):
+        return self.function(rect, all_screens)
+
+    def monitors(self):
+        if self.monitors_function is None:
+            return []
+        return self.monitors_function()
+
+    def grabRegion(self, left, top, width, height):
+        return self.function((left, top, width, height), False)
+
+
+def availableBackends(wx_grabber=None):
+    """
+    Returns the backends that can be used, in 'auto' order.
+    """
+    backends = []
+    if can_use_mss:
+        backends.append('mss')
+    if wx_grabber is not None:
+        backends.append('wx')
+    backends.append('pil')
+    return backends
+
+
+def createGrabber(backend='auto', wx_grabber=None, wx_monitors=None):
+    """
+    Returns a ScreenGrabber for backend. wx_grabber and wx_monitors are the
+    wx grab and monitor list functions, if running in the GUI. Unavailable
+    backends fall back to 'auto' with a warning.
+    """
+    available = availableBackends(wx_grabber)
+
+    if backend != 'auto' and backend not in available:
+        logging.warning(
+            "Screenshot backend %s is not available - using %s" % (
+                                                    backend, available[0]))
+        backend = 'auto'
+
+    if backend == 'auto':
+        backend = available[0]
+
+    if backend == 'mss':
+        return MssGrabber()
+    if backend == 'wx':
+        # wx may only touch the screen from the GUI thread
+        return FunctionGrabber('wx', wx_grabber, wx_monitors)
+    return PilGrabber()
@@ -0,0 +1,163 @@
+"""
+SequenceAllocator
+
+Hands out sequential image numbers for Chronolapse's sequential filename
+mode. Capture folders are scanned at most once - after that the counter
+lives in memory and a small checkpoint file in each folder lets the next
+run continue without scanning again.
+
+Numbers are reserved in blocks, and the checkpoint records the end of
+the current block. It is written once per block rather than once per
+capture. A crash can therefore only skip the rest of a block, never
+reuse a number. close() writes the last number actually used.
+"""
+
+import json
+import logging
+import os
+import threading
+
+
+class SequenceAllocator(object):
+    """
+    Allocates increasing integers shared by a set of (folder, prefix)
+    sources, so screenshots and webcam captures taken on the same tick get
+    the same number.
+
+    The checkpoint is trusted on startup. Delete it to force a rescan if
+    files were added to the folder by something other than Chronolapse.
+
+    Example:
+        allocator = SequenceAllocator([('screenshots', 'screen_')])
+        number = allocator.next()
+        allocator.close()
+    """
+
+    CHECKPOINT_FILENAME = '.chronolapse_sequence'
+
+    def __init__(self, sources, block=100):
+        self.sources = self._normalize(sources)
+        self.block = max(1, int(block))
+        self._lock = threading.Lock()
+        self._last = None
+
+        # highest number the checkpoints allow for, see next
+        self._reserved = None
+
+        # checkpoint contents by folder - {folder: {prefix: last_number}}
+        self._checkpoints = {}
+
+    def _normalize(self, sources):
+        return [(os.path.abspath(folder), prefix)
+                    for folder, prefix in sources]
+
+    def matches(self, sources):
+        """
+        Returns True if this allocator was created for the given sources.
+        """
+        return self._normalize(sources) == self.sources
+
+    def last(self):
+        """
+        Returns the highest number allocated so far, loading it if needed.
+        """
+        with self._lock:
+            if self._last is None:
+                self._last = self._load()
+            return self._last
+
+    def next(self):
+        """
+        Allocates and returns the next number, reserving another block in
+        the checkpoints when the current one is used up.
+        """
+        with self._lock:
+            if self._last is None:
+                self._last = self._load()
+
+            self._last += 1
+            if self._reserved is None or self._last > self._reserved:
+                self._reserved = self._last + self.block - 1
+                self._writeCheckpoints(self._reserved)
+            return self._last
+
+    def close(self):
+        """
+        Records the last number used in the checkpoints, so the next run
+        continues right after it instead of after the reserved block.
+        """
+        with self._lock:
+            if self._last is not None and self._reserved != self._last:
+                self._writeCheckpoints(self._last)
+                self._reserved = self._last
+
+    def _load(self):
+        highest_number = 0
+        for folder, prefix in self.sources:
+            highest_number = max(
+                        highest_number, self._loadFolder(folder, prefix))
+
+        logging.debug("Sequence starting after %d" % highest_number)
+        return highest_number
+
+    def _loadFolder(self, folder, prefix):
+        checkpoint_path = os.path.join(folder, self.CHECKPOINT_FILENAME)
+
+        checkpoint = {}
+        try:
+            with open(checkpoint_path, 'r') as f:
+                checkpoint = json.loads(f.read())
+        except (IOError, OSError, ValueError):
+            pass
+
+        if not isinstance(checkpoint, dict):
+            checkpoint = {}
+        self._checkpoints[folder] = checkpoint
+
+        if prefix in checkpoint:
+            try:
+                return int(checkpoint[prefix])
+            except (TypeError, ValueError):
+                pass
+
+        logging.debug("No sequence checkpoint for %s%s - scanning" % (
+                                        os.path.join(folder, ''), prefix))
+        return self._scanFolder(folder, prefix)
+
+    def _scanFolder(self, folder, prefix):
+        highest_number = 0
+        try:
+            file_list = os.listdir(folder)
+        except OSError as e:
+            logging.warning("Could not list %s: %s" % (folder, repr(e)))
+            return highest_number
+
+        for fname in file_list:
+            base, extension = os.path.splitext(fname)
+            if base.startswith(prefix):
+                numeric_base = base[len(prefix):]
+                try:
+                    highest_number = max(highest_number, int(numeric_base))
+                except ValueError as e:
+                    # ignore files that are not parsable as numbers
+                    pass
+
+        return highest_number
+
+    def _writeCheckpoints(self, number):
+        for folder, prefix in self.sources:
+            checkpoint = self._checkpoints.setdefault(folder, {})
+            checkpoint[prefix] = number
+
+        # one write per folder even if several sources share it
+        for folder, checkpoint in self._checkpoints.items():
+            checkpoint_path = os.path.join(folder, self.CHECKPOINT_FILENAME)
+            temp_path = checkpoint_path + '.tmp'
+            try:
+                with open(temp_path, 'w') as f:
+                    f.write(json.dumps(checkpoint))
+                os.replace(temp_path, checkpoint_path)
+            except (IOError, OSError) as e:
+                logging.warning(
+                    "Failed to write sequence checkpoint %s: %s" % (
+                                                checkpoint_path, repr(e)))
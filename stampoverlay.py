@@ -0,0 +1,101 @@
+"""
+StampOverlay
+
+Draws timestamp text straight into numpy frames. Each stamp string is
+rasterised once into a small coverage mask with PIL and cached, and only
+the pixels under the mask are blended into the frame - the rest of the
+frame is never copied or converted, so stamped captures can be encoded
+by the same writer as unstamped ones.
+"""
+
+import collections
+import threading
+
+import numpy
+from PIL import Image, ImageDraw, ImageFont
+
+
+class StampOverlay(object):
+    """
+    Cache of rendered stamp strings, safe to share between threads.
+
+    Example:
+        overlay = StampOverlay()
+        overlay.draw(image, '2016-01-01 12:00:00', (10, 10),
+                        color=(255, 0, 0), channel_order='bgr')
+    """
+
+    def __init__(self, font=None, max_strings=64):
+        self.font = font
+        self.max_strings = max_strings
+
+        self._masks = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def getFont(self):
+        if self.font is None:
+            self.font = ImageFont.load_default()
+        return self.font
+
+    def render(self, text):
+        """
+        Returns (mask, left, top) for text - mask is a uint8 coverage
+        array of just the drawn pixels and (left, top) its offset from
+        the position the text is drawn at, as ImageDraw.text places it.
+        """
+        with self._lock:
+            cached = self._masks.get(text)
+            if cached is not None:
+                self._masks.move_to_end(text)
+                return cached
+
+            font = self.getFont()
+            left, top, right, bottom = font.getbbox(text)
+            left = max(0, left)
+            top = max(0, top)
+
+            mask = None
+            if right > left and bottom > top:
+                canvas = Image.new('L', (right - left, bottom - top), 0)
+                ImageDraw.Draw(canvas).text((-left, -top), text,
+                                            fill=255, font=font)
+                mask = numpy.asarray(canvas)
+
+            cached = (mask, left, top)
+            self._masks[text] = cached
+            if len(self._masks) > self.max_strings:
+                self._masks.popitem(last=False)
+            return cached
+
+    def draw(self, image, text, position, color=(255, 255, 255),
+                channel_order='rgb'):
+        """
+        Blends text into image in place at position (x, y). color is
+        (red, green, blue) whatever the channel_order of image. Text
+        falling outside the image is clipped.
+        """
+        mask, left, top = self.render(text)
+        if mask is None:
+            return image
+
+        x = int(position[0]) + left
+        y = int(position[1]) + top
+
+        # clip the mask to the image
+        x0, y0 = max(x, 0), max(y, 0)
+        x1 = min(x + mask.shape[1], image.shape[1])
+        y1 = min(y + mask.shape[0], image.shape[0])
+        if x1 <= x0 or y1 <= y0:
+            return image
+
+        alpha = mask[y0-y:y1-y, x0-x:x1-x].astype(numpy.uint16)[..., None]
+
+        color = tuple(color)
+        if channel_order in ('bgr', 'bgra'):
+            color = color[::-1]
+        color = numpy.array(color, numpy.uint16)
+
+        # leave any alpha channel alone
+        region = image[y0:y1, x0:x1, :3]
+        region[...] = (region * (255 - alpha) + color * alpha + 127) // 255
+        return image
@@ -0,0 +1,263 @@
+import os
+import threading
+import time
+
+import numpy
+
+from capturepipeline import CapturePipeline, CapturedFrame, LinkedFrame
+from changedetector import ChangeDetector
+from imagewriter import ImageWriter
+
+
+def makeImage(value=0):
+    return numpy.full((16, 16, 3), value, numpy.uint8)
+
+
+class BlockingWriter(object):
+    """
+    Writes nothing until released, so tests can fill the queue.
+    """
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def write(self, image, channel_order, filepath):
+        self.started.set()
+        self.release.wait(5)
+        with open(filepath, 'wb') as f:
+            f.write(b'x')
+        return 1, 0.0
+
+
+class FailingWriter(object):
+
+    def write(self, image, channel_order, filepath):
+        raise IOError("disk full")
+
+
+def waitFor(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(.005)
+
+
+def fillQueue(pipeline, writer, tmp_path):
+    """
+    Blocks the single worker on a frame and queues one more. Returns
+    (busy, queued).
+    """
+    busy = CapturedFrame(makeImage(), str(tmp_path / 'busy.png'),
+                            writer=writer)
+    pipeline.submit(busy)
+    assert writer.started.wait(5)
+    waitFor(lambda: pipeline.getStats()['queued'] == 0)
+
+    queued = CapturedFrame(makeImage(), str(tmp_path / 'queued.png'),
+                            writer=writer)
+    assert pipeline.submit(queued)
+    return busy, queued
+
+
+def test_writes_frames(tmp_path):
+    pipeline = CapturePipeline(workers=2)
+    written = []
+    pipeline.on_written = written.append
+
+    frames = [CapturedFrame(makeImage(i), str(tmp_path / ('%d.png' % i)))
+                for i in range(5)]
+    for frame in frames:
+        pipeline.submit(frame)
+    pipeline.stop()
+
+    stats = pipeline.getStats()
+    assert stats['submitted'] == 5
+    assert stats['written'] == 5
+    assert stats['failed'] == 0
+    assert sorted(written, key=lambda f: f.filepath) == frames
+    for frame in frames:
+        assert os.path.getsize(frame.filepath) == frame.size
+        assert None not in frame.folder_mtimes
+
+
+def test_drop_newest_discards_incoming_frame(tmp_path):
+    writer = BlockingWriter()
+    failed = []
+    pipeline = CapturePipeline(workers=1, max_queue=1,
+                    drop_policy='drop_newest', on_failed=failed.append)
+    busy, queued = fillQueue(pipeline, writer, tmp_path)
+
+    incoming = CapturedFrame(makeImage(), str(tmp_path / 'new.png'),
+                                writer=writer)
+    assert not pipeline.submit(incoming)
+    assert incoming.finished.is_set()
+    assert failed == [incoming]
+
+    writer.release.set()
+    pipeline.stop()
+    assert pipeline.getStats()['dropped'] == 1
+    assert os.path.exists(queued.filepath)
+    assert not os.path.exists(incoming.filepath)
+
+
+def test_drop_oldest_discards_queued_frame(tmp_path):
+    writer = BlockingWriter()
+    failed = []
+    pipeline = CapturePipeline(workers=1, max_queue=1,
+                    drop_policy='drop_oldest', on_failed=failed.append)
+    busy, queued = fillQueue(pipeline, writer, tmp_path)
+
+    incoming = CapturedFrame(makeImage(), str(tmp_path / 'new.png'),
+                                writer=writer)
+    assert not pipeline.submit(incoming)
+    assert queued.finished.is_set()
+    assert failed == [queued]
+
+    writer.release.set()
+    pipeline.stop()
+    assert pipeline.getStats()['dropped'] == 1
+    assert os.path.exists(incoming.filepath)
+    assert not os.path.exists(queued.filepath)
+
+
+def test_block_waits_then_drops(tmp_path):
+    writer = BlockingWriter()
+    pipeline = CapturePipeline(workers=1, max_queue=1, drop_policy='block',
+                                block_timeout=0.05)
+    fillQueue(pipeline, writer, tmp_path)
+
+    incoming = CapturedFrame(makeImage(), str(tmp_path / 'new.png'),
+                                writer=writer)
+    start = time.monotonic()
+    assert not pipeline.submit(incoming)
+    assert time.monotonic() - start >= 0.05
+
+    writer.release.set()
+    pipeline.stop()
+    assert pipeline.getStats()['dropped'] == 1
+
+
+def test_failed_write_is_counted_and_reported(tmp_path):
+    failed = []
+    pipeline = CapturePipeline(workers=1, on_failed=failed.append)
+
+    frame = CapturedFrame(makeImage(), str(tmp_path / 'a.png'),
+                            writer=FailingWriter())
+    pipeline.submit(frame)
+    pipeline.stop()
+
+    stats = pipeline.getStats()
+    assert stats['failed'] == 1
+    assert stats['written'] == 0
+    assert frame.finished.is_set()
+    assert failed == [frame]
+
+
+def test_stop_writes_queued_frames(tmp_path):
+    writer = BlockingWriter()
+    pipeline = CapturePipeline(workers=1, max_queue=4)
+    busy, queued = fillQueue(pipeline, writer, tmp_path)
+
+    threading.Timer(0.05, writer.release.set).start()
+    pipeline.stop()
+
+    assert os.path.exists(busy.filepath)
+    assert os.path.exists(queued.filepath)
+    assert not pipeline.isRunning()
+
+
+def test_linked_frame_hardlinks_written_target(tmp_path):
+    target = CapturedFrame(makeImage(), str(tmp_path / 'a.png'))
+    pipeline = CapturePipeline(workers=1)
+    pipeline.submit(target)
+    pipeline.submit(LinkedFrame(
+            CapturedFrame(makeImage(), str(tmp_path / 'b.png')), target))
+    pipeline.stop()
+
+    assert pipeline.getStats()['written'] == 2
+    assert os.path.samefile(str(tmp_path / 'a.png'), str(tmp_path / 'b.png'))
+
+
+def test_linked_frame_is_written_in_full_when_target_failed(tmp_path):
+    target = CapturedFrame(makeImage(), str(tmp_path / 'a.png'),
+                            writer=FailingWriter())
+    linked = LinkedFrame(
+            CapturedFrame(makeImage(), str(tmp_path / 'b.png')), target)
+
+    pipeline = CapturePipeline(workers=1)
+    pipeline.submit(target)
+    pipeline.submit(linked)
+    pipeline.stop()
+
+    stats = pipeline.getStats()
+    assert stats['failed'] == 1
+    assert stats['written'] == 1
+    assert not os.path.exists(target.filepath)
+    assert os.path.getsize(linked.filepath) == linked.size
+
+
+def test_linked_frame_is_written_in_full_when_target_dropped(tmp_path):
+    target = CapturedFrame(makeImage(), str(tmp_path / 'a.png'))
+    target.finished.set()
+
+    linked = LinkedFrame(
+            CapturedFrame(makeImage(), str(tmp_path / 'b.png')), target)
+    linked.save()
+    assert os.path.exists(linked.filepath)
+
+
+def test_failed_reference_is_replaced_by_next_frame(tmp_path):
+    """
+    Only the first write fails - the unchanged frames after it must still
+    be written, the first in full and the rest as links to it.
+    """
+    class FailOnce(ImageWriter):
+        calls = 0
+
+        def write(self, image, channel_order, filepath):
+            FailOnce.calls += 1
+            if FailOnce.calls == 1:
+                raise IOError("disk full")
+            return ImageWriter.write(self, image, channel_order, filepath)
+
+    detector = ChangeDetector()
+    pipeline = CapturePipeline(workers=1, on_failed=detector.forget)
+    writer = FailOnce()
+
+    for i in range(4):
+        frame = CapturedFrame(makeImage(), str(tmp_path / ('%d.png' % i)),
+                                writer=writer)
+        reference = detector.check(frame)
+        if reference is not None:
+            frame = LinkedFrame(frame, reference)
+        pipeline.submit(frame)
+        frame.finished.wait(5)
+    pipeline.stop()
+
+    stats = pipeline.getStats()
+    assert stats['failed'] == 1
+    assert stats['written'] == 3
+    assert os.path.samefile(str(tmp_path / '1.png'), str(tmp_path / '3.png'))
+
+
+def test_full_write_uses_the_linked_frames_own_capture(tmp_path):
+    class RecordingWriter(ImageWriter):
+        def write(self, image, channel_order, filepath):
+            self.image = image.copy()
+            return ImageWriter.write(self, image, channel_order, filepath)
+
+    target = CapturedFrame(makeImage(10), str(tmp_path / 'a.png'),
+                            stamp='10:00:00', writer=FailingWriter())
+    target.finished.set()
+
+    writer = RecordingWriter()
+    frame = CapturedFrame(makeImage(20), str(tmp_path / 'b.png'),
+                            stamp=None, capture_time=2, writer=writer)
+    linked = LinkedFrame(frame, target)
+    linked.save()
+
+    # no stamp from the reference drawn over the frame's own pixels
+    assert (writer.image == 20).all()
+    assert linked.capture_time == 2
+    assert os.path.exists(linked.filepath)
@@ -0,0 +1,47 @@
+import numpy
+
+from capturepipeline import CapturedFrame
+from changedetector import ChangeDetector
+
+
+def makeFrame(value):
+    return CapturedFrame(numpy.full((72, 128, 3), value, numpy.uint8), None)
+
+
+def test_unchanged_frame_returns_reference():
+    detector = ChangeDetector(threshold=1.0)
+    first = makeFrame(10)
+
+    assert detector.check(first) is None
+    assert detector.check(makeFrame(10)) is first
+    assert detector.check(makeFrame(50)) is None
+
+
+def test_dhash_ignores_uniform_brightness_change():
+    detector = ChangeDetector(threshold=0, method='dhash')
+    image = numpy.tile(numpy.arange(128, dtype=numpy.uint8), (72, 1))
+    first = CapturedFrame(numpy.dstack([image] * 3), None)
+
+    assert detector.check(first) is None
+    assert detector.check(CapturedFrame(
+                numpy.dstack([image + 20] * 3), None)) is first
+
+
+def test_forget_makes_next_frame_the_reference():
+    detector = ChangeDetector()
+    first = makeFrame(10)
+    detector.check(first)
+
+    detector.forget(first)
+    second = makeFrame(10)
+    assert detector.check(second) is None
+    assert detector.check(makeFrame(10)) is second
+
+
+def test_forget_ignores_other_frames():
+    detector = ChangeDetector()
+    first = makeFrame(10)
+    detector.check(first)
+
+    detector.forget(makeFrame(10))
+    assert detector.check(makeFrame(10)) is first
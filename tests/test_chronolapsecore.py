@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+chronolapsecore = pytest.importorskip('chronolapsecore')
+from chronolapsecli import parseArguments
+
+
+@pytest.fixture
+def engine(tmp_path):
+    config_path = str(tmp_path / 'chronolapse.config')
+    settings = parseArguments(['--config_file', config_path, 'capture'])
+    config = chronolapsecore.createConfig(config_path)
+    config.updateBatch('chronolapse', {
+        'frame_catalog': str(tmp_path / 'catalog.sqlite'),
+        'use_screenshot': False,
+        'use_webcam': False,
+    })
+    engine = chronolapsecore.ChronolapseEngine(config, settings)
+    yield engine
+    engine.shutdown()
+
+
+def test_timestamp_names_in_the_same_second_are_unique(engine, monkeypatch):
+    now = ['2026-10-18_10-00-00']
+    monkeypatch.setattr(time, 'strftime', lambda *args: now[0])
+    engine.config.update('chronolapse', 'filename_format', 'timestamp')
+
+    names = [engine.capture(force=True) for i in range(3)]
+    assert names == ['2026-10-18_10-00-00', '2026-10-18_10-00-00_1',
+                        '2026-10-18_10-00-00_2']
+
+    now[0] = '2026-10-18_10-00-01'
+    assert engine.capture(force=True) == '2026-10-18_10-00-01'
+    assert engine.capture(force=True) == '2026-10-18_10-00-01_1'
+
+
+def test_camera_stays_open_between_scheduled_captures(engine):
+    from capturescheduler import CaptureScheduler
+
+    engine.config.updateBatch('chronolapse', {
+        'frequency': 60,
+        'webcam_idle_timeout': 30,
+    })
+    session = engine.getWebcamSession(0, 0, 0)
+    assert session.idle_timeout == 30
+
+    engine.scheduler = CaptureScheduler(engine.getCaptureInterval())
+    assert engine.getWebcamSession(0, 0, 0) is session
+    assert session.idle_timeout == 120
+
+    # never releasing stays never
+    engine.config.update('chronolapse', 'webcam_idle_timeout', 0)
+    assert engine.getWebcamIdleTimeout() == 0
+
+    engine.scheduler = None
+    engine.config.update('chronolapse', 'webcam_idle_timeout', 300)
+    assert engine.getWebcamIdleTimeout() == 300
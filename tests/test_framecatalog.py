@@ -0,0 +1,198 @@
+import os
+import sqlite3
+
+import pytest
+
+from capturepipeline import folderMtime
+from framecatalog import FrameCatalog
+
+
+def writeFrame(folder, name):
+    path = os.path.join(folder, name)
+    with open(path, 'wb') as f:
+        f.write(b'frame')
+    return path
+
+
+def committedRows(dbpath):
+    # a second connection only sees what has been committed
+    db = sqlite3.connect(dbpath)
+    try:
+        return db.execute('SELECT COUNT(*) FROM frames').fetchone()[0]
+    finally:
+        db.close()
+
+
+def captureFrame(catalog, folder, name, sequence, offset):
+    # as the capture pipeline does - the folder's mtime around the write
+    before = folderMtime(os.path.join(folder, name))
+    path = writeFrame(folder, name)
+    touchFolder(folder, offset)
+    catalog.addFrame(path, sequence=sequence,
+                        folder_mtimes=(before, folderMtime(path)))
+
+
+@pytest.fixture
+def scans(monkeypatch):
+    calls = []
+    scandir = os.scandir
+
+    def counting(path):
+        calls.append(path)
+        return scandir(path)
+    monkeypatch.setattr(os, 'scandir', counting)
+    return calls
+
+
+def touchFolder(folder, offset):
+    stat = os.stat(folder)
+    os.utime(folder, ns=(stat.st_atime_ns, stat.st_mtime_ns + offset))
+
+
+def test_frames_are_committed_in_batches(tmp_path):
+    folder = str(tmp_path / 'screenshots')
+    os.mkdir(folder)
+    dbpath = str(tmp_path / 'catalog.sqlite')
+    catalog = FrameCatalog(dbpath, '%Y-%m-%d_%H-%M-%S', ('.jpg',),
+                            commit_every=3, commit_interval=3600)
+
+    for i in range(2):
+        catalog.addFrame(writeFrame(folder, 'screen_%05d.jpg' % i),
+                            sequence=i)
+    assert committedRows(dbpath) == 0
+
+    catalog.addFrame(writeFrame(folder, 'screen_00002.jpg'), sequence=2)
+    assert committedRows(dbpath) == 3
+
+    catalog.addFrame(writeFrame(folder, 'screen_00003.jpg'), sequence=3)
+    assert committedRows(dbpath) == 3
+    catalog.flush()
+    assert committedRows(dbpath) == 4
+
+    catalog.addFrame(writeFrame(folder, 'screen_00004.jpg'), sequence=4)
+    catalog.close()
+    assert committedRows(dbpath) == 5
+
+
+def test_interval_commits_slow_captures(tmp_path):
+    folder = str(tmp_path)
+    dbpath = str(tmp_path / 'catalog.sqlite')
+    catalog = FrameCatalog(dbpath, '%Y-%m-%d_%H-%M-%S', ('.jpg',),
+                            commit_every=100, commit_interval=0)
+
+    catalog.addFrame(writeFrame(folder, 'screen_00000.jpg'), sequence=0)
+    assert committedRows(dbpath) == 1
+    catalog.close()
+
+
+def test_sync_sees_files_written_by_others(tmp_path):
+    folder = str(tmp_path / 'screenshots')
+    os.mkdir(folder)
+    catalog = FrameCatalog(str(tmp_path / 'catalog.sqlite'),
+                            '%Y-%m-%d_%H-%M-%S', ('.jpg',))
+
+    writeFrame(folder, 'screen_00000.jpg')
+    assert catalog.count(folder) == 1
+
+    # another program writes a frame, then Chronolapse adds its own -
+    # adding must not mark the folder as synced past the other file
+    writeFrame(folder, 'screen_00001.jpg')
+    path = writeFrame(folder, 'screen_00002.jpg')
+    touchFolder(folder, 1000)
+    catalog.addFrame(path, sequence=2)
+
+    assert catalog.count(folder) == 3
+    assert [os.path.basename(f.path) for f in catalog.frames(folder)] == [
+            'screen_00000.jpg', 'screen_00001.jpg', 'screen_00002.jpg']
+
+    os.remove(os.path.join(folder, 'screen_00001.jpg'))
+    touchFolder(folder, 2000)
+    assert catalog.count(folder) == 2
+    catalog.close()
+
+
+def test_ignores_other_files(tmp_path):
+    folder = str(tmp_path)
+    catalog = FrameCatalog(str(tmp_path / 'catalog.sqlite'),
+                            '%Y-%m-%d_%H-%M-%S', ('.jpg', '.png'))
+    writeFrame(folder, 'screen_00000.JPG')
+    writeFrame(folder, 'screen_00001.png')
+    writeFrame(folder, '.hidden.jpg')
+    writeFrame(folder, 'notes.txt')
+
+    assert catalog.count(folder) == 2
+    catalog.close()
+
+
+def test_captures_do_not_rescan(tmp_path, scans):
+    folder = str(tmp_path / 'screenshots')
+    os.mkdir(folder)
+    catalog = FrameCatalog(str(tmp_path / 'catalog.sqlite'),
+                            '%Y-%m-%d_%H-%M-%S', ('.jpg',))
+    writeFrame(folder, 'screen_00000.jpg')
+    assert catalog.count(folder) == 1
+    assert len(scans) == 1
+
+    for i in range(1, 4):
+        captureFrame(catalog, folder, 'screen_%05d.jpg' % i, i, 1000 * i)
+        assert catalog.count(folder) == i + 1
+    assert len(scans) == 1
+    catalog.close()
+
+
+def test_outside_change_between_captures_rescans(tmp_path, scans):
+    folder = str(tmp_path / 'screenshots')
+    os.mkdir(folder)
+    catalog = FrameCatalog(str(tmp_path / 'catalog.sqlite'),
+                            '%Y-%m-%d_%H-%M-%S', ('.jpg',))
+    assert catalog.count(folder) == 0
+
+    writeFrame(folder, 'other_00000.jpg')
+    touchFolder(folder, 1000)
+    captureFrame(catalog, folder, 'screen_00001.jpg', 1, 2000)
+
+    assert catalog.count(folder) == 2
+    assert len(scans) == 2
+    catalog.close()
+
+
+def test_counts_follow_captures(tmp_path):
+    folder = str(tmp_path / 'screenshots')
+    os.mkdir(folder)
+    catalog = FrameCatalog(str(tmp_path / 'catalog.sqlite'),
+                            '%Y-%m-%d_%H-%M-%S', ('.jpg',))
+    assert catalog.count(folder) == 0
+
+    captureFrame(catalog, folder, 'screen_00001.jpg', 1, 1000)
+    captureFrame(catalog, folder, 'screen_00002.jpg', 2, 2000)
+    assert catalog.count(folder) == 2
+
+    # writing a frame again replaces it
+    captureFrame(catalog, folder, 'screen_00002.jpg', 2, 3000)
+    assert catalog.count(folder) == 2
+
+    os.remove(os.path.join(folder, 'screen_00001.jpg'))
+    touchFolder(folder, 4000)
+    assert catalog.count(folder) == 1
+
+    captureFrame(catalog, folder, 'screen_00003.jpg', 3, 5000)
+    assert catalog.count(folder) == 2
+    assert catalog.rebuild(folder) == 2
+    assert catalog.count(folder) == 2
+    catalog.close()
+
+
+def test_counts_see_other_catalog_users(tmp_path):
+    folder = str(tmp_path / 'screenshots')
+    os.mkdir(folder)
+    dbpath = str(tmp_path / 'catalog.sqlite')
+    catalog = FrameCatalog(dbpath, '%Y-%m-%d_%H-%M-%S', ('.jpg',))
+    other = FrameCatalog(dbpath, '%Y-%m-%d_%H-%M-%S', ('.jpg',),
+                            commit_every=1)
+    assert catalog.count(folder) == 0
+
+    other.addFrame(writeFrame(folder, 'screen_00001.jpg'), sequence=1)
+    touchFolder(folder, 1000)
+    assert catalog.count(folder) == 1
+    other.close()
+    catalog.close()
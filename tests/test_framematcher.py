@@ -0,0 +1,31 @@
+import time
+
+from framematcher import buildFrames, parseCaptureTime, parseFrameName
+
+FORMAT = '%Y-%m-%d_%H-%M-%S'
+
+
+def test_parse_timestamp_names():
+    expected = time.mktime((2026, 10, 18, 10, 0, 0, 0, 0, -1))
+    assert parseCaptureTime('screen_2026-10-18_10-00-00', FORMAT) == expected
+    assert parseCaptureTime('1760781600.25', FORMAT) == 1760781600.25
+    assert parseCaptureTime('notes', FORMAT) is None
+
+
+def test_parse_repeated_timestamp_names():
+    expected = time.mktime((2026, 10, 18, 10, 0, 0, 0, 0, -1))
+    assert parseFrameName('screen_2026-10-18_10-00-00_1', FORMAT) == (
+                                                            None, expected)
+    assert parseCaptureTime('cam_2026-10-18_10-00-00_12', FORMAT) == expected
+
+    # a format ending in digits after an underscore is parsed as is
+    assert parseCaptureTime('screen_20261018_100000', '%Y%m%d_%H%M%S') == (
+                                                                    expected)
+
+
+def test_repeated_names_sort_after_the_first():
+    entries = [('/f/screen_2026-10-18_10-00-00_1.jpg', None, 5.0),
+               ('/f/screen_2026-10-18_10-00-00.jpg', None, 5.0)]
+    assert [frame.path for frame in buildFrames(entries)] == [
+                '/f/screen_2026-10-18_10-00-00.jpg',
+                '/f/screen_2026-10-18_10-00-00_1.jpg']
@@ -0,0 +1,83 @@
+import pytest
+
+from frameselection import byInterval, evenlySpaced, everyNth, selectFrames
+
+
+def test_every_nth():
+    assert everyNth(10, 3) == [0, 3, 6, 9]
+    assert selectFrames(list('abcdefg'), 'every', step=2) == list('aceg')
+
+
+def test_evenly_spaced_keeps_first_and_last():
+    assert evenlySpaced(10, 4) == [0, 3, 6, 9]
+    assert evenlySpaced(10, 1) == [0]
+    assert evenlySpaced(3, 10) == [0, 1, 2]
+
+
+def test_duration_picks_frames_for_target_length():
+    frames = list(range(1000))
+    selected = selectFrames(frames, 'duration', duration=2, fps=10)
+    assert len(selected) == 20
+    assert selected[0] == 0 and selected[-1] == 999
+
+
+def test_interval_skips_gaps():
+    # every 10 minutes for two hours, then nothing for a night
+    times = [i * 600 for i in range(12)] + [86400 + i * 600 for i in range(6)]
+    indexes = byInterval(times, 3600)
+    assert [times[i] for i in indexes] == [0, 3600, 86400]
+
+
+def test_interval_ignores_unknown_times():
+    assert byInterval([None, 0, 1800, 3600, None, 7200], 3600) == [1, 3, 5]
+
+
+def test_all_and_empty():
+    assert selectFrames([1, 2, 3]) == [1, 2, 3]
+    assert selectFrames([], 'every', step=5) == []
+
+
+@pytest.mark.parametrize('selection, options', [
+    ('every', {'step': 0}),
+    ('duration', {'duration': 0.01, 'fps': 1}),
+    ('interval', {'interval': 0, 'times': lambda frames: []}),
+    ('random', {}),
+])
+def test_invalid_selection_raises(selection, options):
+    with pytest.raises(ValueError):
+        selectFrames([1, 2, 3], selection, **options)
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    chronolapsecore = pytest.importorskip('chronolapsecore')
+    from chronolapsecli import parseArguments
+
+    config_path = str(tmp_path / 'chronolapse.config')
+    settings = parseArguments(['--config_file', config_path, 'render'])
+    config = chronolapsecore.createConfig(config_path)
+    config.update('chronolapse', 'frame_catalog',
+                    str(tmp_path / 'catalog.sqlite'))
+
+    engine = chronolapsecore.ChronolapseEngine(config, settings)
+    monkeypatch.setattr(engine, 'countFrames', lambda folder: 100)
+    yield engine
+    engine.shutdown()
+
+
+@pytest.mark.parametrize('selection, options, seconds', [
+    ('all', {}, 10.0),
+    ('every', {'video_frame_step': 7}, 1.5),
+    ('duration', {'video_target_duration': 2}, 2.0),
+    ('duration', {'video_target_duration': 60}, 10.0),
+    ('every', {'video_frame_step': 'x'}, 0),
+])
+def test_estimate_uses_counts(engine, monkeypatch, selection, options,
+                                seconds):
+    def listing(*args):
+        raise AssertionError("frames listed for a count")
+    monkeypatch.setattr(engine, 'selectVideoFrames', listing)
+
+    options['video_frame_selection'] = selection
+    engine.config.updateBatch('chronolapse', options)
+    assert engine.estimateVideoLength('frames', 10) == seconds
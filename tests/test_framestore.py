@@ -0,0 +1,123 @@
+import os
+import subprocess
+import sys
+
+from framestore import (FrameStore, INDEX_FILENAME, SEGMENT_FILENAME,
+                        hasFrameStore)
+
+
+def fillStore(folder, count, start=0, segment_size=1024):
+    store = FrameStore(folder, segment_size)
+    for i in range(start, start + count):
+        store.append('frame_%05d.jpg' % i, b'%05d' % i * 20, 1000.0 + i, i,
+                        640, 480)
+    store.close()
+
+
+def test_append_and_read(tmp_path):
+    folder = str(tmp_path)
+    assert not hasFrameStore(folder)
+    fillStore(folder, 5)
+    assert hasFrameStore(folder)
+
+    store = FrameStore(folder)
+    frames = store.frames()
+    assert [f.name for f in frames] == ['frame_%05d.jpg' % i
+                                            for i in range(5)]
+    assert frames[3].read() == b'00003' * 20
+    assert (frames[3].width, frames[3].height) == (640, 480)
+    assert frames[3].capture_time == 1003.0
+    store.close()
+
+
+def test_segments_roll_over(tmp_path):
+    folder = str(tmp_path)
+    fillStore(folder, 30, segment_size=250)
+
+    store = FrameStore(folder, 250)
+    assert len(set(f.segment for f in store.frames())) > 1
+    for i, frame in enumerate(store.frames()):
+        assert frame.read() == b'%05d' % i * 20
+    store.close()
+
+
+def test_link_shares_bytes(tmp_path):
+    store = FrameStore(str(tmp_path))
+    first = store.append('a.jpg', b'data', 1.0, 1)
+    linked = store.link('b.jpg', first, 2.0, 2)
+    store.close()
+
+    store = FrameStore(str(tmp_path))
+    a, b = store.frames()
+    assert (b.segment, b.offset, b.length) == (a.segment, a.offset, a.length)
+    assert b.read() == b'data'
+    store.close()
+
+
+def test_partial_index_record_is_dropped_and_truncated(tmp_path):
+    folder = str(tmp_path)
+    fillStore(folder, 3)
+    index_path = os.path.join(folder, INDEX_FILENAME)
+    valid_size = os.path.getsize(index_path)
+
+    # a crash halfway through writing a record
+    with open(index_path, 'ab') as f:
+        f.write(b'\x01\x02\x03')
+
+    store = FrameStore(folder)
+    assert store.count() == 3
+
+    store.append('frame_00003.jpg', b'more', 1003.0, 3)
+    store.close()
+    assert os.path.getsize(index_path) > valid_size
+
+    store = FrameStore(folder)
+    assert [f.read() for f in store.frames()][-1] == b'more'
+    assert store.count() == 4
+    store.close()
+
+
+def test_frames_without_sequence_sort_by_time(tmp_path):
+    store = FrameStore(str(tmp_path))
+    store.append('late.jpg', b'1', 20.0)
+    store.append('early.jpg', b'2', 10.0)
+    assert [f.name for f in store.frames()] == ['early.jpg', 'late.jpg']
+    store.close()
+
+
+def test_reader_sees_frames_appended_by_another_process(tmp_path):
+    folder = str(tmp_path / 'store')
+    fillStore(folder, 1)
+    reader = FrameStore(folder)
+    assert reader.count() == 1
+
+    script = ("import sys; sys.path.insert(0, %r); "
+              "from test_framestore import fillStore; "
+              "fillStore(%r, 6, start=1)" % (
+                    os.path.dirname(os.path.abspath(__file__)), folder))
+    subprocess.check_call([sys.executable, '-c', script],
+            env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+
+    assert reader.count() == 7
+    assert reader.export(str(tmp_path / 'out')) == 7
+    assert sorted(os.listdir(str(tmp_path / 'out')))[-1] == 'frame_00006.jpg'
+
+    # appending after the refresh keeps the other process's records
+    reader.append('frame_00007.jpg', b'mine', 1007.0, 7)
+    reader.close()
+    assert FrameStore(folder).count() == 8
+
+
+def test_export_writes_files(tmp_path):
+    folder = str(tmp_path / 'store')
+    fillStore(folder, 4)
+    progress = []
+
+    count = FrameStore(folder).export(str(tmp_path / 'out'),
+                                        lambda done, total: progress.append(
+                                                        (done, total)))
+    assert count == 4
+    assert progress[-1] == (4, 4)
+    with open(str(tmp_path / 'out' / 'frame_00002.jpg'), 'rb') as f:
+        assert f.read() == b'00002' * 20
+    assert os.path.exists(os.path.join(folder, SEGMENT_FILENAME % 0))
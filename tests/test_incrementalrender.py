@@ -0,0 +1,228 @@
+import json
+import os
+
+import numpy
+import pytest
+
+import incrementalrender
+from incrementalrender import IncrementalRenderer, RenderManifest, masterPaths
+from videorender import RenderError
+
+
+class StubRenderer(object):
+    """
+    Writes the names of the frames it was given instead of a video.
+    """
+
+    encoder = 'ffmpeg'
+    encoder_path = 'ffmpeg'
+
+    def __init__(self):
+        self.cancelled = False
+        self.calls = []
+
+    def readRaw(self, framepaths, size):
+        return numpy.zeros((90, 160, 3), numpy.uint8)
+
+    def render(self, framepaths, output_path, progress=None, size=None):
+        self.calls.append((list(framepaths), size))
+        with open(output_path, 'w') as f:
+            f.write(''.join('%s\n' % os.path.basename(p) for p in framepaths))
+        return output_path
+
+    def removeOutput(self, output_path):
+        if os.path.exists(output_path):
+            os.remove(output_path)
+
+
+def joinFiles(encoder, encoder_path, paths, output_path):
+    with open(output_path, 'w') as output:
+        for path in paths:
+            with open(path) as f:
+                output.write(f.read())
+    return output_path
+
+
+@pytest.fixture
+def folders(tmp_path, monkeypatch):
+    monkeypatch.setattr(incrementalrender, 'concatVideos', joinFiles)
+    source = tmp_path / 'screenshots'
+    source.mkdir()
+    return str(source), str(tmp_path)
+
+
+def frameList(source, count):
+    return [os.path.join(source, 'screen_%05d.jpg' % i) for i in range(count)]
+
+
+def renderOnce(source, dest, frames, settings=None, renderer=None):
+    video, manifest = masterPaths(source, dest)
+    renderer = renderer or StubRenderer()
+    incremental = IncrementalRenderer(renderer, source, manifest,
+                                        settings or {'fps': 10})
+    new = incremental.newFrames(frames, video)
+    incremental.render(new, video)
+    return renderer, video, manifest
+
+
+def readVideo(video):
+    with open(video) as f:
+        return f.read().split()
+
+
+def test_master_paths():
+    video, manifest = masterPaths('/captures/screenshots/', '/videos')
+    assert os.path.dirname(video) == '/videos'
+    assert os.path.basename(video).startswith('timelapse_screenshots_')
+    assert video.endswith('.avi')
+    assert manifest == video[:-len('.avi')] + '.json'
+
+    # folders with the same name get their own videos
+    assert masterPaths('/a/screenshots', '/videos') != masterPaths(
+                                            '/b/screenshots', '/videos')
+    assert masterPaths('/a/screenshots/', '/videos') == masterPaths(
+                                            '/a/screenshots', '/videos')
+
+
+def test_manifest_round_trip(tmp_path):
+    path = str(tmp_path / 'manifest.json')
+    manifest = RenderManifest(path)
+    manifest.reset({'fps': 10, 'codec': 'mpeg4'})
+    manifest.addSegment(['a.jpg', 'b.jpg'], (160, 90))
+    manifest.save()
+
+    loaded = RenderManifest(path).load()
+    assert loaded.matches({'fps': 10, 'codec': 'mpeg4'})
+    assert loaded.size == (160, 90)
+    assert loaded.frames == ['a.jpg', 'b.jpg']
+    assert loaded.segments[0]['frames'] == 2
+    assert not os.path.exists(path + '.tmp')
+
+
+def test_unreadable_manifest_starts_over(tmp_path):
+    path = str(tmp_path / 'manifest.json')
+    with open(path, 'w') as f:
+        f.write('{"version": 1, "frames": [')
+
+    manifest = RenderManifest(path).load()
+    assert manifest.settings is None
+    assert manifest.frames == []
+
+
+def test_only_new_frames_are_encoded(folders):
+    source, dest = folders
+    renderer, video, manifest = renderOnce(source, dest,
+                                            frameList(source, 3))
+    assert renderer.calls[0][1] is None
+
+    renderer, video, manifest = renderOnce(source, dest,
+                                            frameList(source, 5))
+    assert [os.path.basename(p) for p in renderer.calls[0][0]] == [
+                                    'screen_00003.jpg', 'screen_00004.jpg']
+
+    # later segments are scaled to the first frame's size
+    assert renderer.calls[0][1] == (160, 90)
+    assert readVideo(video) == [os.path.basename(p)
+                                    for p in frameList(source, 5)]
+
+    with open(manifest) as f:
+        assert len(json.load(f)['frames']) == 5
+    assert sorted(os.listdir(dest)) == ['screenshots',
+                    os.path.basename(video), os.path.basename(manifest)]
+
+
+def test_up_to_date_renders_nothing(folders):
+    source, dest = folders
+    renderOnce(source, dest, frameList(source, 3))
+    renderer, video, manifest = renderOnce(source, dest, frameList(source, 3))
+    assert renderer.calls == []
+    assert len(readVideo(video)) == 3
+
+
+def test_changed_settings_render_everything(folders):
+    source, dest = folders
+    renderOnce(source, dest, frameList(source, 3), {'fps': 10})
+    renderer, video, manifest = renderOnce(source, dest,
+                                    frameList(source, 4), {'fps': 25})
+    assert len(renderer.calls[0][0]) == 4
+    assert len(readVideo(video)) == 4
+
+
+def test_missing_video_renders_everything(folders):
+    source, dest = folders
+    renderer, video, manifest = renderOnce(source, dest,
+                                            frameList(source, 3))
+    os.remove(video)
+
+    renderer, video, manifest = renderOnce(source, dest,
+                                            frameList(source, 4))
+    assert len(renderer.calls[0][0]) == 4
+    assert len(readVideo(video)) == 4
+
+
+def test_failed_join_keeps_video_and_manifest(folders, monkeypatch):
+    source, dest = folders
+    renderer, video, manifest = renderOnce(source, dest,
+                                            frameList(source, 3))
+
+    def failing(*args):
+        raise RenderError("join failed")
+    monkeypatch.setattr(incrementalrender, 'concatVideos', failing)
+
+    with pytest.raises(RenderError):
+        renderOnce(source, dest, frameList(source, 5))
+
+    assert len(readVideo(video)) == 3
+    assert len(RenderManifest(manifest).load().frames) == 3
+    assert sorted(os.listdir(dest)) == ['screenshots',
+                    os.path.basename(video), os.path.basename(manifest)]
+
+
+def test_cancelled_segment_is_not_joined(folders):
+    source, dest = folders
+    renderOnce(source, dest, frameList(source, 3))
+
+    renderer = StubRenderer()
+    renderer.cancelled = True
+    with pytest.raises(RenderError):
+        renderOnce(source, dest, frameList(source, 5), renderer=renderer)
+
+    video, manifest = masterPaths(source, dest)
+    assert len(readVideo(video)) == 3
+    assert len(RenderManifest(manifest).load().frames) == 3
+
+
+def test_same_named_sources_keep_separate_videos(tmp_path, monkeypatch):
+    monkeypatch.setattr(incrementalrender, 'concatVideos', joinFiles)
+    dest = str(tmp_path / 'videos')
+    os.mkdir(dest)
+    sources = []
+    for parent in ('a', 'b'):
+        source = tmp_path / parent / 'screenshots'
+        source.mkdir(parents=True)
+        sources.append(str(source))
+
+    renderOnce(sources[0], dest, frameList(sources[0], 3))
+    renderer, video, manifest = renderOnce(sources[1], dest,
+                                            frameList(sources[1], 2))
+
+    # b starts its own video rather than appending to a's
+    assert len(renderer.calls[0][0]) == 2
+    assert len(readVideo(video)) == 2
+    assert len(readVideo(masterPaths(sources[0], dest)[0])) == 3
+    assert RenderManifest(manifest).load().settings['source'] == sources[1]
+
+
+def test_manifest_from_another_folder_is_not_appended_to(folders):
+    source, dest = folders
+    video, manifest = masterPaths(source, dest)
+    renderOnce(source, dest, frameList(source, 3))
+
+    # a manifest copied in from somewhere else
+    loaded = RenderManifest(manifest).load()
+    loaded.settings['source'] = '/elsewhere/screenshots'
+    loaded.save()
+
+    renderer, video, manifest = renderOnce(source, dest,
+                                            frameList(source, 4))
+    assert len(renderer.calls[0][0]) == 4
@@ -0,0 +1,73 @@
+import os
+
+import cv2
+import numpy
+import pytest
+
+import pipcompositor
+from pipcompositor import (compositePip, compositePipArray, jpegSize,
+                           pipGeometry)
+
+
+def writeImage(path, width, height, value=0, params=()):
+    image = numpy.full((height, width, 3), value, numpy.uint8)
+    assert cv2.imwrite(str(path), image, list(params))
+    return str(path)
+
+
+@pytest.mark.parametrize('params', [
+    (),
+    (cv2.IMWRITE_JPEG_PROGRESSIVE, 1),
+    (cv2.IMWRITE_JPEG_OPTIMIZE, 1),
+])
+def test_jpeg_size_reads_the_frame_header(tmp_path, params):
+    path = writeImage(tmp_path / 'pip.jpg', 641, 359, params=params)
+    assert jpegSize(path) == (641, 359)
+
+
+def test_jpeg_size_rejects_other_files(tmp_path):
+    assert jpegSize(writeImage(tmp_path / 'pip.png', 64, 48)) is None
+    assert jpegSize(str(tmp_path / 'missing.jpg')) is None
+
+    truncated = str(tmp_path / 'truncated.jpg')
+    with open(writeImage(tmp_path / 'full.jpg', 64, 48), 'rb') as f:
+        data = f.read(30)
+    with open(truncated, 'wb') as f:
+        f.write(data)
+    assert jpegSize(truncated) is None
+
+
+@pytest.mark.parametrize('pipname', ['pip.jpg', 'pip.png'])
+def test_opencv_engine_composites_without_pil(tmp_path, monkeypatch,
+                                                pipname):
+    def noPil(*args):
+        raise AssertionError("PIL image opened")
+    monkeypatch.setattr(pipcompositor.Image, 'open', noPil)
+
+    source = writeImage(tmp_path / 'main.jpg', 640, 480, 0)
+    pip = writeImage(tmp_path / pipname, 1280, 960, 255)
+    outpath = str(tmp_path / 'out.jpg')
+
+    assert compositePipArray(source, pip, outpath, 'Small',
+                                'Top-Right') == outpath
+    result = cv2.imread(outpath)
+    x, y, width, height = pipGeometry((640, 480), (1280, 960), 'Small',
+                                        'Top-Right')
+    assert result[y + height // 2, x + width // 2].min() > 240
+    assert result[480 - 10, 10].max() < 15
+
+
+def test_engines_place_the_pip_alike(tmp_path):
+    source = writeImage(tmp_path / 'main.jpg', 640, 480, 0)
+    pip = writeImage(tmp_path / 'pip.jpg', 800, 600, 255)
+
+    paths = []
+    for name, composite in (('cv.jpg', compositePipArray),
+                            ('pil.jpg', compositePip)):
+        outpath = str(tmp_path / name)
+        composite(source, pip, outpath, 'Medium', 'Bottom-Left')
+        paths.append(outpath)
+
+    opencv, pil = [cv2.imread(path).astype(int) for path in paths]
+    assert numpy.abs(opencv - pil).mean() < 4
+    assert os.path.getsize(paths[0]) > 0
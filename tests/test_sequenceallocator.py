@@ -0,0 +1,73 @@
+import json
+import os
+
+from sequenceallocator import SequenceAllocator
+
+
+def readCheckpoint(folder):
+    with open(os.path.join(folder, SequenceAllocator.CHECKPOINT_FILENAME)) as f:
+        return json.load(f)
+
+
+def test_scans_once_then_counts_in_memory(tmp_path):
+    folder = str(tmp_path)
+    for name in ('screen_00007.jpg', 'screen_00003.jpg', 'other_00050.jpg'):
+        open(os.path.join(folder, name), 'w').close()
+
+    allocator = SequenceAllocator([(folder, 'screen_')])
+    assert [allocator.next() for i in range(3)] == [8, 9, 10]
+    assert allocator.last() == 10
+
+
+def test_checkpoint_is_written_once_per_block(tmp_path, monkeypatch):
+    folder = str(tmp_path)
+    allocator = SequenceAllocator([(folder, 'screen_')], block=10)
+
+    writes = []
+    original = allocator._writeCheckpoints
+
+    def counting(number):
+        writes.append(number)
+        original(number)
+    monkeypatch.setattr(allocator, '_writeCheckpoints', counting)
+
+    numbers = [allocator.next() for i in range(25)]
+    assert numbers == list(range(1, 26))
+    assert writes == [10, 20, 30]
+    assert readCheckpoint(folder) == {'screen_': 30}
+
+
+def test_close_records_the_last_number(tmp_path):
+    folder = str(tmp_path)
+    allocator = SequenceAllocator([(folder, 'screen_')], block=10)
+    for i in range(4):
+        allocator.next()
+    allocator.close()
+    assert readCheckpoint(folder) == {'screen_': 4}
+
+    # the next run continues right after it, without a scan
+    assert SequenceAllocator([(folder, 'screen_')]).next() == 5
+
+
+def test_crash_never_reuses_a_number(tmp_path):
+    folder = str(tmp_path)
+    allocator = SequenceAllocator([(folder, 'screen_')], block=10)
+    for i in range(4):
+        allocator.next()
+
+    # no close - the next run starts after the reserved block
+    assert SequenceAllocator([(folder, 'screen_')]).next() == 11
+
+
+def test_shared_folder_gets_one_checkpoint(tmp_path):
+    screens = str(tmp_path / 'screens')
+    webcam = str(tmp_path / 'webcam')
+    os.mkdir(screens)
+    os.mkdir(webcam)
+
+    allocator = SequenceAllocator([(screens, 'screen_'), (webcam, 'cam_'),
+                                    (screens, 'side_')], block=5)
+    allocator.next()
+    allocator.close()
+    assert readCheckpoint(screens) == {'screen_': 1, 'side_': 1}
+    assert readCheckpoint(webcam) == {'cam_': 1}
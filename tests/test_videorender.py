@@ -0,0 +1,145 @@
+import os
+import subprocess
+import time
+
+import cv2
+import numpy
+import pytest
+
+import videorender
+from videorender import (ChunkedRenderer, FrameStreamRenderer, RenderError,
+                         findExecutable, splitFrames)
+
+
+def test_split_frames():
+    assert splitFrames(list(range(10)), 3) == [
+                                [0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    assert splitFrames(list(range(2)), 4) == [[0], [1]]
+    assert splitFrames(list(range(5)), 0) == [list(range(5))]
+    assert splitFrames([], 3) == [[]]
+
+
+@pytest.fixture
+def stubRender(monkeypatch):
+    """
+    Replaces encoding with writing the frame names. A chunk holding a
+    frame named 'bad' fails, the others wait to be cancelled.
+    """
+    calls = []
+
+    def render(self, framepaths, output_path, progress=None, size=None):
+        calls.append((list(framepaths), size))
+        if 'bad' in framepaths:
+            raise RenderError("encoder failed")
+        if any(frame.startswith('slow') for frame in framepaths):
+            deadline = time.monotonic() + 5
+            while not self.cancelled and time.monotonic() < deadline:
+                time.sleep(.01)
+            if self.cancelled:
+                raise RenderError("Rendering cancelled")
+
+        self.frames_sent = len(framepaths)
+        if progress is not None:
+            progress(self.frames_sent, len(framepaths))
+        with open(output_path, 'w') as f:
+            f.write(''.join('%s\n' % frame for frame in framepaths))
+        return output_path
+
+    def join(encoder, encoder_path, paths, output_path):
+        with open(output_path, 'w') as output:
+            for path in paths:
+                with open(path) as f:
+                    output.write(f.read())
+        return output_path
+
+    monkeypatch.setattr(FrameStreamRenderer, 'render', render)
+    monkeypatch.setattr(FrameStreamRenderer, 'readRaw',
+                lambda self, framepaths, size: numpy.zeros((90, 160, 3)))
+    monkeypatch.setattr(videorender, 'concatVideos', join)
+    return calls
+
+
+def test_chunks_are_joined_in_order(stubRender, tmp_path):
+    frames = ['frame_%03d' % i for i in range(10)]
+    output_path = str(tmp_path / 'timelapse.avi')
+    progress = []
+
+    renderer = ChunkedRenderer('ffmpeg', 'ffmpeg', 'mpeg4', 10, chunks=3,
+                                min_chunk_frames=2)
+    renderer.render(frames, output_path,
+                    lambda done, total: progress.append((done, total)))
+
+    with open(output_path) as f:
+        assert f.read().split() == frames
+    assert sorted(len(part) for part, size in stubRender) == [3, 3, 4]
+    assert all(size == (160, 90) for part, size in stubRender)
+    assert progress[-1] == (10, 10)
+    assert os.listdir(str(tmp_path)) == ['timelapse.avi']
+
+
+def test_short_renders_use_one_process(stubRender, tmp_path):
+    renderer = ChunkedRenderer('ffmpeg', 'ffmpeg', 'mpeg4', 10, chunks=4,
+                                min_chunk_frames=50)
+    renderer.render(['frame_%03d' % i for i in range(60)],
+                    str(tmp_path / 'timelapse.avi'))
+    assert len(stubRender) == 1
+    assert stubRender[0][1] is None
+
+
+def test_failed_chunk_cancels_the_others(stubRender, tmp_path):
+    frames = ['slow_0', 'slow_1', 'bad', 'frame_3']
+    renderer = ChunkedRenderer('ffmpeg', 'ffmpeg', 'mpeg4', 10, chunks=2,
+                                min_chunk_frames=1)
+
+    start = time.monotonic()
+    with pytest.raises(RenderError) as error:
+        renderer.render(frames, str(tmp_path / 'timelapse.avi'))
+    assert time.monotonic() - start < 4
+
+    # the failure is reported, not the cancel it caused
+    assert 'encoder failed' in str(error.value)
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_cancel_stops_every_chunk(stubRender, tmp_path):
+    frames = ['slow_%d' % i for i in range(4)]
+    renderer = ChunkedRenderer('ffmpeg', 'ffmpeg', 'mpeg4', 10, chunks=2,
+                                min_chunk_frames=1)
+    renderer.cancel()
+
+    with pytest.raises(RenderError) as error:
+        renderer.render(frames, str(tmp_path / 'timelapse.avi'))
+    assert 'cancelled' in str(error.value)
+    assert os.listdir(str(tmp_path)) == []
+
+
+def countFrames(ffmpeg, path):
+    # stream copies print no frame counter, so decode
+    output = subprocess.run(
+        [ffmpeg, '-i', path, '-map', '0:v:0', '-f', 'null', '-'],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT).stdout
+    counts = [videorender.parseEncodedFrames(line)
+                for line in output.decode('utf-8', 'replace').split('\r')]
+    return [count for count in counts if count is not None][-1]
+
+
+def test_chunked_ffmpeg_render(tmp_path):
+    ffmpeg = findExecutable('ffmpeg')
+    if ffmpeg is None:
+        pytest.skip("ffmpeg not found")
+
+    frames = []
+    for i in range(30):
+        image = numpy.full((48, 64, 3), i * 8, numpy.uint8)
+        path = str(tmp_path / ('screen_%05d.jpg' % i))
+        cv2.imwrite(path, image)
+        frames.append(path)
+
+    output_path = str(tmp_path / 'timelapse.avi')
+    renderer = ChunkedRenderer('ffmpeg', ffmpeg, 'mpeg4', 10, chunks=3,
+                                min_chunk_frames=5)
+    renderer.render(frames, output_path)
+
+    assert countFrames(ffmpeg, output_path) == 30
+    assert not [name for name in os.listdir(str(tmp_path))
+                    if '.part' in name]
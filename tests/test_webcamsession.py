@@ -0,0 +1,161 @@
+import threading
+import time
+
+import numpy
+import pytest
+
+from webcamsession import WebcamSession, grabSynchronized, resizeFrame
+
+
+class FakeCamera(object):
+    """
+    Stands in for cv2.VideoCapture, counting the frames it is asked for.
+    """
+
+    def __init__(self, device_number, interval=0.005, opened=True):
+        self.device_number = device_number
+        self.interval = interval
+        self.opened = opened
+        self.grabs = 0
+        self.released = threading.Event()
+
+    def isOpened(self):
+        return self.opened
+
+    def grab(self):
+        time.sleep(self.interval)
+        self.grabs += 1
+        return True
+
+    def retrieve(self):
+        return True, numpy.full((48, 64, 3), self.device_number, numpy.uint8)
+
+    def read(self):
+        self.grab()
+        return self.retrieve()
+
+    def release(self):
+        self.released.set()
+
+
+@pytest.fixture
+def cameras(monkeypatch):
+    cameras = {}
+
+    def openDevice(session):
+        camera = cameras.get(session.device_number)
+        if camera is None or camera.released.is_set():
+            camera = cameras[session.device_number] = FakeCamera(
+                                                    session.device_number)
+        return camera
+    monkeypatch.setattr(WebcamSession, '_openDevice', openDevice)
+    return cameras
+
+
+def test_get_frame(cameras):
+    session = WebcamSession(3)
+    frame = session.getFrame(timeout=2)
+    assert frame is not None and frame[0, 0, 0] == 3
+
+    copied = session.getFrame(copy=True)
+    copied[:] = 0
+    assert session.getFrame()[0, 0, 0] == 3
+
+    session.close()
+    assert cameras[3].released.is_set()
+    assert not session.isRunning()
+
+
+def test_grab_synchronized(cameras):
+    sessions = [WebcamSession(1), WebcamSession(2)]
+    requests = grabSynchronized(sessions, timeout=2)
+
+    assert [request.frame[0, 0, 0] for request in requests] == [1, 2]
+    grab_times = [request.grab_time for request in requests]
+    assert max(grab_times) - min(grab_times) < 0.5
+    assert all(request.latency is not None for request in requests)
+
+    for session in sessions:
+        session.close()
+
+
+def test_failed_camera_does_not_hold_up_the_others(cameras):
+    cameras[2] = FakeCamera(2, opened=False)
+    sessions = [WebcamSession(1), WebcamSession(2)]
+
+    start = time.monotonic()
+    requests = grabSynchronized(sessions, timeout=5)
+    assert time.monotonic() - start < 2
+
+    assert requests[0].frame is not None
+    assert requests[1].frame is None and requests[1].done.is_set()
+
+    for session in sessions:
+        session.close()
+
+
+def test_close_finishes_pending_requests(cameras):
+    cameras[1] = FakeCamera(1, interval=0.2)
+    session = WebcamSession(1)
+    session.start()
+    requests = [session.requestGrab(timeout=2) for i in range(3)]
+    session.close()
+
+    # every request is answered, with a frame or aborted, once closed
+    for request in requests:
+        assert request.done.wait(1)
+    assert cameras[1].released.is_set()
+
+
+def test_idle_session_is_released_and_reopened(cameras):
+    session = WebcamSession(1, idle_timeout=0.05)
+    assert session.getFrame(timeout=2) is not None
+    assert cameras[1].released.wait(2)
+
+    assert session.getFrame(timeout=2) is not None
+    assert not cameras[1].released.is_set()
+    session.close()
+
+
+def test_matches():
+    session = WebcamSession(1, '640', 480)
+    assert session.matches(1, 640, '480')
+    assert not session.matches(1, 1280, 720)
+    assert not session.matches(2, 640, 480)
+
+
+def test_resize_frame():
+    image = numpy.zeros((48, 64, 3), numpy.uint8)
+    assert resizeFrame(image) is image
+    assert resizeFrame(image, 64, 48) is image
+    assert resizeFrame(image, '32', '24').shape == (24, 32, 3)
+    assert resizeFrame(None, 32, 24) is None
+
+
+def test_engine_opens_shared_device_once(cameras, tmp_path):
+    chronolapsecore = pytest.importorskip('chronolapsecore')
+    from chronolapsecli import parseArguments
+
+    config_path = str(tmp_path / 'chronolapse.config')
+    settings = parseArguments(['--config_file', config_path, 'capture'])
+    config = chronolapsecore.createConfig(config_path)
+    engine = chronolapsecore.ChronolapseEngine(config, settings)
+
+    sources = [
+        {'device_number': 1, 'resolution_x': 0, 'resolution_y': 0},
+        {'device_number': 1, 'resolution_x': 32, 'resolution_y': 24},
+        {'device_number': 2, 'resolution_x': 0, 'resolution_y': 0},
+    ]
+    try:
+        first = engine.getDeviceSessions(sources)
+        assert list(first.keys()) == [1, 2]
+
+        grabs = engine.grabWebcams(sources)
+        assert [image.shape for image, grab_time, latency in grabs] == [
+                            (48, 64, 3), (24, 32, 3), (48, 64, 3)]
+
+        # grabbing again keeps the sessions instead of reopening them
+        assert list(engine.getDeviceSessions(sources).values()) == list(
+                                                            first.values())
+    finally:
+        engine.shutdown()
@@ -0,0 +1,559 @@
+"""
+VideoRender
+
+Streams frames to a local ffmpeg or MEncoder process over stdin so the
+video is written straight to its destination, in whatever frame order the
+caller chooses, without globbing or changing the working directory.
+
+Frames are sent either as the original encoded files (ffmpeg only, no
+decoding at all) or as raw bgr24 pixels decoded with OpenCV. A frame is
+an image path or a framestore.StoredFrame.
+
+Encoders mostly use a single core, so ChunkedRenderer splits the frames
+into contiguous ranges, encodes them in parallel encoder processes and
+joins the pieces by copying their streams.
+"""
+
+import collections
+import io
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+
+import cv2
+import numpy
+from PIL import Image
+
+ENCODERS = ('ffmpeg', 'mencoder')
+STREAM_FORMATS = ('auto', 'encoded', 'raw')
+
+# ffmpeg names for the codecs offered in the GUI
+FFMPEG_CODECS = {
+    'h264': 'libx264',
+}
+
+# ffmpeg decoders for frames sent as encoded images
+IMAGE_CODECS = {
+    '.jpg': 'mjpeg',
+    '.jpeg': 'mjpeg',
+    '.png': 'png',
+    '.bmp': 'bmp',
+}
+
+
+# frame counters in the encoders' progress lines, e.g.
+#   ffmpeg:   frame=  123 fps= 45 q=2.0 size= ...
+#   mencoder: Pos:   4.1s    123f ( 7%) 45.00fps Trem: ...
+ENCODED_FRAME_PATTERNS = (
+    re.compile(r'frame=\s*(\d+)'),
+    re.compile(r'Pos:\s*[\d.]+s\s+(\d+)f'),
+)
+
+
+def parseEncodedFrames(line):
+    """
+    Returns the number of frames encoded so far from an encoder progress
+    line, or None if the line has no frame counter.
+    """
+    for pattern in ENCODED_FRAME_PATTERNS:
+        match = pattern.search(line)
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def framePath(frame):
+    """
+    Returns the path of a frame given as a path or a StoredFrame.
+    """
+    return getattr(frame, 'path', frame)
+
+
+def readFrame(frame):
+    """
+    Returns the encoded bytes of a frame given as a path or a StoredFrame.
+    """
+    if hasattr(frame, 'read'):
+        return frame.read()
+    with open(frame, 'rb') as f:
+        return f.read()
+
+
+class RenderError(Exception):
+    """
+    Raised when the encoder cannot be started or fails.
+    """
+    pass
+
+
+def splitFrames(framepaths, chunks):
+    """
+    Splits framepaths into at most chunks contiguous ranges of nearly equal
+    length, in order.
+    """
+    chunks = max(1, min(chunks, len(framepaths)))
+    size, extra = divmod(len(framepaths), chunks)
+
+    ranges = []
+    start = 0
+    for chunk in range(chunks):
+        end = start + size + (1 if chunk < extra else 0)
+        ranges.append(framepaths[start:end])
+        start = end
+    return ranges
+
+
+def findExecutable(path):
+    """
+    Returns the full path for an executable path or name, or None.
+    """
+    if not path:
+        return None
+    if os.path.isfile(path):
+        return path
+    return shutil.which(path)
+
+
+def concatVideos(encoder, encoder_path, paths, output_path):
+    """
+    Joins the videos in paths, which must share codec, size and frame
+    rate, into output_path by copying their streams without re-encoding.
+    Returns output_path. Raises RenderError on failure.
+    """
+    if encoder == 'ffmpeg':
+        list_path = output_path + '.txt'
+        with open(list_path, 'w') as f:
+            for path in paths:
+                # the concat demuxer quotes like a shell
+                f.write("file '%s'\n" % os.path.abspath(path).replace(
+                                                        "'", "'\\''"))
+        command = [encoder_path, '-y', '-hide_banner', '-f', 'concat',
+                    '-safe', '0', '-i', list_path, '-map', '0', '-c', 'copy',
+                    output_path]
+    else:
+        list_path = None
+        command = [encoder_path] + list(paths) + [
+                    '-ovc', 'copy', '-oac', 'copy', '-o', output_path]
+
+    logging.debug("Calling: %s" % ' '.join(command))
+    try:
+        proc = subprocess.Popen(command, stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = proc.communicate()[0]
+    except OSError as e:
+        raise RenderError("Could not start %s: %s" % (encoder_path, e))
+    finally:
+        if list_path is not None:
+            try:
+                os.remove(list_path)
+            except OSError:
+                pass
+
+    if proc.returncode != 0:
+        try:
+            os.remove(output_path)
+        except OSError:
+            pass
+        tail = output.decode('utf-8', 'replace').splitlines()[-20:]
+        raise RenderError("%s exited with code %s: %s" % (
+                                encoder, proc.returncode, '\n'.join(tail)))
+    return output_path
+
+
+class FrameStreamRenderer(object):
+    """
+    Renders a list of image paths into a video with an encoder reading
+    from stdin.
+
+    Example:
+        renderer = FrameStreamRenderer('ffmpeg', 'ffmpeg', 'mpeg4', 10)
+        renderer.render(['a.jpg', 'b.jpg'], '/videos/timelapse.avi')
+    """
+
+    def __init__(self, encoder, encoder_path, codec, fps,
+                    stream_format='auto'):
+        if encoder not in ENCODERS:
+            raise RenderError("Unknown encoder %s" % encoder)
+        if stream_format not in STREAM_FORMATS:
+            raise RenderError("Unknown stream format %s" % stream_format)
+
+        self.encoder = encoder
+        self.encoder_path = encoder_path
+        self.codec = codec
+        self.fps = fps
+        self.stream_format = stream_format
+
+        # last lines the encoder printed, for error messages
+        self.output_tail = collections.deque(maxlen=20)
+
+        self.process = None
+        self.progress = None
+        self.cancelled = False
+        self.total = 0
+        self.frames_sent = 0
+
+        # None until the encoder prints a frame counter
+        self.frames_encoded = None
+
+    def chooseStreamFormat(self, framepaths):
+        """
+        Returns 'encoded' if every frame can be passed to the encoder as
+        is, otherwise 'raw'.
+        """
+        if self.stream_format != 'auto':
+            return self.stream_format
+
+        # mencoder cannot demux a stream of images from stdin
+        if self.encoder != 'ffmpeg':
+            return 'raw'
+
+        extensions = set(
+            IMAGE_CODECS.get(os.path.splitext(framePath(frame))[1].lower())
+                for frame in framepaths)
+        if len(extensions) == 1 and None not in extensions:
+            return 'encoded'
+        return 'raw'
+
+    def buildCommand(self, output_path, stream_format, size=None,
+                        image_codec=None):
+        """
+        Returns the encoder command line as a list. size is (width, height)
+        of the raw frames, or the size to scale encoded frames to if given,
+        image_codec the ffmpeg decoder for encoded frames.
+        """
+        if self.encoder == 'ffmpeg':
+            command = [self.encoder_path, '-y', '-hide_banner']
+
+            # odd sizes are not allowed with yuv420p
+            filters = 'pad=ceil(iw/2)*2:ceil(ih/2)*2'
+
+            if stream_format == 'raw':
+                command += ['-f', 'rawvideo', '-pix_fmt', 'bgr24',
+                            '-s', '%dx%d' % size]
+            else:
+                command += ['-f', 'image2pipe', '-c:v', image_codec]
+                if size is not None:
+                    filters = 'scale=%d:%d,%s' % (size[0], size[1], filters)
+
+            command += ['-framerate', str(self.fps), '-i', '-',
+                        '-c:v', FFMPEG_CODECS.get(self.codec, self.codec),
+                        '-pix_fmt', 'yuv420p', '-vf', filters, output_path]
+            return command
+
+        if stream_format != 'raw':
+            raise RenderError("MEncoder can only read raw frames")
+
+        # http://web.njit.edu/all_topics/Prog_Lang_Docs/html/mplayer/encoding.html
+        command = [self.encoder_path, '-', '-demuxer', 'rawvideo',
+                    '-rawvideo', 'fps=%s:w=%d:h=%d:format=bgr24' % (
+                                            self.fps, size[0], size[1])]
+        if self.codec == 'h264':
+            command += ['-ovc', 'x264']
+        else:
+            command += ['-ovc', 'lavc', '-lavcopts', 'vcodec=%s' % self.codec]
+        command += ['-o', output_path]
+        return command
+
+    def readOutput(self, stream):
+        """
+        Reads the encoder's console output so its pipe never fills up.
+        Subclasses can override handleOutput to parse it.
+        """
+        line = b''
+        while True:
+            chunk = stream.read(1)
+            if not chunk:
+                break
+
+            # ffmpeg ends progress lines with \r, not \n
+            if chunk in (b'\r', b'\n'):
+                if line:
+                    self.handleOutput(line.decode('utf-8', 'replace'))
+                line = b''
+            else:
+                line += chunk
+
+        if line:
+            self.handleOutput(line.decode('utf-8', 'replace'))
+
+    def handleOutput(self, line):
+        self.output_tail.append(line)
+
+        frames = parseEncodedFrames(line)
+        if frames is not None:
+            self.frames_encoded = min(frames, self.total)
+            self.reportProgress()
+
+    def framesDone(self):
+        """
+        Returns the number of frames encoded so far. Falls back to the
+        number sent for encoders that print no frame counter.
+        """
+        if self.frames_encoded is not None:
+            return self.frames_encoded
+        return self.frames_sent
+
+    def reportProgress(self):
+        if self.progress is not None and not self.cancelled:
+            if self.progress(self.framesDone(), self.total) is False:
+                self.cancel()
+
+    def cancel(self):
+        """
+        Stops the render. Safe to call from any thread.
+        """
+        self.cancelled = True
+        process = self.process
+        if process is not None and process.poll() is None:
+            try:
+                process.terminate()
+            except OSError:
+                pass
+
+    def render(self, framepaths, output_path, progress=None, size=None):
+        """
+        Streams framepaths, image paths or StoredFrames, to the encoder in
+        order and returns output_path.
+        progress is called with (frames_done, total) from the streaming and
+        output reading threads as the encoder reports frames done, and may
+        return False to cancel. size (width, height) scales every frame
+        to it, so videos rendered apart can be joined. Raises RenderError
+        on failure.
+        """
+        if not framepaths:
+            raise RenderError("No frames to render")
+
+        self.progress = progress
+        self.total = len(framepaths)
+        self.frames_sent = 0
+        self.frames_encoded = None
+
+        stream_format = self.chooseStreamFormat(framepaths)
+
+        image_codec = None
+        if size is not None:
+            size = (int(size[0]), int(size[1]))
+        elif stream_format == 'raw':
+            first = self.readRaw(framepaths, None)
+            if first is None:
+                raise RenderError("No readable images to render")
+            size = (first.shape[1], first.shape[0])
+
+        if stream_format != 'raw':
+            image_codec = IMAGE_CODECS.get(os.path.splitext(
+                            framePath(framepaths[0]))[1].lower(), 'mjpeg')
+
+        command = self.buildCommand(
+                        output_path, stream_format, size, image_codec)
+        logging.debug("Calling: %s" % ' '.join(command))
+
+        try:
+            proc = subprocess.Popen(command, stdin=subprocess.PIPE,
+                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        except OSError as e:
+            raise RenderError("Could not start %s: %s" % (
+                                                    self.encoder_path, e))
+        self.process = proc
+
+        # cancelled before the encoder started
+        if self.cancelled:
+            self.cancel()
+
+        reader = threading.Thread(
+                    None, self.readOutput, 'videorender-output', (proc.stdout,))
+        reader.daemon = True
+        reader.start()
+
+        try:
+            for frame in framepaths:
+                if self.cancelled:
+                    break
+
+                if stream_format == 'raw':
+                    image = self.readRaw([frame], size)
+                    if image is None:
+                        continue
+                    proc.stdin.write(numpy.ascontiguousarray(image).tobytes())
+                else:
+                    proc.stdin.write(readFrame(frame))
+
+                self.frames_sent += 1
+                if self.frames_encoded is None:
+                    self.reportProgress()
+
+        except (IOError, OSError) as e:
+            # the encoder died - its output says why
+            logging.debug("Failed to stream frames: %s" % repr(e))
+
+        finally:
+            try:
+                proc.stdin.close()
+            except (IOError, OSError):
+                pass
+
+        returncode = proc.wait()
+        reader.join()
+        self.process = None
+
+        if self.cancelled:
+            self.removeOutput(output_path)
+            raise RenderError("Rendering cancelled")
+
+        if returncode != 0:
+            self.removeOutput(output_path)
+            raise RenderError("%s exited with code %s: %s" % (
+                    self.encoder, returncode, '\n'.join(self.output_tail)))
+
+        self.frames_encoded = self.total
+        self.reportProgress()
+        return output_path
+
+    def readRaw(self, framepaths, size):
+        """
+        Decodes the first readable image in framepaths, resized to size if
+        it does not match. Returns None if none can be read.
+        """
+        for frame in framepaths:
+            try:
+                data = readFrame(frame)
+            except (IOError, OSError) as e:
+                logging.debug("Skipping unreadable frame %s: %s" % (
+                                                    framePath(frame), repr(e)))
+                continue
+
+            image = cv2.imdecode(numpy.frombuffer(data, numpy.uint8),
+                                    cv2.IMREAD_COLOR)
+
+            # OpenCV cannot read gif
+            if image is None:
+                try:
+                    image = numpy.asarray(Image.open(
+                                io.BytesIO(data)).convert('RGB'))[:, :, ::-1]
+                except Exception as e:
+                    logging.debug("Skipping unreadable frame %s: %s" % (
+                                                    framePath(frame), repr(e)))
+                    continue
+
+            if size is not None and (image.shape[1], image.shape[0]) != size:
+                image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+            return image
+        return None
+
+    def removeOutput(self, output_path):
+        try:
+            os.remove(output_path)
+        except OSError:
+            pass
+
+
+class ChunkedRenderer(FrameStreamRenderer):
+    """
+    Renders contiguous ranges of the frames at the same time in separate
+    encoder processes, then joins them into one video without re-encoding.
+    Every range is scaled to the size of the first frame so the pieces
+    can be joined. Renders with fewer than min_chunk_frames frames per
+    range use fewer ranges.
+
+    Example:
+        renderer = ChunkedRenderer('ffmpeg', 'ffmpeg', 'mpeg4', 10, chunks=4)
+        renderer.render(framepaths, '/videos/timelapse.avi')
+    """
+
+    def __init__(self, encoder, encoder_path, codec, fps,
+                    stream_format='auto', chunks=2, min_chunk_frames=50):
+        FrameStreamRenderer.__init__(self, encoder, encoder_path, codec, fps,
+                                        stream_format)
+        self.chunks = max(1, int(chunks))
+        self.min_chunk_frames = max(1, int(min_chunk_frames))
+
+        self.renderers = []
+        self._lock = threading.Lock()
+
+    def chunkPath(self, output_path, chunk):
+        root, extension = os.path.splitext(output_path)
+        return '%s.part%02d%s' % (root, chunk, extension)
+
+    def framesDone(self):
+        return sum(renderer.framesDone() for renderer in self.renderers)
+
+    def cancel(self):
+        self.cancelled = True
+        for renderer in self.renderers:
+            renderer.cancel()
+
+    def render(self, framepaths, output_path, progress=None, size=None):
+        """
+        Renders framepaths into output_path in parallel, see
+        FrameStreamRenderer.render.
+        """
+        chunks = min(self.chunks, len(framepaths) // self.min_chunk_frames)
+        if chunks <= 1:
+            return FrameStreamRenderer.render(
+                            self, framepaths, output_path, progress, size)
+
+        if size is None:
+            first = self.readRaw(framepaths, None)
+            if first is None:
+                raise RenderError("No readable images to render")
+            size = (first.shape[1], first.shape[0])
+
+        self.progress = progress
+        self.total = len(framepaths)
+        self.renderers = [
+            FrameStreamRenderer(self.encoder, self.encoder_path, self.codec,
+                                    self.fps, self.stream_format)
+                for chunk in range(chunks)]
+
+        # a renderer cancelled before it was created misses cancel()
+        if self.cancelled:
+            self.cancel()
+
+        def chunkProgress(frames_done, total):
+            with self._lock:
+                self.reportProgress()
+            return not self.cancelled
+
+        parts = splitFrames(framepaths, chunks)
+        paths = [self.chunkPath(output_path, chunk)
+                    for chunk in range(chunks)]
+        errors = []
+
+        def renderChunk(renderer, part, path):
+            try:
+                renderer.render(part, path, chunkProgress, size)
+            except RenderError as e:
+                if not renderer.cancelled:
+                    errors.append(e)
+                    # no point finishing the rest
+                    for other in self.renderers:
+                        other.cancel()
+
+        threads = []
+        for renderer, part, path in zip(self.renderers, parts, paths):
+            thread = threading.Thread(None, renderChunk,
+                            'videorender-chunk', (renderer, part, path))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        try:
+            if errors:
+                raise errors[0]
+            if self.cancelled:
+                raise RenderError("Rendering cancelled")
+
+            logging.debug("Joining %d chunks into %s" % (chunks, output_path))
+            concatVideos(self.encoder, self.encoder_path, paths, output_path)
+
+        finally:
+            for path in paths:
+                self.removeOutput(path)
+
+        self.reportProgress()
+        return output_path
@@ -0,0 +1,389 @@
+"""
+WebcamSession
+
+Long lived OpenCV camera session for Chronolapse. The device is opened once
+and a background thread keeps reading from it so the most recent frame is
+always available without paying for a device open on every capture.
+
+With several cameras, grabSynchronized has every session's thread wait
+for the others and then grab() at the same moment, decoding with
+retrieve() only afterwards, so the frames line up in time.
+"""
+
+import logging
+import threading
+import time
+
+import cv2
+
+
+class GrabRequest(object):
+    """
+    A synchronized grab handed to a session's grab thread. Once done is
+    set, frame holds the image or None if the camera failed, grab_time
+    the time.time() grab() returned and latency the seconds from the
+    request to the decoded frame.
+    """
+
+    def __init__(self, barrier=None, timeout=5.0):
+        self.barrier = barrier
+        self.timeout = timeout
+        self.requested = time.monotonic()
+
+        self.frame = None
+        self.grab_time = None
+        self.latency = None
+        self.done = threading.Event()
+
+    def finish(self, frame, grab_time=None):
+        self.frame = frame
+        self.grab_time = grab_time
+        self.latency = time.monotonic() - self.requested
+        self.done.set()
+
+    def abort(self):
+        # let the other cameras stop waiting for this one
+        if self.barrier is not None:
+            self.barrier.abort()
+        self.finish(None)
+
+
+class WebcamSession(object):
+    """
+    Owns a single cv2.VideoCapture device and a grab thread that keeps
+    the newest frame in memory.
+
+    The grab thread owns the device - it opens it, reads continuously and
+    releases it when the session is closed or when no frame has been
+    requested for idle_timeout seconds. Requesting a frame from an idle
+    session transparently reopens the device.
+
+    Example:
+        session = WebcamSession(0, idle_timeout=30)
+        session.start()
+        image = session.getFrame()
+        session.close()
+    """
+
+    def __init__(self, device_number=0, resolution_x=0, resolution_y=0,
+                    idle_timeout=30, warmup_frames=2):
+        self.device_number = device_number
+        self.resolution_x = int(resolution_x or 0)
+        self.resolution_y = int(resolution_y or 0)
+        self.idle_timeout = float(idle_timeout or 0)
+        self.warmup_frames = warmup_frames
+
+        self._lock = threading.Lock()
+        self._frame_ready = threading.Event()
+        self._new_frame = threading.Condition(self._lock)
+        self._thread = None
+        self._running = False
+
+        self._frame = None
+        self._frame_time = None
+        self._last_request = time.monotonic()
+
+        # frames read since the session was created, see waitForFrame
+        self._frame_count = 0
+        self._frame_rate = None
+
+        # GrabRequests waiting for the grab thread
+        self._requests = []
+
+    def matches(self, device_number, resolution_x, resolution_y):
+        """
+        Returns True if this session was created with the given settings.
+        """
+        return (self.device_number == device_number
+                and self.resolution_x == int(resolution_x or 0)
+                and self.resolution_y == int(resolution_y or 0))
+
+    def isRunning(self):
+        with self._lock:
+            return self._running
+
+    def setIdleTimeout(self, idle_timeout):
+        with self._lock:
+            self.idle_timeout = float(idle_timeout or 0)
+
+    def start(self):
+        """
+        Starts the grab thread if it is not already running.
+        """
+        with self._lock:
+            if self._running:
+                return
+            previous_thread = self._thread
+
+        # let a thread that is shutting down release the device first
+        if previous_thread is not None:
+            previous_thread.join()
+
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._last_request = time.monotonic()
+            self._frame_ready.clear()
+
+            self._thread = threading.Thread(
+                None, self._grabLoop, 'webcamsession-%s' % self.device_number)
+            self._thread.daemon = True
+            thread = self._thread
+
+        thread.start()
+
+    def close(self):
+        """
+        Stops the grab thread and releases the device.
+        """
+        with self._lock:
+            self._running = False
+            thread = self._thread
+
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def getFrame(self, timeout=5.0, copy=False):
+        """
+        Returns the newest frame read from the camera or None if the camera
+        did not produce a frame within timeout seconds.
+
+        The returned array is shared with other callers unless copy is True,
+        so callers that draw on the frame should ask for a copy.
+        """
+        with self._lock:
+            self._last_request = time.monotonic()
+            running = self._running
+
+        if not running:
+            self.start()
+
+        if not self._frame_ready.wait(timeout):
+            logging.warning(
+                "Timed out waiting for camera %s" % self.device_number)
+            return None
+
+        with self._lock:
+            frame = self._frame
+
+        if frame is not None and copy:
+            frame = frame.copy()
+        return frame
+
+    def waitForFrame(self, after=0, timeout=5.0):
+        """
+        Waits for a frame newer than frame number after and returns
+        (frame, number). frame is None if none arrived within timeout
+        seconds or the camera stopped. Like getFrame, the frame is shared.
+
+        Example:
+            number = 0
+            while previewing:
+                frame, number = session.waitForFrame(number)
+        """
+        with self._lock:
+            self._last_request = time.monotonic()
+            running = self._running
+
+        if not running:
+            self.start()
+
+        deadline = time.monotonic() + timeout
+        with self._new_frame:
+            while self._frame_count <= after or self._frame is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._running:
+                    return None, self._frame_count
+                self._new_frame.wait(remaining)
+
+            self._last_request = time.monotonic()
+            return self._frame, self._frame_count
+
+    def requestGrab(self, barrier=None, timeout=5.0):
+        """
+        Asks the grab thread for a fresh frame and returns its GrabRequest.
+        If barrier is given the thread waits at it, for up to timeout
+        seconds, before grabbing.
+        """
+        request = GrabRequest(barrier, timeout)
+
+        with self._lock:
+            self._last_request = time.monotonic()
+            self._requests.append(request)
+
+        self.start()
+        return request
+
+    def getFrameRate(self):
+        """
+        Returns the rate the camera is delivering frames at, or None if it
+        is not running.
+        """
+        with self._lock:
+            if not self._running:
+                return None
+            return self._frame_rate
+
+    def getFrameTime(self):
+        """
+        Returns the time.time() at which the newest frame was read.
+        """
+        with self._lock:
+            return self._frame_time
+
+    def _openDevice(self):
+        cam = cv2.VideoCapture(self.device_number)
+
+        if self.resolution_x != 0:
+            cam.set(cv2.CAP_PROP_FRAME_WIDTH, self.resolution_x)
+        if self.resolution_y != 0:
+            cam.set(cv2.CAP_PROP_FRAME_HEIGHT, self.resolution_y)
+
+        # first reads from opencv cams seem unreliable
+        for i in range(self.warmup_frames):
+            cam.read()
+
+        return cam
+
+    def measureRate(self, interval):
+        # smoothed over roughly the last ten frames
+        rate = 1.0 / interval
+        if self._frame_rate is None:
+            self._frame_rate = rate
+        else:
+            self._frame_rate += (rate - self._frame_rate) * 0.1
+
+    def grabAligned(self, cam, request):
+        """
+        Grabs for a GrabRequest. Returns (result, image, grab_time).
+        """
+        if request.barrier is not None:
+            try:
+                request.barrier.wait(request.timeout)
+            except threading.BrokenBarrierError:
+                logging.warning("Camera %s grabbing without the other "
+                                "cameras" % self.device_number)
+
+        # grab only latches the frame - decoding waits until every camera
+        # has grabbed
+        result = cam.grab()
+        grab_time = time.time()
+
+        image = None
+        if result:
+            result, image = cam.retrieve()
+        return result, image, grab_time
+
+    def _grabLoop(self):
+        logging.debug("Opening camera %s" % self.device_number)
+        cam = self._openDevice()
+        request = None
+
+        try:
+            if not cam.isOpened():
+                logging.error(
+                    "Could not open camera %s" % self.device_number)
+                return
+
+            while True:
+                request = None
+                with self._lock:
+                    if self._requests:
+                        request = self._requests.pop(0)
+
+                if request is None:
+                    result, image = cam.read()
+                else:
+                    result, image, grab_time = self.grabAligned(cam, request)
+
+                    # before the loop can stop, so grabSynchronized never
+                    # waits for a grab that already happened
+                    request.finish(image if result else None, grab_time)
+
+                with self._lock:
+                    if result:
+                        now = time.time()
+                        if (self._frame_time is not None and
+                            now > self._frame_time):
+                            self.measureRate(now - self._frame_time)
+                        self._frame = image
+                        self._frame_time = now
+                        self._frame_count += 1
+                        self._new_frame.notify_all()
+
+                    if not self._running:
+                        break
+
+                    # release the device if nobody has asked for a frame
+                    idle_for = time.monotonic() - self._last_request
+                    if self.idle_timeout > 0 and idle_for > self.idle_timeout:
+                        logging.debug(
+                            "Camera %s idle for %.1fs - releasing" % (
+                                self.device_number, idle_for))
+                        self._running = False
+                        break
+
+                if result:
+                    self._frame_ready.set()
+                else:
+                    # avoid spinning on a device that stopped returning frames
+                    time.sleep(.01)
+
+        finally:
+            cam.release()
+            logging.debug("Released camera %s" % self.device_number)
+
+            with self._lock:
+                self._running = False
+                self._frame = None
+                self._frame_time = None
+                self._frame_rate = None
+                self._new_frame.notify_all()
+
+                requests = self._requests
+                self._requests = []
+
+            # a request popped just before an error
+            if request is not None and not request.done.is_set():
+                requests.append(request)
+
+            for request in requests:
+                request.abort()
+
+            # wake up anyone still waiting so they can fail fast
+            self._frame_ready.set()
+
+
+def resizeFrame(image, resolution_x=0, resolution_y=0):
+    """
+    Returns image scaled to resolution_x by resolution_y, or image itself
+    if either is 0 or it is already that size.
+    """
+    size = (int(resolution_x or 0), int(resolution_y or 0))
+    if image is None or not size[0] or not size[1]:
+        return image
+    if (image.shape[1], image.shape[0]) == size:
+        return image
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def grabSynchronized(sessions, timeout=5.0):
+    """
+    Grabs a frame from every session at the same moment and returns their
+    GrabRequests in order. Each session's thread waits at a shared
+    barrier, then calls grab(), so the frames are as close in time as
+    the cameras' own frame intervals allow. A camera that fails does not
+    hold up the others for more than timeout seconds.
+    """
+    barrier = None
+    if len(sessions) > 1:
+        barrier = threading.Barrier(len(sessions))
+
+    requests = [session.requestGrab(barrier, timeout)
+                    for session in sessions]
+
+    deadline = time.monotonic() + timeout
+    for request in requests:
+        request.done.wait(max(0, deadline - time.monotonic()))
+    return requests